@@ -0,0 +1,283 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from graph_store import CompactGraphStore
+from similarity_index import normalise_name
+
+COUNT_FEATURES = ['identities', 'references', 'events', 'cited_by', 'equivalence', 'cross_island_equivalence',
+                  'name_spread', 'dob_values', 'nationality_values']
+# Features the score is built from; counts of attached nodes are taken per identity so island size does not dominate
+SCORED_FEATURES = ['cross_island_equivalence', 'name_spread', 'dob_values', 'nationality_values',
+                   'references_per_identity', 'events_per_identity', 'cited_by_per_identity']
+
+# Kinds of edge target the features distinguish
+REFERENCE, EVENT, OTHER = 0, 1, 2
+
+_scoring_state = None
+
+
+def _init_scoring_worker(graph, islands, island_of, edge_types):
+    global _scoring_state
+    _scoring_state = (graph, islands, island_of, edge_types)
+
+
+def _score_chunk(island_indices):
+    return _island_features(*_scoring_state, island_indices)
+
+
+def _kind_codes(kinds):
+    kinds = np.asarray(kinds, dtype=object)
+    return np.where(kinds == 'Reference', REFERENCE, np.where(kinds == 'Event', EVENT, OTHER))
+
+
+def _graph_edges(G, islands, island_of, edge_types, island_indices):
+    # Flat arrays over the members of the given islands and their edges, in one pass over their adjacency
+    members = [member for island_index in island_indices for member in islands[island_index]]
+    sizes = [len(islands[island_index]) for island_index in island_indices]
+    # The raw adjacency dicts; the networkx views cost more than the lookups themselves
+    nodes, succ, pred = G._node, G._succ, G._pred
+    type_code = {edge_type: i for i, edge_type in enumerate(edge_types)}
+    out = [succ[member] for member in members]
+    targets = [target for adjacency in out for target in adjacency]
+    types = [attrs.get('type') for adjacency in out for attrs in adjacency.values()]
+    incoming = [[source for source, attrs in pred[member].items() if attrs.get('type') == 'IDENTITY_EQUIVALENCE'] for member in members]
+    attrs = [nodes[member] for member in members]
+    return {
+        'member_row': np.repeat(np.arange(len(sizes)), sizes),
+        'out_count': np.fromiter(map(len, out), dtype=np.int64, count=len(members)),
+        'edge_code': np.fromiter((type_code.get(edge_type, -1) for edge_type in types), dtype=np.int64, count=len(types)),
+        'equivalence': np.array([edge_type == 'IDENTITY_EQUIVALENCE' for edge_type in types], dtype=bool),
+        'cited_by': np.array([edge_type == 'CITED_BY' for edge_type in types], dtype=bool),
+        'target': pd.factorize(np.array(targets, dtype=object))[0] if targets else np.zeros(0, dtype=np.int64),
+        'target_kind': _kind_codes([nodes[target].get('type') for target in targets]),
+        'target_island': np.fromiter((island_of.get(target, -1) for target in targets), dtype=np.int64, count=len(targets)),
+        'in_count': np.fromiter(map(len, incoming), dtype=np.int64, count=len(members)),
+        'in_island': np.fromiter((island_of.get(source, -1) for sources in incoming for source in sources), dtype=np.int64),
+        'name': [member_attrs.get('name', '') for member_attrs in attrs],
+        'date_of_birth': [member_attrs.get('date_of_birth') for member_attrs in attrs],
+        'nationality': [member_attrs.get('nationality') for member_attrs in attrs],
+    }
+
+
+def _column(store, name, idx):
+    return store.column(name, idx) if name in store.columns else np.full(len(idx), None, dtype=object)
+
+
+def _store_edges(store, islands, island_label, edge_types, island_indices):
+    # The same arrays gathered from the store's CSR adjacency; island_label holds each node's island (-1 for none)
+    sizes = [len(islands[island_index]) for island_index in island_indices]
+    members = store.index_of([member for island_index in island_indices for member in islands[island_index]])
+    member_row = np.repeat(np.arange(len(sizes)), sizes)
+    starts, out_count = store.indptr[members], store.indptr[members + 1] - store.indptr[members]
+    edge = np.repeat(starts - np.cumsum(out_count) + out_count, out_count) + np.arange(out_count.sum())
+    targets = store.indices[edge].astype(np.int64)
+    names = np.array(['' if edge_type is None else edge_type for edge_type in store.edge_types], dtype=object)
+    type_map = np.array([edge_types.index(name) if name in edge_types else -1 for name in names.tolist()] or [-1], dtype=np.int64)
+    codes = store.edge_type_codes[edge].astype(np.int64)
+
+    # Equivalence edges into the members, found with one pass over all edge targets
+    row_of_node = np.full(store.num_nodes, -1, dtype=np.int64)
+    row_of_node[members] = np.arange(len(members))
+    equivalence_code = np.flatnonzero(names == 'IDENTITY_EQUIVALENCE')
+    into = np.flatnonzero(np.isin(store.edge_type_codes, equivalence_code) & (row_of_node[store.indices] >= 0))
+    into = into[np.argsort(row_of_node[store.indices[into]], kind='stable')]
+    in_sources = np.searchsorted(store.indptr, into, side='right') - 1
+    return {
+        'member_row': member_row,
+        'out_count': out_count,
+        'edge_code': type_map[codes],
+        'equivalence': names[codes] == 'IDENTITY_EQUIVALENCE',
+        'cited_by': names[codes] == 'CITED_BY',
+        'target': targets,
+        'target_kind': _kind_codes(_column(store, 'type', targets)),
+        'target_island': island_label[targets],
+        'in_count': np.bincount(row_of_node[store.indices[into]], minlength=len(members)),
+        'in_island': island_label[in_sources],
+        'name': ['' if name is None else name for name in _column(store, 'name', members).tolist()],
+        'date_of_birth': _column(store, 'date_of_birth', members).tolist(),
+        'nationality': _column(store, 'nationality', members).tolist(),
+    }
+
+
+def _distinct_per_row(rows, keys, num_rows):
+    # Number of distinct keys per row
+    if not len(rows):
+        return np.zeros(num_rows)
+    width = int(keys.max()) + 1
+    return np.bincount(np.unique(rows * width + keys) // width, minlength=num_rows)
+
+
+def _name_trigrams(names):
+    # (name index, trigram id) for every trigram of each name, padded and normalised as name_ngrams() does
+    padded = np.array([f' {normalise_name(name)} ' for name in names], dtype=str)
+    lengths = np.char.str_len(padded)
+    chars = padded.view(np.uint32).reshape(len(names), -1).astype(np.int64)
+    if chars.shape[1] < 3:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    codes = (chars[:, :-2] << 42) | (chars[:, 1:-1] << 21) | chars[:, 2:]
+    valid = np.arange(codes.shape[1]) < (lengths - 2)[:, None]
+    name_index = np.broadcast_to(np.arange(len(names))[:, None], codes.shape)[valid]
+    return name_index, np.unique(codes[valid], return_inverse=True)[1].ravel()
+
+
+def _name_spread(names, member_row, num_rows):
+    # How far the least similar identity is from the island's first (base) identity, by the trigram Jaccard
+    # similarity of name_ngrams(). One sort by (island, trigram, base first, member) puts repeated trigrams of a
+    # name next to each other and lets the base identity lead every trigram group it belongs to
+    similarity = np.ones(num_rows)
+    if not len(names):
+        return 1.0 - similarity
+    base = np.concatenate(([0], np.cumsum(np.bincount(member_row, minlength=num_rows))[:-1])).astype(np.int64)
+    member, gram = _name_trigrams(names)
+    row = member_row[member]
+    not_base = (member != base[row]).astype(np.int64)
+    key = np.sort(((row * (int(gram.max(initial=0)) + 1) + gram) * 2 + not_base) * len(names) + member)
+    member = key % len(names)
+    group = key // len(names)
+    distinct = np.ones(len(key), dtype=bool)
+    distinct[1:] = key[1:] != key[:-1]
+    member, group = member[distinct], group[distinct]
+    sizes = np.bincount(member, minlength=len(names))
+
+    gram_group = group // 2
+    starts = np.ones(len(group), dtype=bool)
+    starts[1:] = gram_group[1:] != gram_group[:-1]
+    group_has_base = (group[starts] % 2 == 0)[np.cumsum(starts) - 1]
+    shared = np.bincount(member[group_has_base & (group % 2 == 1)], minlength=len(names))
+
+    others = np.flatnonzero(np.arange(len(names)) != base[member_row])
+    union = sizes[base[member_row[others]]] + sizes[others] - shared[others]
+    np.minimum.at(similarity, member_row[others], shared[others] / np.maximum(union, 1))
+    return 1.0 - similarity
+
+
+def _island_features(graph, islands, island_of, edge_types, island_indices):
+    # One row per island: the fixed features, then a histogram of the types of edges leaving its identities.
+    # Members and their edges are gathered into flat arrays, and every count is a bincount over island rows
+    num_rows = len(island_indices)
+    if isinstance(graph, CompactGraphStore):
+        arrays = _store_edges(graph, islands, island_of, edge_types, island_indices)
+    else:
+        arrays = _graph_edges(graph, islands, island_of, edge_types, island_indices)
+    rows = np.zeros((num_rows, len(COUNT_FEATURES) + len(edge_types)))
+    island_ids = np.asarray(island_indices, dtype=np.int64)
+    member_row = arrays['member_row']
+    edge_row = np.repeat(member_row, arrays['out_count'])
+    in_row = np.repeat(member_row, arrays['in_count'])
+
+    known = arrays['edge_code'] >= 0
+    rows[:, len(COUNT_FEATURES):] = np.bincount(
+        edge_row[known] * len(edge_types) + arrays['edge_code'][known], minlength=num_rows * len(edge_types)
+    ).reshape(num_rows, len(edge_types))
+
+    kind, target = arrays['target_kind'], arrays['target']
+    references, events = kind == REFERENCE, kind == EVENT
+    equivalence = (kind == OTHER) & arrays['equivalence']
+    target_island = arrays['target_island']
+    cross_out = equivalence & (target_island >= 0) & (target_island != island_ids[edge_row])
+    cross_in = (arrays['in_island'] >= 0) & (arrays['in_island'] != island_ids[in_row])
+    rows[:, 0] = np.bincount(member_row, minlength=num_rows)
+    rows[:, 1] = _distinct_per_row(edge_row[references], target[references], num_rows)
+    rows[:, 2] = _distinct_per_row(edge_row[events], target[events], num_rows)
+    rows[:, 3] = np.bincount(edge_row[references & arrays['cited_by']], minlength=num_rows)
+    rows[:, 4] = np.bincount(edge_row[equivalence], minlength=num_rows)
+    rows[:, 5] = np.bincount(edge_row[cross_out], minlength=num_rows) + np.bincount(in_row[cross_in], minlength=num_rows)
+
+    rows[:, 6] = _name_spread(arrays['name'], member_row, num_rows)
+    for column, name in ((7, 'date_of_birth'), (8, 'nationality')):
+        codes = pd.factorize(np.array(arrays[name], dtype=object), use_na_sentinel=False)[0] if len(member_row) else member_row
+        rows[:, column] = _distinct_per_row(member_row, codes, num_rows)
+    return rows
+
+
+def robust_z_scores(values):
+    # (x - median) / (1.4826 * MAD) per column; columns with no spread fall back to the mean absolute deviation
+    median = np.median(values, axis=0)
+    deviation = np.abs(values - median)
+    scale = 1.4826 * np.median(deviation, axis=0)
+    fallback = 1.2533 * deviation.mean(axis=0)
+    scale = np.where(scale > 0, scale, np.where(fallback > 0, fallback, 1.0))
+    return (values - median) / scale
+
+
+class IslandAnomalyScorer:
+    def __init__(self, graph, islands, edge_types, workers=None, chunk_size=20000):
+        # graph is an nx.DiGraph or a CompactGraphStore; island_of maps island members to their island, as a dict
+        # for a DiGraph and as a per-node label array (-1 outside islands) for a store
+        self.graph = graph
+        self.islands = islands
+        self.edge_types = list(edge_types)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.columns = COUNT_FEATURES + [f'edges_{edge_type}' for edge_type in self.edge_types]
+        self.features = np.zeros((0, len(self.columns)))
+        self.island_of = self._empty_island_of()
+        self.scores = np.zeros(0)
+        self.last_rescored = 0
+
+    def _empty_island_of(self):
+        if isinstance(self.graph, CompactGraphStore):
+            return np.full(self.graph.num_nodes, -1, dtype=np.int64)
+        return {}
+
+    def _compute(self, island_indices):
+        chunks = [island_indices[start:start + self.chunk_size] for start in range(0, len(island_indices), self.chunk_size)]
+        if self.workers == 1 or len(chunks) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return np.vstack([_island_features(self.graph, self.islands, self.island_of, self.edge_types, chunk) for chunk in chunks]) \
+                if chunks else np.zeros((0, len(self.columns)))
+        # Forked workers inherit the graph instead of receiving a pickled copy of it
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_scoring_worker,
+                                 initargs=(self.graph, self.islands, self.island_of, self.edge_types)) as executor:
+            return np.vstack(list(executor.map(_score_chunk, chunks)))
+
+    def update(self, dirty_islands=()):
+        # Recomputes features for islands added since the last call plus the given dirty ones, then rescales every score
+        num_scored = len(self.features)
+        targets = sorted({i for i in dirty_islands if i < num_scored} | set(range(num_scored, len(self.islands))))
+        if isinstance(self.island_of, dict):
+            for island_index in targets:
+                for member in self.islands[island_index]:
+                    self.island_of[member] = island_index
+        elif targets:
+            members = self.graph.index_of([member for island_index in targets for member in self.islands[island_index]])
+            self.island_of[members] = np.repeat(targets, [len(self.islands[island_index]) for island_index in targets])
+
+        if len(self.islands) > num_scored:
+            grown = np.zeros((len(self.islands), len(self.columns)))
+            grown[:num_scored] = self.features
+            self.features = grown
+        if targets:
+            self.features[targets] = self._compute(targets)
+        self.last_rescored = len(targets)
+        self.scores = self._score()
+        return self.scores
+
+    def score(self):
+        # Full recomputation of every island
+        self.features = np.zeros((0, len(self.columns)))
+        self.island_of = self._empty_island_of()
+        return self.update()
+
+    def _scored_matrix(self):
+        frame = self.frame(with_scores=False)
+        identities = np.maximum(frame['identities'].to_numpy(), 1)
+        for name in ('references', 'events', 'cited_by'):
+            frame[f'{name}_per_identity'] = frame[name].to_numpy() / identities
+        return frame[SCORED_FEATURES].to_numpy()
+
+    def _score(self):
+        if not len(self.features):
+            return np.zeros(0)
+        # Only unusually high values count as anomalous
+        return np.clip(robust_z_scores(self._scored_matrix()), 0, None).sum(axis=1)
+
+    def frame(self, with_scores=True):
+        frame = pd.DataFrame(self.features, columns=self.columns)
+        if with_scores:
+            frame['score'] = self.scores
+        return frame
+
+    def top(self, k=20):
+        return self.frame().nlargest(k, 'score')
@@ -0,0 +1,373 @@
+import argparse
+import contextlib
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from faker import Faker
+from generate_data import IdentityIslandGenerator
+from nquads_loader import NQuadsLoader
+
+SIZE_PRESETS = {'small': [1000], 'medium': [1000, 100000], 'large': [1000, 100000, 1000000]}
+ANOMALY_RATES = [1, 5, 10, 50]
+STAGES = ['generate', 'generate_legacy', 'anomalies', 'anomalies_legacy', 'find_similar', 'export', 'parse', 'parse_store', 'figure']
+# N-Quads parsing stages and the NQuadsLoader method each one times
+PARSE_METHODS = {'parse': 'load', 'parse_store': 'load_store'}
+# Islands generated once, untimed, on the shared pools before the first timed stage
+WARMUP_ISLANDS = 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _current_rss():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # No procfs: the lifetime peak is the closest figure available (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    # Peak resident set size of this process while the block runs, sampled from a background thread
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, _current_rss())
+
+    def __enter__(self):
+        self.peak = _current_rss()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+
+def measure(stage, fn, islands, rate=None, unit='islands', quiet=False):
+    # fn returns the number of items processed; throughput is items per second of wall time. quiet discards what
+    # fn prints (the original per-anomaly messages), which would otherwise flood the report
+    gc.collect()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout), RssSampler() as sampler:
+        started = time.perf_counter()
+        items = fn()
+        wall_time = time.perf_counter() - started
+    return {
+        'stage': stage, 'islands': islands, 'rate': rate, 'wall_time_s': wall_time,
+        'peak_rss_mb': sampler.peak / 2 ** 20, 'items': items, 'unit': unit,
+        'throughput': items / wall_time if wall_time > 0 else 0.0,
+    }
+
+
+def _forked_entry(connection, fn):
+    try:
+        connection.send(('ok', fn()))
+    except BaseException as error:
+        connection.send(('error', f'{type(error).__name__}: {error}'))
+    finally:
+        connection.close()
+
+
+def run_forked(fn):
+    # Runs a benchmark in a forked copy of this process: it starts from the parent's graph without changing it,
+    # and its peak RSS covers only its own allocations on top of what it inherited
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return fn()
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_forked_entry, args=(sender, fn))
+    process.start()
+    sender.close()
+    try:
+        status, result = receiver.recv()
+    except EOFError:
+        status, result = 'error', 'benchmark process exited without a result'
+    process.join()
+    if status == 'error':
+        raise RuntimeError(result)
+    return result
+
+
+def seed_everything(seed):
+    # The legacy code paths draw from the global random module, NumPy and Faker
+    random.seed(seed)
+    np.random.seed(seed)
+    Faker.seed(seed)
+
+
+class BenchmarkSuite:
+    def __init__(self, sizes=(1000,), rates=(1, 10, 50), stages=STAGES, seed=0, workers=None, legacy_max_islands=2000,
+                 similar_samples=2000, repeat=3):
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown benchmark stages: {sorted(unknown)}")
+        self.sizes = list(sizes)
+        self.rates = list(rates)
+        self.stages = [stage for stage in STAGES if stage in stages]
+        self.seed = seed
+        self.workers = workers
+        # The original per-island code paths are quadratic or worse, so they run on at most this many islands
+        self.legacy_max_islands = legacy_max_islands
+        self.similar_samples = similar_samples
+        self.repeat = repeat
+        self.results = []
+        self._pools = None
+
+    def _record(self, result):
+        self.results.append(result)
+        rate = '' if result['rate'] is None else f" rate={result['rate']}%"
+        input_rate = f" {result['input_mb_per_s']:9.1f} MB/s in" if 'input_mb_per_s' in result else ''
+        print(f"{result['stage']:<17} islands={result['islands']:<8}{rate:<10} {result['wall_time_s']:9.3f}s "
+              f"{result['peak_rss_mb']:9.1f} MB {result['throughput']:14.1f} {result['unit']}/s{input_rate}", flush=True)
+
+    def _best_of(self, fn):
+        # Forked stages run repeat times from the same starting state; the fastest run is kept, the usual way to
+        # take scheduler noise out of wall times. The spread between runs is kept as this stage's noise floor
+        runs = [run_forked(fn) for _ in range(self.repeat)]
+        best = min(runs, key=lambda result: result['wall_time_s'])
+        best['repeats'] = len(runs)
+        best['spread_s'] = max(result['wall_time_s'] for result in runs) - best['wall_time_s']
+        return best
+
+    def _warm_up(self):
+        # Builds the identity pools (every locale's Faker names, the date tables) once for the seed and runs a small
+        # untimed generation on them, so every forked repeat inherits warm pools and imports and no timed run pays for them
+        if self._pools is None:
+            generator = IdentityIslandGenerator()
+            self._pools = generator._get_pools(self.seed)
+            self._pools.build_all()
+            self._generated(WARMUP_ISLANDS)
+            gc.collect()
+
+    def _generator(self):
+        # A fresh graph on the shared warm pools
+        generator = IdentityIslandGenerator()
+        generator.pools = self._pools
+        return generator
+
+    def _generated(self, num_islands, generator=None):
+        generator = generator or self._generator()
+        generator.generate_identity_islands_parallel(num_islands, seed=self.seed, workers=self.workers)
+        return generator
+
+    def _generate(self, num_islands):
+        generator = self._generator()
+
+        def generate():
+            self._generated(num_islands, generator)
+            return num_islands
+        return measure('generate', generate, num_islands)
+
+    def _generate_legacy(self, num_islands):
+        seed_everything(self.seed)
+        generator = IdentityIslandGenerator()
+
+        def generate():
+            generator.generate_identity_islands(num_islands)
+            return num_islands
+        return measure('generate_legacy', generate, num_islands, quiet=True)
+
+    def _anomalies(self, generator, num_islands, rate):
+        def inject():
+            generator.add_anomalies_batched(rate, seed=self.seed)
+            return len(generator.anomaly_labels)
+        return measure('anomalies', inject, num_islands, rate, unit='anomalies')
+
+    def _anomalies_legacy(self, num_islands, rate):
+        generator = self._generated(num_islands)
+        seed_everything(self.seed)
+
+        def inject():
+            generator.add_anomalies(rate)
+            return int(len(generator.identity_islands) * rate / 100)
+        return measure('anomalies_legacy', inject, num_islands, rate, unit='anomalies', quiet=True)
+
+    def _find_similar(self, generator, num_islands):
+        # find_similar_identity against the members of sampled islands, as add_anomalies uses it
+        rng = np.random.default_rng(self.seed)
+        sample = rng.choice(len(generator.identity_islands), size=min(self.similar_samples, len(generator.identity_islands)), replace=False)
+        tasks = []
+        for island_index in sample.tolist():
+            island = [generator.G.nodes[member] for member in generator.identity_islands[island_index]]
+            tasks.append((island, island[int(rng.integers(len(island)))]))
+
+        def search():
+            comparisons = 0
+            for island, target in tasks:
+                for attribute in ('name', 'date_of_birth', 'nationality'):
+                    generator.find_similar_identity(island, target, attribute)
+                comparisons += 3 * len(island)
+            return comparisons
+        return measure('find_similar', search, num_islands, unit='comparisons')
+
+    def _parse(self, stage, export_dir, num_islands, triples, input_bytes):
+        # Triples per second, and megabytes of export read per second as the loader's input throughput
+        loader = NQuadsLoader(workers=self.workers)
+
+        def parse():
+            getattr(loader, PARSE_METHODS[stage])(export_dir)
+            return triples
+        result = measure(stage, parse, num_islands, unit='triples')
+        result['input_mb'] = input_bytes / 2 ** 20
+        result['input_mb_per_s'] = result['input_mb'] / result['wall_time_s'] if result['wall_time_s'] > 0 else 0.0
+        return result
+
+    def _figure(self, export_dir, num_islands):
+        from visualisation_identity_island import IdentityIslandsApp
+        app = IdentityIslandsApp(export_dir, loader_workers=self.workers, layout_workers=self.workers, cache_dir=None,
+                                 background=False)
+        # Parsing and layout happen while the app loads; only the full-detail figure is timed
+
+        def build():
+            app.create_figure()
+            return app.num_nodes
+        return measure('figure', build, num_islands, unit='nodes')
+
+    def run_size(self, num_islands):
+        self._warm_up()
+        generator = None
+        if 'generate' in self.stages:
+            self._record(self._best_of(lambda: self._generate(num_islands)))
+        if set(self.stages) - {'generate', 'generate_legacy', 'anomalies_legacy'}:
+            # The later stages start from one more generation in the parent, which is not timed
+            generator = self._generated(num_islands)
+
+        legacy_islands = min(num_islands, self.legacy_max_islands)
+        if 'generate_legacy' in self.stages:
+            self._record(self._best_of(lambda: self._generate_legacy(legacy_islands)))
+        for rate in self.rates:
+            if 'anomalies' in self.stages:
+                self._record(self._best_of(lambda: self._anomalies(generator, num_islands, rate)))
+            if 'anomalies_legacy' in self.stages:
+                self._record(self._best_of(lambda: self._anomalies_legacy(legacy_islands, rate)))
+        if 'find_similar' in self.stages:
+            self._record(self._best_of(lambda: self._find_similar(generator, num_islands)))
+
+        if generator is not None and {'export', 'figure', *PARSE_METHODS} & set(self.stages):
+            with tempfile.TemporaryDirectory(prefix='benchmark-') as tmp_dir:
+                export_dir = os.path.join(tmp_dir, 'export')
+                summary = {}
+
+                def export():
+                    summary.update(generator.export_bulk(export_dir, compress=False, workers=self.workers))
+                    return summary['triples']
+                result = measure('export', export, num_islands, unit='triples')
+                if 'export' in self.stages:
+                    self._record(result)
+                # The parent's graph is not needed past this point, so the forked stages start without it
+                generator = None
+                gc.collect()
+                input_bytes = sum(os.path.getsize(os.path.join(export_dir, part)) for part in summary['parts'])
+                for stage in PARSE_METHODS:
+                    if stage in self.stages:
+                        self._record(self._best_of(lambda: self._parse(stage, export_dir, num_islands, summary['triples'], input_bytes)))
+                if 'figure' in self.stages:
+                    self._record(self._best_of(lambda: self._figure(export_dir, num_islands)))
+        gc.collect()
+
+    def run(self):
+        for num_islands in self.sizes:
+            self.run_size(num_islands)
+        return self.results
+
+    def metadata(self):
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'seed': self.seed, 'workers': self.workers, 'sizes': self.sizes, 'rates': self.rates,
+            'legacy_max_islands': self.legacy_max_islands, 'similar_samples': self.similar_samples, 'repeat': self.repeat,
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'meta': self.metadata(), 'results': self.results}, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+
+def result_key(result):
+    return (result['stage'], result['islands'], result['rate'])
+
+
+def compare(results, baseline, threshold=0.2, min_delta_s=0.05):
+    # Pairs each result with the baseline run of the same stage, size and rate; slower or larger by more than
+    # threshold (a fraction) is a regression. A slowdown must also exceed the noise floor: min_delta_s seconds, or
+    # the spread between repeats of either run when that is wider
+    previous = {result_key(result): result for result in baseline['results']}
+    rows = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        time_ratio = result['wall_time_s'] / before['wall_time_s'] if before['wall_time_s'] > 0 else 1.0
+        rss_ratio = result['peak_rss_mb'] / before['peak_rss_mb'] if before['peak_rss_mb'] > 0 else 1.0
+        noise_floor = max(min_delta_s, result.get('spread_s', 0.0), before.get('spread_s', 0.0))
+        regressions = []
+        if time_ratio > 1 + threshold and result['wall_time_s'] - before['wall_time_s'] > noise_floor:
+            regressions.append('time')
+        if rss_ratio > 1 + threshold:
+            regressions.append('rss')
+        rows.append({'stage': result['stage'], 'islands': result['islands'], 'rate': result['rate'],
+                     'time_ratio': time_ratio, 'rss_ratio': rss_ratio, 'regressions': regressions})
+    return rows
+
+
+def print_comparison(rows, threshold):
+    print(f"\nAgainst baseline (regression threshold {threshold:.0%}):")
+    for row in rows:
+        rate = '' if row['rate'] is None else f" rate={row['rate']}%"
+        flag = f"  REGRESSION ({', '.join(row['regressions'])})" if row['regressions'] else ''
+        print(f"{row['stage']:<17} islands={row['islands']:<8}{rate:<10} time x{row['time_ratio']:.2f}  rss x{row['rss_ratio']:.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark generation, anomaly injection, N-Quads parsing and figure building.')
+    parser.add_argument('--preset', choices=sorted(SIZE_PRESETS), default='small', help='island counts to run')
+    parser.add_argument('--sizes', type=int, nargs='+', help='island counts, overriding --preset')
+    parser.add_argument('--rates', type=int, nargs='+', default=ANOMALY_RATES, help='anomaly percentages')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--legacy-max-islands', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per forked stage; the fastest is kept')
+    parser.add_argument('--output', default='./data/benchmarks/latest.json')
+    parser.add_argument('--baseline', default='./data/benchmarks/baseline.json')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown or memory growth, as a fraction')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='smallest slowdown in seconds counted as a regression')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(sizes=args.sizes or SIZE_PRESETS[args.preset], rates=args.rates, stages=args.stages,
+                           seed=args.seed, workers=args.workers, legacy_max_islands=args.legacy_max_islands, repeat=args.repeat)
+    suite.run()
+    suite.save(args.output)
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        suite.save(args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline, 'r') as f:
+        rows = compare(suite.results, json.load(f), args.threshold, args.min_delta)
+    print_comparison(rows, args.threshold)
+    return 1 if any(row['regressions'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
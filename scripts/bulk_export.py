@@ -0,0 +1,189 @@
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from nquads import BASE_URI, node_to_nquads, edge_to_nquad
+
+EXPORT_FORMATS = ('nquads', 'csv')
+# Nodes formatted per write; part sizes are checked between blocks
+BLOCK_SIZE = 10000
+
+_export_state = None
+
+
+def _init_export_worker(exporter, G, node_ids):
+    global _export_state
+    _export_state = (exporter, G, node_ids)
+
+
+def _export_task(task):
+    exporter, G, node_ids = _export_state
+    return exporter.write_range(G, node_ids, *task)
+
+
+def _csv_type(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return 'Int'
+    return 'String'
+
+
+def vertex_columns(G):
+    # Property columns for the vertex CSV header, in first-seen order; 'type' becomes ~label and an 'id' equal to
+    # the node ID is already ~id. Every value is checked, so a column is Int only if no node holds anything else
+    columns = {}
+    for node_id, attrs in G.nodes(data=True):
+        for key, value in attrs.items():
+            if key == 'type' or (key == 'id' and value == node_id) or columns.get(key) == 'String':
+                continue
+            for item in value if isinstance(value, list) else (value,):
+                if _csv_type(item) == 'String':
+                    columns[key] = 'String'
+                    break
+            else:
+                columns.setdefault(key, 'Int')
+    return list(columns.items())
+
+
+class _PartWriter:
+    # Text output split into parts of about max_part_bytes (compressed size when gzipped); each part is written
+    # under a temporary name and renamed when closed
+    def __init__(self, exporter, prefix, task_index, extension, header=None):
+        self.exporter = exporter
+        self.prefix = prefix
+        self.task_index = task_index
+        self.extension = extension + ('.gz' if exporter.compress else '')
+        self.header = header
+        self.raw = None
+        self.file = None
+        self.path = None
+        self.paths = []
+
+    def _open(self):
+        self.path = os.path.join(self.exporter.output_dir, f'{self.prefix}-{self.task_index:05d}-{len(self.paths):03d}{self.extension}')
+        self.raw = open(self.path + '.tmp', 'wb')
+        stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=self.exporter.compresslevel) if self.exporter.compress else self.raw
+        self.file = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        if self.header:
+            self.file.write(self.header)
+
+    def write(self, text):
+        if not text:
+            return
+        if self.file is None:
+            self._open()
+        self.file.write(text)
+        if self.raw.tell() >= self.exporter.max_part_bytes:
+            self.close()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.raw.close()
+        os.replace(self.path + '.tmp', self.path)
+        self.paths.append(os.path.basename(self.path))
+        self.file = self.raw = None
+
+
+class BulkExporter:
+    def __init__(self, output_dir, fmt='nquads', compress=True, max_part_bytes=256 * 1024 * 1024, nodes_per_task=200000,
+                 workers=None, base_uri=BASE_URI, compresslevel=1):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compress = compress
+        self.max_part_bytes = max_part_bytes
+        self.nodes_per_task = nodes_per_task
+        self.workers = workers
+        self.base_uri = base_uri
+        self.compresslevel = compresslevel
+        self.columns = None
+
+    def _csv_text(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue()
+
+    def _csv_value(self, value):
+        # Multi-valued properties use Neptune's ';' separator
+        if isinstance(value, list):
+            return ';'.join(str(v).replace(';', '\\;') for v in value)
+        return '' if value is None else value
+
+    def _nquads_block(self, G, block, counts):
+        lines = []
+        for node_id in block:
+            triples = node_to_nquads(node_id, G.nodes[node_id], self.base_uri)
+            lines.extend(triples)
+            for target, attrs in G.succ[node_id].items():
+                lines.append(edge_to_nquad(node_id, target, attrs.get('type'), self.base_uri))
+                counts['edges'] += 1
+            counts['triples'] += len(triples) + len(G.succ[node_id])
+        return ''.join(lines)
+
+    def _csv_blocks(self, G, block, task_index, counts):
+        vertices = []
+        edges = []
+        for node_id in block:
+            attrs = G.nodes[node_id]
+            label = attrs.get('type', 'Node')
+            vertices.append([node_id, ';'.join(label) if isinstance(label, list) else label] +
+                            [self._csv_value(attrs.get(key)) for key, _ in self.columns])
+            for target, edge_attrs in G.succ[node_id].items():
+                edges.append([f'e{task_index}-{counts["edges"]}', node_id, target, edge_attrs.get('type')])
+                counts['edges'] += 1
+        return self._csv_text(vertices), self._csv_text(edges)
+
+    def write_range(self, G, node_ids, task_index, start, end):
+        # One task: the nodes in [start, end) of node_ids and their outgoing edges, written to this task's own parts
+        counts = {'nodes': end - start, 'edges': 0, 'triples': 0}
+        if self.fmt == 'nquads':
+            writers = [_PartWriter(self, 'part', task_index, '.nq')]
+        else:
+            vertex_header = self._csv_text([['~id', '~label'] + [f'{key}:{kind}' for key, kind in self.columns]])
+            writers = [_PartWriter(self, 'vertices', task_index, '.csv', vertex_header),
+                       _PartWriter(self, 'edges', task_index, '.csv', self._csv_text([['~id', '~from', '~to', '~label']]))]
+        try:
+            for block_start in range(start, end, BLOCK_SIZE):
+                block = node_ids[block_start:min(block_start + BLOCK_SIZE, end)]
+                if self.fmt == 'nquads':
+                    writers[0].write(self._nquads_block(G, block, counts))
+                else:
+                    for writer, text in zip(writers, self._csv_blocks(G, block, task_index, counts)):
+                        writer.write(text)
+        finally:
+            for writer in writers:
+                writer.close()
+        if self.fmt == 'csv':
+            del counts['triples']
+        return [path for writer in writers for path in writer.paths], counts
+
+    def export(self, G):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.fmt == 'csv':
+            self.columns = vertex_columns(G)
+        node_ids = list(G)
+        tasks = [(task_index, start, min(start + self.nodes_per_task, len(node_ids)))
+                 for task_index, start in enumerate(range(0, len(node_ids), self.nodes_per_task))]
+
+        if self.workers == 1 or len(tasks) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            results = [self.write_range(G, node_ids, *task) for task in tasks]
+        else:
+            # Forked writers inherit the graph; each formats, compresses and writes its own part files
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_export_worker,
+                                     initargs=(self, G, node_ids)) as executor:
+                results = list(executor.map(_export_task, tasks))
+
+        summary = {'format': self.fmt, 'base_uri': self.base_uri, 'compress': self.compress, 'parts': []}
+        for paths, counts in results:
+            summary['parts'].extend(paths)
+            for key, value in counts.items():
+                summary[key] = summary.get(key, 0) + value
+        with open(os.path.join(self.output_dir, 'export.json'), 'w') as f:
+            json.dump(summary, f, indent=1)
+        return summary
@@ -0,0 +1,425 @@
+import asyncio
+import bisect
+import csv
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import ssl
+import time
+from urllib.parse import urlsplit
+import numpy as np
+import networkx as nx
+from nquads import BASE_URI, node_to_nquads, edge_to_nquad
+
+PROTOCOLS = ('sparql', 'gremlin')
+# Statuses worth retrying: throttling, overload and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Message of the fail() step an edge step runs into when one of its vertices does not exist; never worth a retry
+MISSING_VERTEX = 'missing vertex'
+
+
+def _part_paths(path, extensions):
+    # A single file, or the part files of a bulk export directory in name order
+    if not os.path.isdir(path):
+        return [path]
+    return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(extensions)]
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def graph_statements(G, base_uri=BASE_URI):
+    # One phase of N-Quads statements: each node's literals, then its outgoing edges
+    def statements():
+        for node_id, attrs in G.nodes(data=True):
+            yield from node_to_nquads(node_id, attrs, base_uri)
+            for target, edge_type in G.succ[node_id].items():
+                yield edge_to_nquad(node_id, target, edge_type.get('type'), base_uri)
+    return [statements()]
+
+
+def nquads_statements(path):
+    def statements():
+        for part_path in _part_paths(path, ('.nq', '.nq.gz')):
+            with _open_text(part_path) as f:
+                for line in f:
+                    if line.strip():
+                        yield line if line.endswith('\n') else line + '\n'
+    return [statements()]
+
+
+def gremlin_literal(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    text = str(value).replace('\\', '\\\\').replace("'", "\\'").replace('\n', '\\n').replace('\r', '\\r')
+    return f"'{text}'"
+
+
+def vertex_step(node_id, label, properties):
+    step = f".addV({gremlin_literal(label)}).property(id,{gremlin_literal(node_id)})"
+    for key, value in properties:
+        step += f".property({gremlin_literal(key)},{gremlin_literal(value)})"
+    return step
+
+
+def _existing_vertex(node_id):
+    # V(id) on an unknown id yields nothing, and every later step of the chained traversal would be dropped without
+    # an error; fold/coalesce turns that into a fail() the endpoint reports
+    return f"V({gremlin_literal(node_id)}).fold().coalesce(__.unfold(),__.fail({gremlin_literal(f'{MISSING_VERTEX} {node_id}')}))"
+
+
+def edge_step(source, target, label):
+    return f".{_existing_vertex(source)}.addE({gremlin_literal(label)}).to(__.{_existing_vertex(target)})"
+
+
+def graph_traversal_steps(G):
+    # Two phases, since an edge step needs both of its vertices to exist
+    def vertices():
+        for node_id, attrs in G.nodes(data=True):
+            properties = [(key, v) for key, value in attrs.items() if key != 'type' and not (key == 'id' and value == node_id)
+                          for v in (value if isinstance(value, list) else [value])]
+            yield vertex_step(node_id, attrs.get('type', 'Node'), properties)
+
+    def edges():
+        for source, target, edge_type in G.edges(data='type'):
+            yield edge_step(source, target, edge_type)
+    return [vertices(), edges()]
+
+
+def csv_traversal_steps(path):
+    # Vertex and edge files of a CSV bulk export; typed columns are 'name:Type' and multiple values are ';'-separated
+    def rows(prefix):
+        for part_path in _part_paths(path, ('.csv', '.csv.gz')):
+            if os.path.basename(part_path).startswith(prefix):
+                with _open_text(part_path) as f:
+                    yield from csv.DictReader(f)
+
+    def vertices():
+        for row in rows('vertices'):
+            properties = []
+            for column, value in row.items():
+                if column.startswith('~') or value == '':
+                    continue
+                key, _, kind = column.partition(':')
+                for v in re.split(r'(?<!\\);', value):
+                    v = v.replace('\\;', ';')
+                    properties.append((key, int(v) if kind == 'Int' else v))
+            yield vertex_step(row['~id'], row['~label'], properties)
+
+    def edges():
+        for row in rows('edges'):
+            yield edge_step(row['~from'], row['~to'], row['~label'])
+    return [vertices(), edges()]
+
+
+class CompletedRanges:
+    # Sorted, merged [start, end) ranges of statement indices that the endpoint has accepted
+    def __init__(self, ranges=()):
+        self.starts = []
+        self.ends = []
+        for start, end in ranges:
+            self.add(start, end)
+
+    def add(self, start, end):
+        i = bisect.bisect_left(self.ends, start)
+        j = bisect.bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def contains(self, index):
+        i = bisect.bisect_right(self.starts, index) - 1
+        return i >= 0 and index < self.ends[i]
+
+    def total(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def to_list(self):
+        return [[start, end] for start, end in zip(self.starts, self.ends)]
+
+
+class HttpConnection:
+    # One keep-alive HTTP/1.1 connection; reconnects lazily after the server closes it or an error
+    def __init__(self, url, timeout=60.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def _read_body(self, headers):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    await self.reader.readline()
+                    return b''.join(chunks)
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+        if 'content-length' in headers:
+            return await self.reader.readexactly(int(headers['content-length']))
+        headers['connection'] = 'close'
+        return await self.reader.read()
+
+    async def _request(self, body, content_type):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        self.writer.write((
+            f'POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the endpoint')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        response = await self._read_body(headers)
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response
+
+    async def post(self, body, content_type):
+        try:
+            return await asyncio.wait_for(self._request(body, content_type), self.timeout)
+        except BaseException:
+            # A request that failed part-way leaves the stream out of sync, so it is never reused
+            await self.close()
+            raise
+
+
+class BulkLoader:
+    def __init__(self, endpoint, protocol='sparql', concurrency=8, batch_size=1000, min_batch_size=50, max_batch_size=50000,
+                 target_latency=1.0, max_retries=5, backoff=0.5, timeout=60.0, checkpoint_path=None, base_uri=BASE_URI):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unsupported load protocol: {protocol}")
+        self.endpoint = endpoint
+        self.protocol = protocol
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.checkpoint_path = checkpoint_path
+        self.base_uri = base_uri
+
+    def phases(self, source):
+        # Statements to send, grouped in phases that must complete in order
+        if isinstance(source, nx.DiGraph):
+            return graph_statements(source, self.base_uri) if self.protocol == 'sparql' else graph_traversal_steps(source)
+        if self.protocol == 'sparql':
+            return nquads_statements(source)
+        return csv_traversal_steps(source)
+
+    def request_body(self, statements):
+        if self.protocol == 'sparql':
+            return ('INSERT DATA {\n' + ''.join(statements) + '}').encode('utf-8'), 'application/sparql-update'
+        return json.dumps({'gremlin': 'g' + ''.join(statements)}).encode('utf-8'), 'application/json'
+
+    def _fingerprint(self, source):
+        # What the checkpoint's statement indices refer to. A graph is hashed statement by statement in send order, so
+        # two graphs of the same size never share a checkpoint; files by the export manifest and each part's size and mtime
+        digest = hashlib.blake2b(digest_size=16)
+        if isinstance(source, nx.DiGraph):
+            for phase in self.phases(source):
+                for statement in phase:
+                    digest.update(statement.encode('utf-8'))
+                digest.update(b'\0')
+            return digest.hexdigest()
+        for path in _part_paths(source, ('.nq', '.nq.gz', '.csv', '.csv.gz')):
+            stat = os.stat(path)
+            digest.update(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode('utf-8'))
+        manifest_path = os.path.join(source, 'export.json')
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def _run_key(self, source):
+        name = 'graph' if isinstance(source, nx.DiGraph) else os.path.abspath(source)
+        return {'source': name, 'fingerprint': self._fingerprint(source), 'protocol': self.protocol, 'endpoint': self.endpoint}
+
+    def _load_checkpoint(self, run):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return CompletedRanges()
+        with open(self.checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint['run'] != run:
+            raise ValueError(f"{self.checkpoint_path} belongs to a different load: {checkpoint['run']}")
+        return CompletedRanges(checkpoint['completed'])
+
+    def _save_checkpoint(self, run, completed):
+        if not self.checkpoint_path:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path) or '.', exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'run': run, 'completed': completed.to_list()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _adapt(self, latency, failed=False):
+        # Grow while requests come back well inside the target latency, shrink fast when they do not
+        if failed or latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif latency < self.target_latency / 2:
+            self.batch_size = min(self.max_batch_size, int(self.batch_size * 1.25) + 1)
+
+    async def _send(self, connection, statements, stats):
+        body, content_type = self.request_body(statements)
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                status, response = await connection.post(body, content_type)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+                status, response = None, str(error).encode('utf-8')
+            latency = time.perf_counter() - started
+            stats['requests'] += 1
+            if status is not None and 200 <= status < 300:
+                stats['latencies'].append(latency)
+                stats['bytes'] += len(body)
+                self._adapt(latency)
+                return
+            if status == 413 and len(statements) > 1:
+                # Too large for the endpoint: cap later batches below this size and send it in halves
+                self.max_batch_size = max(self.min_batch_size, len(statements) // 2)
+                self.batch_size = min(self.batch_size, self.max_batch_size)
+                middle = len(statements) // 2
+                await self._send(connection, statements[:middle], stats)
+                await self._send(connection, statements[middle:], stats)
+                return
+            if status is not None and (status not in RETRY_STATUSES or MISSING_VERTEX.encode('utf-8') in response):
+                raise RuntimeError(f"Endpoint rejected a batch of {len(statements)} statements with HTTP {status}: "
+                                   f"{response[:500].decode('utf-8', 'replace')}")
+            self._adapt(latency, failed=True)
+            if attempt < self.max_retries:
+                stats['retries'] += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+        raise RuntimeError(f"Batch of {len(statements)} statements failed after {self.max_retries} retries: "
+                           f"{'HTTP ' + str(status) if status else response.decode('utf-8', 'replace')}")
+
+    async def _worker(self, queue, completed, stats, save):
+        connection = HttpConnection(self.endpoint, self.timeout)
+        try:
+            while True:
+                batch = await queue.get()
+                try:
+                    if batch is None:
+                        return
+                    first_index, last_index, statements = batch
+                    await self._send(connection, statements, stats)
+                    completed.add(first_index, last_index + 1)
+                    stats['statements'] += len(statements)
+                    stats['batches'] += 1
+                    save()
+                finally:
+                    queue.task_done()
+        finally:
+            await connection.close()
+
+    async def load_async(self, source):
+        run = self._run_key(source)
+        completed = self._load_checkpoint(run)
+        stats = {'statements': 0, 'skipped': 0, 'batches': 0, 'requests': 0, 'retries': 0, 'bytes': 0, 'latencies': []}
+        last_save = [0.0]
+
+        def save(force=False):
+            # At most once a second while loading; a resumed load resends only batches in flight when it stopped
+            if force or time.monotonic() - last_save[0] >= 1.0:
+                self._save_checkpoint(run, completed)
+                last_save[0] = time.monotonic()
+
+        started = time.perf_counter()
+        queue = asyncio.Queue(maxsize=2 * self.concurrency)
+        workers = [asyncio.ensure_future(self._worker(queue, completed, stats, save)) for _ in range(self.concurrency)]
+
+        async def put(batch):
+            # Waits for queue space, but stops at once if a worker has failed
+            put_task = asyncio.ensure_future(queue.put(batch))
+            await asyncio.wait([put_task] + workers, return_when=asyncio.FIRST_COMPLETED)
+            failed = [worker for worker in workers if worker.done()]
+            if failed:
+                put_task.cancel()
+                failed[0].result()
+                raise RuntimeError('A load worker stopped unexpectedly')
+
+        try:
+            index = 0
+            for phase in self.phases(source):
+                batch = []
+                first_index = None
+                for statement in phase:
+                    if completed.contains(index):
+                        stats['skipped'] += 1
+                    else:
+                        if first_index is None:
+                            first_index = index
+                        batch.append(statement)
+                        if len(batch) >= self.batch_size:
+                            await put((first_index, index, batch))
+                            batch, first_index = [], None
+                    index += 1
+                if batch:
+                    await put((first_index, index - 1, batch))
+                # Phase barrier: everything queued so far is accepted before the next phase starts
+                join_task = asyncio.ensure_future(queue.join())
+                await asyncio.wait([join_task] + workers, return_when=asyncio.FIRST_COMPLETED)
+                if not join_task.done():
+                    join_task.cancel()
+                    next(worker for worker in workers if worker.done()).result()
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            # Cancelled again until they stop: wait_for() can swallow a cancellation that races a finished request
+            pending = [worker for worker in workers if not worker.done()]
+            while pending:
+                for worker in pending:
+                    worker.cancel()
+                _, pending = await asyncio.wait(pending, timeout=0.1)
+            for worker in workers:
+                if not worker.cancelled():
+                    worker.exception()
+            save(force=True)
+
+        return self.report(stats, time.perf_counter() - started)
+
+    def load(self, source):
+        # From a running event loop (a notebook, say) await load_async() instead
+        return asyncio.run(self.load_async(source))
+
+    def report(self, stats, seconds):
+        latencies = np.array(stats.pop('latencies')) * 1000.0
+        report = dict(stats, seconds=seconds, batch_size=self.batch_size,
+                      statements_per_second=stats['statements'] / seconds if seconds > 0 else 0.0)
+        for percentile in (50, 95, 99):
+            report[f'latency_p{percentile}_ms'] = float(np.percentile(latencies, percentile)) if len(latencies) else 0.0
+        return report
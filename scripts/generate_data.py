@@ -1,18 +1,100 @@
 import networkx as nx
+import numpy as np
 import pandas as pd
 import random
 import uuid
 import pickle
+import json
+import time
+import itertools
+import gc
 import pycountry
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from faker import Faker
 from difflib import SequenceMatcher
+from identity_pools import IdentityPools, REFERENCE_DATE
+from island_stream import IslandStreamWriter
+from bulk_export import BulkExporter
+from bulk_loader import BulkLoader
+from graph_store import CompactGraphBuilder, CompactGraphStore
+from similarity_index import IdentitySimilarityIndex
+from search_index import IdentitySearchIndex
+from anomaly_scoring import IslandAnomalyScorer
+from segment_store import SegmentStore, empty_segment
+from instrumentation import Instrumentation, timed
+from topology import IslandTopology, SHARD_STREAM, seeded_rng
+
+EDGE_TYPES = ['INCLUDED_IN', 'CITED_BY', 'IDENTIFIED_THROUGH_BIOMETRICS', 'IDENTITY_EQUIVALENCE', 'MANUAL_IDENTITY_OVERRIDE', 'IMMIGRATION_STATUS_LINKED', 'SAME_APPLICATION']
+EDGE_TARGETS = ['island', 'reference', 'reference', 'island', 'island', 'event', 'island']
+ANOMALY_TYPES = ['duplicate_identity', 'inconsistent_reference', 'mislinked_identity', 'incorrect_event']
+ANOMALY_STAGES = {anomaly_type: f'anomalies.{anomaly_type}' for anomaly_type in ANOMALY_TYPES}
+
+_shard_generator = None
+
+
+def _init_shard_worker(pools, topology):
+    global _shard_generator
+    _shard_generator = IdentityIslandGenerator(topology=topology)
+    _shard_generator.pools = pools
+
+
+def _generate_shard(shard):
+    return _shard_generator.synthesize_shard(*shard)
+
+
+def _node_runs(nodes):
+    # Consecutive nodes sharing attribute keys become one run of columns, which keeps insertion order and pickles
+    # far faster than a dict per node
+    runs = []
+    for keys, group in itertools.groupby(nodes, key=lambda node: tuple(node[1])):
+        ids, rows = zip(*((node_id, tuple(attrs.values())) for node_id, attrs in group))
+        runs.append((keys, ids, tuple(zip(*rows))))
+    return runs
+
+
+@contextmanager
+def _gc_paused():
+    # Bulk inserts allocate millions of acyclic dicts; left on, the cyclic collector rescans the growing graph
+    # over and over
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
 
 class IdentityIslandGenerator:
-    def __init__(self):
+    def __init__(self, instrumentation=None, topology=None, reference_date=REFERENCE_DATE):
         self.G = nx.DiGraph()
         self.fake = Faker()
         self.country_locale_map = self._create_country_locale_map()
         self.identity_islands = []
+        self.pools = None
+        # Ages and event dates of the bulk generators are counted back from this date
+        self.reference_date = reference_date
+        # Island sizes, edge rates and shared references for the bulk generators; the default is the original shape
+        self.topology = topology or IslandTopology()
+        self.shared_pool = None
+        self.similarity_index = None
+        self.search_index = None
+        self.anomaly_labels = []
+        # Islands changed by anomalies since the last score_islands() call
+        self.anomaly_scorer = None
+        self.touched_islands = set()
+        # Segment dataset the generator appends to, and what it already holds
+        self.dataset = None
+        self.saved_islands = 0
+        self.saved_nodes = 0
+        self.saved_labels = 0
+        self.pending_changes = None
+        # Stage timers and counters; disabled unless an enabled Instrumentation is passed in
+        self.instrumentation = instrumentation or Instrumentation()
+        self.instrumentation.gauge('generator.nodes', lambda: self.G.number_of_nodes())
+        self.instrumentation.gauge('generator.edges', lambda: self.G.number_of_edges())
+        self.instrumentation.gauge('generator.islands', lambda: len(self.identity_islands))
 
     def _create_country_locale_map(self):
         return {
@@ -65,6 +147,7 @@ class IdentityIslandGenerator:
         
         return identities
 
+    @timed('generate.synthesize')
     def generate_random_identity_island(self):
         country_code = self.fake.country_code()
         locale = self.country_locale_map.get(country_code, 'en_US')
@@ -74,6 +157,7 @@ class IdentityIslandGenerator:
         nationality = pycountry.countries.get(alpha_2=country_code).alpha_3
         return self.create_identity_island(locale_fake, base_name, date_of_birth, nationality, random.randint(1, 5))
 
+    @timed('generate.wire')
     def add_edges_within_island(self, island):
         reference_nodes = [{'id': str(uuid.uuid4()), 'type': 'Reference', 'doc_type': random.choice(['PASSPORT', 'NATURALISATION', 'VISA_1', 'VISA_2', 'NATIONAL_IDENTITY_CARD']), 'doc_number': self.fake.ssn()} for _ in range(5)]
         event_nodes = [{'id': str(uuid.uuid4()), 'type': 'Event', 'event_type': 'BIOMETRIC_VERIFICATION', 'event_date': self.fake.date()} for _ in range(2)]
@@ -110,6 +194,311 @@ class IdentityIslandGenerator:
                 target = random.choice(island)
                 self.G.add_edge(identity, target, type='SAME_APPLICATION')
 
+    def _get_pools(self, seed=None):
+        if self.pools is None or self.pools.seed != seed or self.pools.reference_date != self.reference_date:
+            self.pools = IdentityPools(self.country_locale_map, seed=seed, reference_date=self.reference_date)
+        return self.pools
+
+    def _shared_references(self, seed, pools):
+        # Reference nodes cited across islands. They depend only on the seed, so every shard and worker rebuilds the same pool
+        count = self.topology.shared_references
+        if count == 0:
+            return [], []
+        if self.shared_pool is None or self.shared_pool[0] != seed:
+            rng = self.topology.shared_rng(seed)
+            ids = self._uuid_batch(rng, count)
+            doc_types = pools.sample_doc_types(rng, count)
+            doc_numbers = pools.sample_doc_numbers(rng, count)
+            nodes = [
+                (ids[i], {'id': ids[i], 'type': 'Reference', 'doc_type': doc_types[i], 'doc_number': doc_numbers[i], 'shared': True})
+                for i in range(count)
+            ]
+            self.shared_pool = (seed, ids, nodes)
+        return self.shared_pool[1], self.shared_pool[2]
+
+    def _uuid_batch(self, rng, count):
+        # Random version-4 UUID strings drawn from rng, formatted without building uuid.UUID objects
+        raw = np.frombuffer(rng.bytes(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+        h = raw.tobytes().hex()
+        return [f'{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}' for i in range(0, 32 * count, 32)]
+
+    @timed('generate.synthesize')
+    def _synthesize_islands(self, rng, num_islands, pools, shared_ids=()):
+        # Island shape mirrors create_identity_island: a base identity plus distinct name variants, 1-4 unless the
+        # topology asks for larger islands, which take their extra variants from freshly sampled second names
+        topology = self.topology
+        country = pools.sample_countries(rng, num_islands)
+        names = pools.sample_names(rng, pools.country_locale_idx[country])
+        dob, age = pools.sample_dates_of_birth(rng, num_islands)
+        nationality = pools.nationalities[country]
+
+        head, tail = names['first_head'], names['last_tail']
+        second, middle = names['second'], names['middle']
+        variants = np.stack([
+            head + ' ' + tail,
+            head + ' ' + second + ' ' + tail,
+            head + ' ' + second + ' ' + middle + ' ' + tail,
+            head + ' ' + middle + ' ' + tail,
+        ], axis=1)
+        sizes = topology.sample_sizes(rng, num_islands)
+        variant_order = np.argsort(rng.random(variants.shape), axis=1)
+
+        island_start = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        num_identities = int(sizes.sum())
+        island_of = np.repeat(np.arange(num_islands), sizes)
+        position = np.arange(num_identities) - island_start[island_of]
+
+        identity_names = np.empty(num_identities, dtype=object)
+        is_base = position == 0
+        identity_names[is_base] = names['first'] + ' ' + names['last']
+        variant_islands = island_of[~is_base]
+        slot = position[~is_base] - 1
+        extra = slot >= variants.shape[1]
+        variant_names = np.empty(len(slot), dtype=object)
+        listed = ~extra
+        variant_names[listed] = variants[variant_islands[listed], variant_order[variant_islands[listed], slot[listed]]]
+        if extra.any():
+            extra_islands = variant_islands[extra]
+            more = pools.sample_names(rng, pools.country_locale_idx[country[extra_islands]])
+            variant_names[extra] = head[extra_islands] + ' ' + more['second'] + ' ' + tail[extra_islands]
+        identity_names[~is_base] = variant_names
+
+        num_references = topology.references_per_island * num_islands
+        num_events = topology.events_per_island * num_islands
+        ids = self._uuid_batch(rng, num_identities + num_references + num_events)
+        identity_ids = ids[:num_identities]
+        reference_ids = ids[num_identities:num_identities + num_references]
+        event_ids = ids[num_identities + num_references:]
+
+        identity_age = age[island_of].tolist()
+        identity_dob = dob[island_of]
+        identity_nationality = nationality[island_of]
+        nodes = [
+            (identity_ids[i], {'id': identity_ids[i], 'type': 'Identity', 'name': identity_names[i], 'age': identity_age[i], 'date_of_birth': identity_dob[i], 'nationality': identity_nationality[i]})
+            for i in range(num_identities)
+        ]
+        doc_types = pools.sample_doc_types(rng, num_references)
+        doc_numbers = pools.sample_doc_numbers(rng, num_references)
+        nodes.extend(
+            (reference_ids[i], {'id': reference_ids[i], 'type': 'Reference', 'doc_type': doc_types[i], 'doc_number': doc_numbers[i]})
+            for i in range(num_references)
+        )
+        event_dates = pools.sample_event_dates(rng, num_events)
+        nodes.extend(
+            (event_ids[i], {'id': event_ids[i], 'type': 'Event', 'event_type': 'BIOMETRIC_VERIFICATION', 'event_date': event_dates[i]})
+            for i in range(num_events)
+        )
+
+        base_of = island_start[variant_islands]
+        edges = [(identity_ids[u], identity_ids[v], 'IDENTITY_EQUIVALENCE') for u, v in zip(base_of.tolist(), np.flatnonzero(~is_base).tolist())]
+        edges.extend(self._wire_islands(rng, island_of, island_start, sizes, ids, num_identities, num_identities + num_references, shared_ids))
+
+        islands = [identity_ids[start:start + size] for start, size in zip(island_start.tolist(), sizes.tolist())]
+        return nodes, edges, islands
+
+    @timed('generate.wire')
+    def _wire_islands(self, rng, island_of, island_start, sizes, ids, reference_offset, event_offset, shared_ids=()):
+        # Bulk equivalent of add_edges_within_island: per identity and edge type, a coin flip at the topology's rate
+        # (or a Poisson edge count when it sets a degree target) and one target draw per edge
+        topology = self.topology
+        num_identities = len(island_of)
+        num_types = len(EDGE_TYPES)
+        rates = topology.edge_rates(EDGE_TYPES)
+        if topology.mean_out_degree is None:
+            present = rng.random((num_identities, num_types)) < rates
+            draws = rng.random((num_identities, num_types))
+            sources, types = np.nonzero(present)
+            draws = draws[sources, types]
+        else:
+            counts = rng.poisson(rates, size=(num_identities, num_types)).ravel()
+            sources, types = np.divmod(np.repeat(np.arange(counts.size), counts), num_types)
+            draws = rng.random(len(sources))
+
+        islands = island_of[sources]
+        references, events = topology.references_per_island, topology.events_per_island
+        target_pools = {
+            'island': (island_start[islands], sizes[islands]),
+            'reference': (reference_offset + references * islands, references),
+            'event': (event_offset + events * islands, events),
+        }
+        targets = np.empty(len(sources), dtype=np.int64)
+        for t, kind in enumerate(EDGE_TARGETS):
+            of_type = types == t
+            base, size = target_pools[kind]
+            if np.ndim(size):
+                base, size = base[of_type], size[of_type]
+            else:
+                base = base[of_type]
+            targets[of_type] = base + (draws[of_type] * size).astype(np.int64)
+
+        kinds = np.array(EDGE_TARGETS)[types]
+        if topology.hub_bias > 0:
+            # Point a share of identity-to-identity edges at the base identity, which becomes the island's hub
+            to_hub = np.flatnonzero(kinds == 'island')
+            to_hub = to_hub[rng.random(len(to_hub)) < topology.hub_bias]
+            targets[to_hub] = island_start[islands[to_hub]]
+        lookup = ids
+        if topology.shared_reference_probability > 0:
+            cited = np.flatnonzero(kinds == 'reference')
+            cited = cited[rng.random(len(cited)) < topology.shared_reference_probability]
+            targets[cited] = len(ids) + topology.sample_shared(rng, len(cited))
+            lookup = ids + list(shared_ids)
+
+        return [
+            (lookup[source], lookup[target], EDGE_TYPES[edge_type])
+            for source, edge_type, target in zip(sources.tolist(), types.tolist(), targets.tolist())
+        ]
+
+    @timed('generate.add_to_graph')
+    def _add_batch(self, nodes, edges):
+        self.G.add_nodes_from(nodes)
+        self.G.add_edges_from((u, v, {'type': edge_type}) for u, v, edge_type in edges)
+
+    @timed('generate.batched')
+    def generate_identity_islands_batched(self, num_islands, batch_size=10000, seed=None):
+        rng = np.random.default_rng(seed)
+        pools = self._get_pools(seed)
+        shared_ids, shared_nodes = self._shared_references(seed, pools)
+        self._add_batch(shared_nodes, [])
+        for start in range(0, num_islands, batch_size):
+            nodes, edges, islands = self._synthesize_islands(rng, min(batch_size, num_islands - start), pools, shared_ids)
+            self._add_batch(nodes, edges)
+            self._index_islands(islands, len(self.identity_islands))
+            self.identity_islands.extend(islands)
+
+    def _shard_rng(self, seed, shard_index):
+        return seeded_rng(seed, SHARD_STREAM, shard_index)
+
+    def _plan_shards(self, num_islands, shard_size, batch_size, seed):
+        return [
+            (min(shard_size, num_islands - start), batch_size, seed, shard_index)
+            for shard_index, start in enumerate(range(0, num_islands, shard_size))
+        ]
+
+    def iter_shard_batches(self, num_islands, batch_size, seed, shard_index):
+        rng = self._shard_rng(seed, shard_index)
+        pools = self._get_pools(seed)
+        shared_ids, shared_nodes = self._shared_references(seed, pools)
+        # The first shard carries the shared references, so every consumer of the shards sees them exactly once
+        if shard_index == 0 and shared_nodes:
+            yield shared_nodes, [], []
+        for start in range(0, num_islands, batch_size):
+            yield self._synthesize_islands(rng, min(batch_size, num_islands - start), pools, shared_ids)
+
+    def synthesize_shard(self, num_islands, batch_size, seed, shard_index):
+        # Returns the shard as columns (node runs from _node_runs, then sources, targets and edge types) so the
+        # parent unpickles and merges it in bulk
+        node_runs, edges, islands = [], [], []
+        with _gc_paused():
+            for batch_nodes, batch_edges, batch_islands in self.iter_shard_batches(num_islands, batch_size, seed, shard_index):
+                node_runs.extend(_node_runs(batch_nodes))
+                edges.extend(batch_edges)
+                islands.extend(batch_islands)
+        return node_runs, tuple(zip(*edges)) or ((), (), ()), islands
+
+    @timed('generate.merge')
+    def merge_shard(self, node_runs, edge_columns, islands):
+        # Shard nodes are new and every edge endpoint is in this shard or among the shared references carried by
+        # shard 0, so the columns go straight into the DiGraph's dicts, skipping add_nodes_from/add_edges_from checks
+        node, succ, pred = self.G._node, self.G._succ, self.G._pred
+        with _gc_paused():
+            for keys, ids, columns in node_runs:
+                for node_id, values in zip(ids, zip(*columns)):
+                    if node_id in node:
+                        node[node_id].update(zip(keys, values))
+                    else:
+                        node[node_id] = dict(zip(keys, values))
+                        succ[node_id] = {}
+                        pred[node_id] = {}
+            for u, v, edge_type in zip(*edge_columns):
+                data = {'type': edge_type}
+                succ[u][v] = data
+                pred[v][u] = data
+        self._index_islands(islands, len(self.identity_islands))
+        self.identity_islands.extend(islands)
+
+    @timed('generate.parallel')
+    def generate_identity_islands_parallel(self, num_islands, seed=0, workers=None, shard_size=50000, batch_size=10000):
+        # Shard boundaries and seeds depend only on num_islands, shard_size and seed, so any worker count gives the same graph
+        shards = self._plan_shards(num_islands, shard_size, batch_size, seed)
+        if workers == 1 or len(shards) <= 1:
+            for shard in shards:
+                self.merge_shard(*self.synthesize_shard(*shard))
+            return
+
+        # Build every locale pool once here and ship it to the workers instead of running Faker in each process
+        pools = self._get_pools(seed)
+        pools.build_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker, initargs=(pools, self.topology)) as executor:
+            for node_runs, edge_columns, islands in executor.map(_generate_shard, shards):
+                self.merge_shard(node_runs, edge_columns, islands)
+
+    def iter_identity_islands(self, num_islands, seed=0, shard_size=50000, batch_size=10000):
+        # Yields (nodes, edges, islands) batches without touching self.G; same shards and seeds as the parallel mode
+        for shard in self._plan_shards(num_islands, shard_size, batch_size, seed):
+            yield from self.iter_shard_batches(*shard)
+
+    @timed('generate.stream')
+    def stream_identity_islands(self, output_dir, num_islands, seed=0, fmt='ndjson', compress=False, islands_per_chunk=100000, batch_size=10000, resume=True):
+        writer = IslandStreamWriter(output_dir, fmt=fmt, compress=compress, islands_per_chunk=islands_per_chunk)
+        return writer.write(self, num_islands, seed=seed, batch_size=batch_size, resume=resume)
+
+    @timed('export')
+    def export_bulk(self, output_dir, fmt='nquads', compress=True, max_part_bytes=256 * 1024 * 1024, nodes_per_task=200000, workers=None):
+        # N-Quads or property-graph CSV parts of self.G for a graph database bulk loader
+        exporter = BulkExporter(output_dir, fmt=fmt, compress=compress, max_part_bytes=max_part_bytes,
+                                nodes_per_task=nodes_per_task, workers=workers)
+        return exporter.export(self.G)
+
+    @timed('load_endpoint')
+    def load_to_endpoint(self, endpoint, protocol='sparql', concurrency=8, batch_size=1000, checkpoint_path=None):
+        # Batched INSERT DATA or Gremlin requests straight from self.G; returns throughput and latency figures
+        loader = BulkLoader(endpoint, protocol=protocol, concurrency=concurrency, batch_size=batch_size, checkpoint_path=checkpoint_path)
+        return loader.load(self.G)
+
+    def to_graph_store(self):
+        return CompactGraphStore.from_networkx(self.G)
+
+    def from_graph_store(self, store):
+        self.G = store.to_networkx()
+
+    @timed('generate.graph_store')
+    def generate_graph_store(self, num_islands, seed=0, shard_size=50000, batch_size=10000):
+        # Builds the compact store straight from the island batches, never materialising an nx.DiGraph. Returns the
+        # store and its island list; the generator's own graph and islands are left alone, since they would no longer match
+        builder = CompactGraphBuilder()
+        store_islands = []
+        for nodes, edges, islands in self.iter_identity_islands(num_islands, seed=seed, shard_size=shard_size, batch_size=batch_size):
+            builder.add_batch(nodes, edges)
+            store_islands.extend(islands)
+        return builder.build(), store_islands
+
+    @timed('index.similarity')
+    def build_similarity_index(self):
+        self.similarity_index = IdentitySimilarityIndex()
+        self.similarity_index.add_islands(self.G, self.identity_islands)
+        return self.similarity_index
+
+    @timed('index.search')
+    def build_search_index(self):
+        self.search_index = IdentitySearchIndex()
+        self.search_index.add_islands(self.G, self.identity_islands)
+        return self.search_index
+
+    @timed('index.islands')
+    def _index_islands(self, islands, first_island):
+        # Keeps already-built indexes current; the similarity index is otherwise built by the first add_anomalies call
+        if self.similarity_index is not None:
+            self.similarity_index.add_islands(self.G, islands, first_island)
+        if self.search_index is not None:
+            self.search_index.add_islands(self.G, islands, first_island)
+
+    def _index_anomaly_node(self, node_id, island_index):
+        if self.search_index is not None:
+            self.search_index.add(node_id, self.G.nodes[node_id], island_index)
+
     def similar(self, a, b):
         return SequenceMatcher(None, a, b).ratio()
 
@@ -138,12 +527,19 @@ class IdentityIslandGenerator:
 
         return similar_identity
 
+    @timed('anomalies.legacy')
     def add_anomalies(self, anomaly_percentage):
         total_islands = len(self.identity_islands)
         num_anomalous_islands = int(total_islands * (anomaly_percentage / 100))
 
+        similarity_index = self.similarity_index or self.build_similarity_index()
+        timing = self.instrumentation.enabled
+
         for _ in range(num_anomalous_islands):
-            island = random.choice(self.identity_islands)
+            started = time.perf_counter()
+            island_index = random.randrange(total_islands)
+            island = self.identity_islands[island_index]
+            self.touched_islands.add(island_index)
             source_identity_id = random.choice(island)
             source_identity = self.G.nodes[source_identity_id]
             anomaly_type = random.choice(['duplicate_identity', 'inconsistent_reference', 'mislinked_identity', 'incorrect_event'])
@@ -156,6 +552,9 @@ class IdentityIslandGenerator:
                 self.G.add_node(duplicate_identity['id'], **duplicate_identity)
                 self.G.add_edge(source_identity_id, duplicate_identity['id'], type='IDENTITY_EQUIVALENCE')
                 island.append(duplicate_identity['id'])
+                similarity_index.add(duplicate_identity['id'], duplicate_identity, island_index)
+                self._index_anomaly_node(duplicate_identity['id'], island_index)
+                self._record_change([(source_identity_id, duplicate_identity['id'], 'IDENTITY_EQUIVALENCE')], [(island_index, duplicate_identity['id'])])
                 # print(f"Added duplicate identity anomaly: {duplicate_identity['name']}")
 
             elif anomaly_type == 'inconsistent_reference':
@@ -168,19 +567,23 @@ class IdentityIslandGenerator:
                 self.G.add_node(inconsistent_reference['id'], **inconsistent_reference)
                 target_identity_id = random.choice(island)
                 self.G.add_edge(target_identity_id, inconsistent_reference['id'], type='CITED_BY')
+                self._index_anomaly_node(inconsistent_reference['id'], island_index)
+                self._record_change([(target_identity_id, inconsistent_reference['id'], 'CITED_BY')])
                 # print(f"Added inconsistent reference anomaly: {inconsistent_reference['doc_type']}")
 
             elif anomaly_type == 'mislinked_identity':
-                attribute = 'name'
-                unrelated_identity_island = random.choice([i for i in self.identity_islands if i != island])
-                similar_identity_id = self.find_similar_identity([self.G.nodes[id] for id in unrelated_identity_island], source_identity, attribute)
+                similar_identity_id = similarity_index.most_similar(source_identity, exclude_island=island_index)
                 
                 if similar_identity_id:
                     self.G.add_edge(source_identity_id, similar_identity_id, type='IDENTITY_EQUIVALENCE')
+                    self.touched_islands.add(similarity_index.island_of[similar_identity_id])
+                    self._record_change([(source_identity_id, similar_identity_id, 'IDENTITY_EQUIVALENCE')])
                     print(f"Added mislinked identity anomaly between {source_identity_id} and {similar_identity_id}")
-                else:
-                    unrelated_identity = random.choice([id for i in self.identity_islands for id in i if i != island])
+                elif total_islands > 1:
+                    other_index, unrelated_identity = self._unrelated_identity(island_index, random.randrange(1, total_islands), random.random())
                     self.G.add_edge(source_identity_id, unrelated_identity, type='IDENTITY_EQUIVALENCE')
+                    self.touched_islands.add(other_index)
+                    self._record_change([(source_identity_id, unrelated_identity, 'IDENTITY_EQUIVALENCE')])
                     # print(f"Added completely different identity anomaly between {source_identity_id} and {unrelated_identity}")
 
             elif anomaly_type == 'incorrect_event':
@@ -193,32 +596,250 @@ class IdentityIslandGenerator:
                 self.G.add_node(incorrect_event['id'], **incorrect_event)
                 target_identity_id = random.choice(island)
                 self.G.add_edge(target_identity_id, incorrect_event['id'], type='IMMIGRATION_STATUS_LINKED')
+                self._index_anomaly_node(incorrect_event['id'], island_index)
+                self._record_change([(target_identity_id, incorrect_event['id'], 'IMMIGRATION_STATUS_LINKED')])
                 # print(f"Added incorrect event anomaly: {incorrect_event['event_type']}")
 
+            if timing:
+                self.instrumentation.record(ANOMALY_STAGES[anomaly_type], time.perf_counter() - started)
+                self.instrumentation.count(ANOMALY_STAGES[anomaly_type])
+
+    def _unrelated_identity(self, island_index, offset, fraction):
+        # Mislink fallback when no similar identity exists: the member at fraction of the island offset places on.
+        # offset is in [1, len(islands)), so the source island is never picked, and no list of identities is built
+        other_index = (island_index + offset) % len(self.identity_islands)
+        other = self.identity_islands[other_index]
+        return other_index, other[int(fraction * len(other))]
+
+    def _plan_anomalies(self, rng, num_anomalies):
+        island_sizes = np.fromiter((len(island) for island in self.identity_islands), dtype=np.int64, count=len(self.identity_islands))
+        island_index = rng.integers(len(self.identity_islands), size=num_anomalies)
+        sizes = island_sizes[island_index]
+        return {
+            'island': island_index,
+            'type': rng.integers(len(ANOMALY_TYPES), size=num_anomalies),
+            'source': (rng.random(num_anomalies) * sizes).astype(np.int64),
+            'target': (rng.random(num_anomalies) * sizes).astype(np.int64),
+            # Fallback for mislinks without a similar identity: an offset to another island, then any member of it
+            'other_offset': rng.integers(1, max(len(island_sizes), 2), size=num_anomalies),
+            'other_member': rng.random(num_anomalies),
+        }
+
+    @timed('anomalies.batched')
+    def add_anomalies_batched(self, anomaly_percentage, seed=None):
+        # Plans every anomaly up front with vectorised draws, applies them in one pass and records a label per anomaly
+        total_islands = len(self.identity_islands)
+        num_anomalies = int(total_islands * (anomaly_percentage / 100))
+        if num_anomalies == 0:
+            return []
+        rng = np.random.default_rng(seed)
+        pools = self.pools if self.pools is not None else self._get_pools(seed)
+        similarity_index = self.similarity_index or self.build_similarity_index()
+        plan = self._plan_anomalies(rng, num_anomalies)
+
+        counts = np.bincount(plan['type'], minlength=len(ANOMALY_TYPES))
+        new_ids = iter(self._uuid_batch(rng, int(counts[0] + counts[1] + counts[3])))
+        first_names = iter(pools.sample_first_names(rng, int(counts[0])))
+        doc_types = iter(pools.sample_doc_types(rng, int(counts[1])))
+        doc_numbers = iter(pools.sample_doc_numbers(rng, int(counts[1])))
+        event_dates = iter(pools.sample_event_dates(rng, int(counts[3])))
+
+        first_label = len(self.anomaly_labels)
+        labels = []
+        timing = self.instrumentation.enabled
+        for i, (island_index, anomaly_type, source, target) in enumerate(zip(plan['island'].tolist(), plan['type'].tolist(), plan['source'].tolist(), plan['target'].tolist())):
+            started = time.perf_counter()
+            island = self.identity_islands[island_index]
+            source_identity_id = island[source]
+            anomaly_type = ANOMALY_TYPES[anomaly_type]
+            label = {'anomaly_id': first_label + len(labels), 'anomaly_type': anomaly_type, 'island': island_index, 'related_island': None}
+
+            if anomaly_type == 'duplicate_identity':
+                duplicate_identity = self.G.nodes[source_identity_id].copy()
+                duplicate_identity['id'] = next(new_ids)
+                duplicate_identity['name'] = next(first_names) + " " + duplicate_identity['name'].split()[1]
+                self.G.add_node(duplicate_identity['id'], **duplicate_identity)
+                edge = (source_identity_id, duplicate_identity['id'], 'IDENTITY_EQUIVALENCE')
+                island.append(duplicate_identity['id'])
+                similarity_index.add(duplicate_identity['id'], duplicate_identity, island_index)
+                label['nodes'] = [duplicate_identity['id']]
+
+            elif anomaly_type == 'inconsistent_reference':
+                reference_id = next(new_ids)
+                self.G.add_node(reference_id, id=reference_id, type='Reference', doc_type=next(doc_types), doc_number=next(doc_numbers))
+                edge = (island[target], reference_id, 'CITED_BY')
+                label['nodes'] = [reference_id]
+
+            elif anomaly_type == 'mislinked_identity':
+                linked_id = similarity_index.most_similar(self.G.nodes[source_identity_id], exclude_island=island_index)
+                if linked_id is not None:
+                    label['related_island'] = similarity_index.island_of[linked_id]
+                elif total_islands < 2:
+                    # No other island to link to; linking the source island to itself is not a mislink
+                    continue
+                else:
+                    label['related_island'], linked_id = self._unrelated_identity(island_index, int(plan['other_offset'][i]), plan['other_member'][i])
+                edge = (source_identity_id, linked_id, 'IDENTITY_EQUIVALENCE')
+                label['nodes'] = []
+
+            else:
+                event_id = next(new_ids)
+                self.G.add_node(event_id, id=event_id, type='Event', event_type='BIOMETRIC_VERIFICATION', event_date=next(event_dates))
+                edge = (island[target], event_id, 'IMMIGRATION_STATUS_LINKED')
+                label['nodes'] = [event_id]
+
+            self.G.add_edge(edge[0], edge[1], type=edge[2])
+            for node_id in label['nodes']:
+                self._index_anomaly_node(node_id, island_index)
+            self.touched_islands.add(island_index)
+            if label['related_island'] is not None:
+                self.touched_islands.add(label['related_island'])
+            members = [(island_index, label['nodes'][0])] if anomaly_type == 'duplicate_identity' else []
+            self._record_change([edge], members)
+            label['edges'] = [list(edge)]
+            labels.append(label)
+            if timing:
+                self.instrumentation.record(ANOMALY_STAGES[anomaly_type], time.perf_counter() - started)
+                self.instrumentation.count(ANOMALY_STAGES[anomaly_type])
+
+        self.anomaly_labels.extend(labels)
+        return labels
+
+    @timed('score')
+    def score_islands(self, workers=None, full=False):
+        # Anomaly score per island; after the first call only new islands and islands touched by anomalies are recomputed
+        scorer = self.anomaly_scorer
+        if full or scorer is None or scorer.graph is not self.G or scorer.islands is not self.identity_islands:
+            self.anomaly_scorer = IslandAnomalyScorer(self.G, self.identity_islands, EDGE_TYPES, workers=workers)
+        else:
+            self.anomaly_scorer.workers = workers
+        self.anomaly_scorer.update(self.touched_islands)
+        self.touched_islands = set()
+        return self.anomaly_scorer.frame()
+
+    def anomaly_labels_frame(self):
+        return pd.DataFrame(self.anomaly_labels, columns=['anomaly_id', 'anomaly_type', 'island', 'related_island', 'nodes', 'edges'])
+
+    def save_anomaly_labels(self, filepath):
+        with open(filepath, 'w') as f:
+            for label in self.anomaly_labels:
+                f.write(json.dumps(label) + '\n')
+
+    def load_anomaly_labels(self, filepath):
+        with open(filepath, 'r') as f:
+            self.anomaly_labels = [json.loads(line) for line in f if line.strip()]
+
+    @timed('generate.legacy')
     def generate_identity_islands(self, num_islands):
+        first_island = len(self.identity_islands)
         for _ in range(num_islands):
             island = self.generate_random_identity_island()
             self.identity_islands.append(island)
 
         for island in self.identity_islands:
             self.add_edges_within_island(island)
+        self._index_islands(self.identity_islands[first_island:], first_island)
+        # Existing islands were rewired as well, so an open dataset needs their new edges
+        for island in self.identity_islands[:min(first_island, self.saved_islands)]:
+            self._record_change([(u, v, data['type']) for u, v, data in self.G.out_edges(island, data=True)])
 
+    @timed('pickle.save_graph')
     def save_graph(self, filepath):
         with open(filepath, 'wb') as f:
             pickle.dump(self.G, f, pickle.HIGHEST_PROTOCOL)
 
+    @timed('pickle.save_islands')
     def save_identity_islands(self, filepath):
         with open(filepath, 'wb') as f:
             pickle.dump(self.identity_islands, f, pickle.HIGHEST_PROTOCOL)
 
+    @timed('pickle.load_graph')
     def load_graph(self, filepath):
         with open(filepath, 'rb') as f:
             self.G = pickle.load(f)
 
+    @timed('pickle.load_islands')
     def load_identity_islands(self, filepath):
         with open(filepath, 'rb') as f:
             self.identity_islands = pickle.load(f)
 
+    def _record_change(self, edges, members=()):
+        # Edges added to islands already saved in the open dataset, for the next append_to_dataset() call;
+        # new nodes need no record, since the graph keeps them in insertion order
+        if self.dataset is None:
+            return
+        if self.pending_changes is None:
+            self.pending_changes = empty_segment()
+        self.pending_changes['edges'].extend(edges)
+        self.pending_changes['members'].extend((i, m) for i, m in members if i < self.saved_islands)
+
+    def _island_segment(self, islands, nodes):
+        segment = empty_segment()
+        segment['islands'] = [list(island) for island in islands]
+        segment['nodes'] = [(node_id, self.G.nodes[node_id]) for node_id in nodes]
+        for island in islands:
+            segment['edges'].extend((u, v, data['type']) for u, v, data in self.G.out_edges(island, data=True))
+        return segment
+
+    @timed('dataset.save')
+    def save_dataset(self, path, islands_per_segment=100000):
+        # Starts a segment dataset holding everything generated so far, written as one or more segments
+        dataset = SegmentStore(path)
+        if dataset.exists():
+            raise ValueError(f"{path} already holds a dataset; use open_dataset() and append_to_dataset()")
+        num_segments = max(1, -(-len(self.identity_islands) // islands_per_segment))
+        nodes_per_segment = -(-self.G.number_of_nodes() // num_segments)
+        node_ids = iter(self.G)
+        for i in range(num_segments):
+            islands = self.identity_islands[i * islands_per_segment:(i + 1) * islands_per_segment]
+            segment = self._island_segment(islands, itertools.islice(node_ids, nodes_per_segment))
+            if i == 0:
+                segment['labels'] = list(self.anomaly_labels)
+            dataset.append(segment, kind='islands')
+        self._attach_dataset(dataset)
+        return dataset
+
+    @timed('dataset.open')
+    def open_dataset(self, path):
+        # Loads the merged view of a segment dataset and keeps it open for appends
+        dataset = SegmentStore(path)
+        self.G, self.identity_islands, self.anomaly_labels = dataset.load()
+        self.similarity_index = None
+        self.search_index = None
+        self._attach_dataset(dataset)
+        return dataset
+
+    def _attach_dataset(self, dataset):
+        self.dataset = dataset
+        self.saved_islands = len(self.identity_islands)
+        self.saved_nodes = self.G.number_of_nodes()
+        self.saved_labels = len(self.anomaly_labels)
+        self.pending_changes = None
+
+    @timed('dataset.append')
+    def append_to_dataset(self):
+        # Writes one new segment with the islands, nodes, anomalies and labels added since the last save or append.
+        # Nodes are never removed, so the new ones are those past saved_nodes in the graph's insertion order
+        if self.dataset is None:
+            raise ValueError("No dataset is open; call save_dataset() or open_dataset() first")
+        segment = self._island_segment(self.identity_islands[self.saved_islands:], itertools.islice(self.G, self.saved_nodes, None))
+        pending = self.pending_changes or empty_segment()
+        segment['edges'].extend(pending['edges'])
+        segment['members'] = pending['members']
+        segment['labels'] = self.anomaly_labels[self.saved_labels:]
+        if not (segment['islands'] or segment['nodes'] or segment['edges'] or segment['labels']):
+            return None
+        name = self.dataset.append(segment)
+        self._attach_dataset(self.dataset)
+        return name
+
+    def compact_dataset(self, background=True):
+        if self.dataset is None:
+            raise ValueError("No dataset is open; call save_dataset() or open_dataset() first")
+        if background:
+            return self.dataset.compact_in_background()
+        return self.dataset.compact()
+
     def print_identity_islands(self):
         for i, island in enumerate(self.identity_islands, start=1):
             print(f"Identity Island {i}:")
@@ -0,0 +1,446 @@
+import json
+import os
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+# String columns whose distinct values exceed this share of their rows are stored as a buffer instead of codes
+MAX_CATEGORY_RATIO = 0.5
+UUID_LENGTH = 36
+UUID_DASHES = np.array([8, 13, 18, 23])
+UUID_HEX = np.setdiff1d(np.arange(UUID_LENGTH), UUID_DASHES)
+HEX_LOOKUP = np.full(256, 255, dtype=np.uint8)
+HEX_LOOKUP[np.frombuffer(b'0123456789abcdef', dtype=np.uint8)] = np.arange(16)
+
+
+def _smallest_int_dtype(low, high):
+    # Signed dtype whose minimum value stays free to mark missing entries
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if low > info.min and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def _pack_ids(utf8):
+    # Ids that are all '<prefix><lower-case uuid>' pack into 16 raw bytes each; anything else stays fixed-width UTF-8
+    width = utf8.dtype.itemsize
+    if len(utf8) == 0 or width < UUID_LENGTH:
+        return utf8, '', 'utf8'
+    prefix = bytes(utf8[0])[:width - UUID_LENGTH]
+    chars = np.ascontiguousarray(utf8).view(np.uint8).reshape(len(utf8), width)
+    if not (chars[:, :len(prefix)] == np.frombuffer(prefix, dtype=np.uint8)).all():
+        return utf8, '', 'utf8'
+    body = chars[:, len(prefix):]
+    if not (body[:, UUID_DASHES] == ord('-')).all():
+        return utf8, '', 'utf8'
+    nibbles = HEX_LOOKUP[body[:, UUID_HEX]]
+    if (nibbles == 255).any():
+        return utf8, '', 'utf8'
+    packed = np.ascontiguousarray((nibbles[:, 0::2] << 4) | nibbles[:, 1::2]).view('S16').reshape(len(utf8))
+    return packed, prefix.decode('utf-8'), 'uuid'
+
+
+def _format_uuids(prefix, packed):
+    h = np.ascontiguousarray(packed).view(np.uint8).tobytes().hex()
+    return [f'{prefix}{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}' for i in range(0, len(h), 32)]
+
+
+class CompactGraphStore:
+    def __init__(self, node_ids, columns, indptr, indices, edge_type_codes, edge_types, id_prefix='', id_format='utf8'):
+        # node_ids: the position in the array is the integer node id. With id_format 'uuid' each entry is the
+        # 16 raw bytes of '<id_prefix><uuid>', otherwise the fixed-width UTF-8 id
+        self.node_ids = node_ids
+        self.id_prefix = id_prefix
+        self.id_format = id_format
+        # columns: attribute -> one of
+        #   ('int', values)                      dtype minimum where absent
+        #   ('cat', codes, categories)           code -1 where absent
+        #   ('str', offsets, buffer, present)    UTF-8 bytes of row i are buffer[offsets[i]:offsets[i + 1]]
+        #   ('self', present)                    value equals the node id (the generator's 'id' attribute)
+        self.columns = columns
+        # CSR adjacency: out-edges of node i are indices[indptr[i]:indptr[i + 1]]
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_type_codes = edge_type_codes
+        self.edge_types = edge_types
+        self._id_order = None
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def _encode_key(self, node_id):
+        if isinstance(node_id, bytes):
+            node_id = node_id.decode('utf-8')
+        if self.id_format == 'utf8':
+            return node_id.encode('utf-8')
+        body = node_id[len(self.id_prefix):]
+        if not node_id.startswith(self.id_prefix) or len(body) != UUID_LENGTH:
+            return None
+        try:
+            return bytes.fromhex(body.replace('-', ''))
+        except ValueError:
+            return None
+
+    def index_of(self, node_ids):
+        # UUID -> integer id lookup by binary search over the sorted id order; -1 for unknown ids
+        # Keys longer than the stored width cannot match, and would be truncated to a stored prefix by the cast below
+        width = self.node_ids.dtype.itemsize
+        keys = [self._encode_key(node_id) for node_id in node_ids]
+        keys = [key if key is not None and len(key) <= width else None for key in keys]
+        result = np.full(len(keys), -1, dtype=np.int64)
+        valid = np.array([key is not None for key in keys], dtype=bool)
+        if self.num_nodes == 0 or not valid.any():
+            return result
+        if self._id_order is None:
+            self._id_order = np.argsort(self.node_ids, kind='stable')
+        search = np.array([key for key in keys if key is not None], dtype=self.node_ids.dtype)
+        pos = np.minimum(np.searchsorted(self.node_ids, search, sorter=self._id_order), self.num_nodes - 1)
+        idx = self._id_order[pos].astype(np.int64)
+        idx[self.node_ids[idx] != search] = -1
+        result[valid] = idx
+        return result
+
+    def node_id(self, idx):
+        if self.id_format == 'uuid':
+            return _format_uuids(self.id_prefix, self.node_ids[idx:idx + 1])[0]
+        return self.node_ids[idx].decode('utf-8')
+
+    def node_id_list(self, idx=None):
+        ids = self.node_ids if idx is None else self.node_ids[idx]
+        if self.id_format == 'uuid':
+            return _format_uuids(self.id_prefix, ids)
+        return [node_id.decode('utf-8') for node_id in ids]
+
+    def edge_sources(self):
+        return np.repeat(np.arange(self.num_nodes, dtype=np.int64), np.diff(self.indptr))
+
+    def out_edges(self, idx):
+        start, end = self.indptr[idx], self.indptr[idx + 1]
+        return self.indices[start:end], self.edge_type_codes[start:end]
+
+    def degrees(self):
+        return np.diff(self.indptr) + np.bincount(self.indices, minlength=self.num_nodes)
+
+    def _value(self, column, idx):
+        kind = column[0]
+        if kind == 'int':
+            value = column[1][idx]
+            return None if value == np.iinfo(column[1].dtype).min else int(value)
+        if kind == 'cat':
+            code = column[1][idx]
+            if code < 0:
+                return None
+            value = column[2][code]
+            return list(value) if isinstance(value, tuple) else value
+        if kind == 'str':
+            if not column[3][idx]:
+                return None
+            return bytes(column[2][column[1][idx]:column[1][idx + 1]]).decode('utf-8')
+        return self.node_id(idx) if column[1][idx] else None
+
+    def column(self, name, idx=None):
+        # Decoded values for every node, or for the nodes in idx (None where absent); integer columns come back as
+        # their raw array
+        column = self.columns[name]
+        kind = column[0]
+        rows = np.arange(self.num_nodes) if idx is None else np.asarray(idx, dtype=np.int64)
+        if kind == 'int':
+            return column[1] if idx is None else column[1][rows]
+        values = np.empty(len(rows), dtype=object)
+        if kind == 'cat':
+            codes = column[1][rows]
+            present = codes >= 0
+            values[present] = column[2][codes[present]]
+        elif kind == 'str':
+            # One gather and one decode for all rows: each value's bytes followed by a NUL, then split on NUL
+            offsets, buffer, present = column[1], column[2], column[3][rows]
+            picked = rows[present]
+            starts = offsets[picked]
+            lengths = offsets[picked + 1] - starts
+            ends = np.cumsum(lengths + 1)
+            gathered = np.zeros(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+            within = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            gathered[np.repeat(ends - lengths - 1, lengths) + within] = buffer[np.repeat(starts, lengths) + within]
+            values[present] = gathered.tobytes().decode('utf-8').split('\0')[:-1]
+        else:
+            present = np.flatnonzero(column[1][rows])
+            values[present] = self.node_id_list(rows[present])
+        return values
+
+    def column_text(self, name, idx, prefix=''):
+        # prefix + str(value) for each node in idx, '' where absent, the way node_attrs() values print. Categories are
+        # formatted once each and picked by code, so only free-text columns are decoded per node
+        column = self.columns[name]
+        kind = column[0]
+        rows = np.asarray(idx, dtype=np.int64)
+        if kind == 'cat':
+            labels = [prefix + str(list(value) if isinstance(value, tuple) else value) for value in column[2]]
+            return np.array(labels + [''], dtype=object)[column[1][rows]]
+        text = np.full(len(rows), '', dtype=object)
+        if kind == 'int':
+            values = column[1][rows]
+            present = values != np.iinfo(values.dtype).min
+            text[present] = prefix + values[present].astype(str).astype(object)
+        else:
+            values = self.column(name, rows)
+            present = values != None  # noqa: E711, elementwise
+            text[present] = prefix + values[present]
+        return text
+
+    def node_attrs(self, idx):
+        attrs = {}
+        for name, column in self.columns.items():
+            value = self._value(column, idx)
+            if value is not None:
+                attrs[name] = value
+        return attrs
+
+    @classmethod
+    def from_records(cls, nodes, edges):
+        builder = CompactGraphBuilder()
+        builder.add_batch(nodes, edges)
+        return builder.build()
+
+    @classmethod
+    def from_networkx(cls, G):
+        edges = ((u, v, data.get('type')) for u, v, data in G.edges(data=True))
+        return cls.from_records(G.nodes(data=True), edges)
+
+    def to_networkx(self):
+        G = nx.DiGraph()
+        ids = self.node_id_list()
+        G.add_nodes_from((ids[i], self.node_attrs(i)) for i in range(self.num_nodes))
+        G.add_edges_from(
+            (ids[u], ids[v], {'type': self.edge_types[t]})
+            for u, v, t in zip(self.edge_sources().tolist(), self.indices.tolist(), self.edge_type_codes.tolist())
+        )
+        return G
+
+    def nbytes(self):
+        total = self.node_ids.nbytes + self.indptr.nbytes + self.indices.nbytes + self.edge_type_codes.nbytes
+        for column in self.columns.values():
+            for part in column[1:]:
+                total += sum(len(str(value)) for value in part) if part.dtype == object else part.nbytes
+        return total
+
+    def save(self, path):
+        # One .npy file per array so load(mmap=True) can memory-map them
+        os.makedirs(path, exist_ok=True)
+        for name in ('node_ids', 'indptr', 'indices', 'edge_type_codes'):
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        meta = {'edge_types': self.edge_types, 'id_prefix': self.id_prefix, 'id_format': self.id_format, 'columns': {}}
+        for i, (name, column) in enumerate(self.columns.items()):
+            entry = {'kind': column[0], 'files': []}
+            for j, part in enumerate(column[1:]):
+                if part.dtype == object:
+                    entry['categories'] = [list(value) if isinstance(value, tuple) else value for value in part]
+                else:
+                    filename = f'column_{i}_{j}.npy'
+                    np.save(os.path.join(path, filename), part)
+                    entry['files'].append(filename)
+            meta['columns'][name] = entry
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        columns = {}
+        for name, entry in meta['columns'].items():
+            parts = [np.load(os.path.join(path, filename), mmap_mode=mmap_mode) for filename in entry['files']]
+            if entry['kind'] == 'cat':
+                categories = np.empty(len(entry['categories']), dtype=object)
+                categories[:] = [tuple(value) if isinstance(value, list) else value for value in entry['categories']]
+                parts.append(categories)
+            columns[name] = (entry['kind'], *parts)
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in ('node_ids', 'indptr', 'indices', 'edge_type_codes')]
+        return cls(arrays[0], columns, arrays[1], arrays[2], arrays[3], meta['edge_types'], meta['id_prefix'], meta['id_format'])
+
+
+class CompactGraphBuilder:
+    def __init__(self):
+        self.num_nodes = 0
+        self._node_ids = []
+        self._categories = {}
+        self._codes = {}
+        self._self_ids = {}
+        self._edge_types = {}
+        self._edge_batches = []
+        self._pending_edges = []
+
+    def _encode(self, key, positions, values):
+        categories = self._categories.setdefault(key, {})
+        if len(values) and all(isinstance(v, str) for v in values):
+            # pd.factorize numbers strings by first appearance, as the dict below does, but in C
+            local_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+            codes = np.array([categories.setdefault(v, len(categories)) for v in uniques], dtype=np.int64)[local_codes]
+        else:
+            codes = np.fromiter(
+                (categories.setdefault(tuple(v) if isinstance(v, list) else v, len(categories)) for v in values),
+                dtype=np.int64, count=len(values),
+            )
+        self._codes.setdefault(key, []).append((np.asarray(positions, dtype=np.int64), codes))
+
+    def _append_edges(self, edge_map):
+        count = len(edge_map)
+        self._edge_batches.append((
+            np.fromiter((u for u, _ in edge_map), dtype=np.int64, count=count),
+            np.fromiter((v for _, v in edge_map), dtype=np.int64, count=count),
+            np.fromiter(edge_map.values(), dtype=np.int16, count=count),
+        ))
+
+    def add_batch(self, nodes, edges):
+        # Nodes are assumed unique across batches. Edges resolve against their own batch first and against
+        # earlier batches at build time; endpoints never seen as nodes become bare nodes, as in nx.DiGraph
+        offset = self.num_nodes
+        position = {}
+        attr_positions = {}
+        attr_values = {}
+        for node_id, attrs in nodes:
+            idx = position.get(node_id)
+            if idx is None:
+                idx = position[node_id] = offset + len(position)
+            for key, value in attrs.items():
+                if key == 'id' and value == node_id:
+                    self._self_ids.setdefault(key, []).append(idx)
+                    continue
+                attr_positions.setdefault(key, []).append(idx)
+                attr_values.setdefault(key, []).append(value)
+        for key in attr_values:
+            self._encode(key, attr_positions[key], attr_values[key])
+
+        # A repeated (source, target) pair keeps its last type, as in nx.DiGraph
+        edge_map = {}
+        for source, target, edge_type in edges:
+            u, v = position.get(source), position.get(target)
+            type_code = self._edge_types.setdefault(edge_type, len(self._edge_types))
+            if u is None or v is None:
+                self._pending_edges.append((source, target, type_code))
+            else:
+                edge_map[(u, v)] = type_code
+
+        self.num_nodes = offset + len(position)
+        self._node_ids.append(np.array([str(node_id).encode('utf-8') for node_id in position], dtype=bytes))
+        self._append_edges(edge_map)
+
+    def add_nodes(self, node_ids):
+        # Column-wise counterpart of add_batch for loaders: node ids not added before, in order, without attributes
+        self._node_ids.append(np.array([str(node_id).encode('utf-8') for node_id in node_ids], dtype=bytes))
+        self.num_nodes += len(node_ids)
+
+    def add_column(self, key, positions, values):
+        # One attribute for nodes already added: store positions and their values, lists included
+        positions = np.asarray(positions, dtype=np.int64)
+        if key == 'id':
+            node_ids = np.char.decode(self._node_id_array()[positions], 'utf-8').tolist()
+            same = np.fromiter((value == node_id for value, node_id in zip(values, node_ids)), dtype=bool, count=len(values))
+            self._self_ids.setdefault(key, []).extend(positions[same].tolist())
+            positions, values = positions[~same], [value for value, is_same in zip(values, same.tolist()) if not is_same]
+        if len(positions):
+            self._encode(key, positions, values)
+
+    def add_edges(self, sources, targets, type_codes, edge_types):
+        # Edges between added nodes as position arrays; type_codes index edge_types. Repeats are settled at build time
+        lookup = np.array([self._edge_types.setdefault(edge_type, len(self._edge_types)) for edge_type in edge_types], dtype=np.int16)
+        self._edge_batches.append((
+            np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64), lookup[np.asarray(type_codes, dtype=np.int64)],
+        ))
+
+    def _node_id_array(self):
+        batches = [batch for batch in self._node_ids if len(batch)]
+        if not batches:
+            return np.array([], dtype='S1')
+        width = max(batch.dtype.itemsize for batch in batches)
+        return np.concatenate([batch.astype(f'S{width}') for batch in batches])
+
+    def _resolve_pending(self):
+        node_only = CompactGraphStore(self._node_id_array(), {}, None, np.array([], dtype=np.int32), None, [])
+        endpoints = [node_id for source, target, _ in self._pending_edges for node_id in (source, target)]
+        found = node_only.index_of([str(node_id) for node_id in endpoints]).tolist()
+        missing = {}
+        for node_id, idx in zip(endpoints, found):
+            if idx < 0 and node_id not in missing:
+                missing[node_id] = self.num_nodes + len(missing)
+        if missing:
+            self._node_ids.append(np.array([str(node_id).encode('utf-8') for node_id in missing], dtype=bytes))
+            self.num_nodes += len(missing)
+
+        resolved = [missing[node_id] if idx < 0 else idx for node_id, idx in zip(endpoints, found)]
+        edge_map = {}
+        for i, (_, _, type_code) in enumerate(self._pending_edges):
+            edge_map[(resolved[2 * i], resolved[2 * i + 1])] = type_code
+        self._append_edges(edge_map)
+        self._pending_edges = []
+
+    def _build_column(self, key, batches):
+        categories = np.empty(len(self._categories[key]), dtype=object)
+        categories[:] = list(self._categories[key])
+        codes = np.full(self.num_nodes, -1, dtype=np.int64)
+        for positions, batch_codes in batches:
+            codes[positions] = batch_codes
+        present = codes >= 0
+
+        if len(categories) and all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in categories):
+            ints = categories.astype(np.int64)
+            dtype = _smallest_int_dtype(ints.min(), ints.max())
+            values = np.full(self.num_nodes, np.iinfo(dtype).min, dtype=dtype)
+            values[present] = ints[codes[present]]
+            return ('int', values)
+
+        if all(isinstance(v, str) for v in categories) and len(categories) > MAX_CATEGORY_RATIO * present.sum():
+            encoded = [value.encode('utf-8') for value in categories]
+            lengths = np.zeros(self.num_nodes, dtype=np.int64)
+            lengths[present] = np.fromiter((len(value) for value in encoded), dtype=np.int64, count=len(encoded))[codes[present]]
+            offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            buffer = np.frombuffer(b''.join(encoded[code] for code in codes[present].tolist()), dtype=np.uint8)
+            return ('str', offsets, buffer, present)
+
+        return ('cat', codes.astype(_smallest_int_dtype(-1, len(categories))), categories)
+
+    def _dedupe_edges(self, sources, targets, type_codes):
+        # A (source, target) pair repeated across batches keeps its first position and its last type, as in nx.DiGraph
+        keys = sources * max(self.num_nodes, 1) + targets
+        unique_keys, first = np.unique(keys, return_index=True)
+        if len(unique_keys) == len(keys):
+            return sources, targets, type_codes
+        last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+        order = np.argsort(first)
+        return sources[first[order]], targets[first[order]], type_codes[last[order]]
+
+    def build(self):
+        if self._pending_edges:
+            self._resolve_pending()
+        utf8_ids = self._node_id_array()
+
+        for key, positions in self._self_ids.items():
+            if key in self._codes:
+                # Some nodes carry an 'id' that differs from their node id, so encode every value explicitly
+                self._encode(key, positions, np.char.decode(utf8_ids[positions], 'utf-8').tolist())
+        columns = {key: self._build_column(key, batches) for key, batches in self._codes.items()}
+        for key, positions in self._self_ids.items():
+            if key not in columns:
+                present = np.zeros(self.num_nodes, dtype=bool)
+                present[positions] = True
+                columns[key] = ('self', present)
+
+        if self._edge_batches:
+            sources, targets, type_codes = (np.concatenate([batch[i] for batch in self._edge_batches]) for i in range(3))
+        else:
+            sources, targets, type_codes = np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.int16)
+        sources, targets, type_codes = self._dedupe_edges(sources, targets, type_codes)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=self.num_nodes), out=indptr[1:])
+
+        node_ids, id_prefix, id_format = _pack_ids(utf8_ids)
+        edge_type_dtype = np.int8 if len(self._edge_types) < 128 else np.int16
+        return CompactGraphStore(node_ids, columns, indptr, targets[order].astype(np.int32), type_codes[order].astype(edge_type_dtype), list(self._edge_types), id_prefix, id_format)
@@ -0,0 +1,106 @@
+import zlib
+import numpy as np
+import pandas as pd
+import pycountry
+from faker import Faker
+
+DOC_TYPES = ['PASSPORT', 'NATURALISATION', 'VISA_1', 'VISA_2', 'NATIONAL_IDENTITY_CARD']
+# Date that ages and the latest event dates are counted from. It is fixed, not today, so a seed gives the same graph on any day
+REFERENCE_DATE = '2024-01-01'
+
+
+class IdentityPools:
+    def __init__(self, country_locale_map, pool_size=1000, seed=None, reference_date=REFERENCE_DATE):
+        self.country_locale_map = country_locale_map
+        self.pool_size = pool_size
+        self.seed = seed
+        self.reference_date = reference_date
+        self._name_pools = {}
+
+        countries = list(pycountry.countries)
+        self.country_codes = np.array([c.alpha_2 for c in countries])
+        self.nationalities = np.array([c.alpha_3 for c in countries], dtype=object)
+        self.locales = sorted(set(country_locale_map.values()) | {'en_US'})
+        locale_index = {locale: i for i, locale in enumerate(self.locales)}
+        self.country_locale_idx = np.array([locale_index[country_locale_map.get(cc, 'en_US')] for cc in self.country_codes])
+
+        today = pd.Timestamp(reference_date).normalize()
+        self.today = today
+
+        # Every possible date of birth for ages 1-80, with the matching age precomputed
+        dob_start = today - pd.DateOffset(years=81) + pd.Timedelta(days=1)
+        dob_end = today - pd.DateOffset(years=1)
+        dob_days = pd.date_range(dob_start, dob_end, freq='D')
+        self.dob_strings = np.array(dob_days.strftime('%d/%m/%Y'), dtype=object)
+        self.dob_ages = ((today - dob_days).days // 365).to_numpy()
+
+        event_days = pd.date_range('1970-01-01', today, freq='D')
+        self.event_dates = np.array(event_days.strftime('%Y-%m-%d'), dtype=object)
+
+    def _locale_seed(self, locale):
+        if self.seed is None:
+            return None
+        return (self.seed * 1000003 + zlib.crc32(locale.encode())) % (2 ** 32)
+
+    def name_pool(self, locale_idx):
+        if locale_idx not in self._name_pools:
+            locale = self.locales[locale_idx]
+            locale_fake = Faker(locale)
+            locale_seed = self._locale_seed(locale)
+            if locale_seed is not None:
+                locale_fake.seed_instance(locale_seed)
+            first_names = [locale_fake.first_name() for _ in range(self.pool_size)]
+            last_names = [locale_fake.last_name() for _ in range(self.pool_size)]
+            self._name_pools[locale_idx] = {
+                'first': np.array(first_names, dtype=object),
+                'last': np.array(last_names, dtype=object),
+                'first_head': np.array([name.split()[0] for name in first_names], dtype=object),
+                'last_tail': np.array([name.split()[-1] for name in last_names], dtype=object),
+            }
+        return self._name_pools[locale_idx]
+
+    def build_all(self):
+        for locale_idx in range(len(self.locales)):
+            self.name_pool(locale_idx)
+
+    def sample_names(self, rng, locale_idx):
+        n = len(locale_idx)
+        out = {key: np.empty(n, dtype=object) for key in ('first', 'first_head', 'last', 'last_tail', 'second', 'middle')}
+        for loc in np.unique(locale_idx):
+            mask = locale_idx == loc
+            count = int(mask.sum())
+            pool = self.name_pool(int(loc))
+            first = rng.integers(self.pool_size, size=count)
+            last = rng.integers(self.pool_size, size=count)
+            out['first'][mask] = pool['first'][first]
+            out['first_head'][mask] = pool['first_head'][first]
+            out['last'][mask] = pool['last'][last]
+            out['last_tail'][mask] = pool['last_tail'][last]
+            out['second'][mask] = pool['first'][rng.integers(self.pool_size, size=count)]
+            out['middle'][mask] = pool['last'][rng.integers(self.pool_size, size=count)]
+        return out
+
+    def sample_first_names(self, rng, n, locale='en_US'):
+        pool = self.name_pool(self.locales.index(locale))
+        return pool['first'][rng.integers(self.pool_size, size=n)]
+
+    def sample_countries(self, rng, n):
+        return rng.integers(len(self.country_codes), size=n)
+
+    def sample_dates_of_birth(self, rng, n):
+        idx = rng.integers(len(self.dob_strings), size=n)
+        return self.dob_strings[idx], self.dob_ages[idx]
+
+    def sample_event_dates(self, rng, n):
+        return self.event_dates[rng.integers(len(self.event_dates), size=n)]
+
+    def sample_doc_types(self, rng, n):
+        return np.array(DOC_TYPES, dtype=object)[rng.integers(len(DOC_TYPES), size=n)]
+
+    def sample_doc_numbers(self, rng, n):
+        # Same shape as Faker's en_US ssn(): area 001-899 except 666, group 01-99, serial 0001-9999
+        area = rng.integers(1, 899, size=n)
+        area[area >= 666] += 1
+        group = rng.integers(1, 100, size=n)
+        serial = rng.integers(1, 10000, size=n)
+        return [f'{a:03d}-{g:02d}-{s:04d}' for a, g, s in zip(area.tolist(), group.tolist(), serial.tolist())]
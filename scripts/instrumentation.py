@@ -0,0 +1,210 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+# Handed out by disabled instrumentation, so an instrumented block costs one method call and an empty with
+NULL_STAGE = nullcontext()
+
+
+def timed(name):
+    # Method decorator: times each call as stage name on self.instrumentation
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if not instrumentation.enabled:
+                return method(self, *args, **kwargs)
+            with _Stage(instrumentation, name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _Stage:
+    __slots__ = ('instrumentation', 'name', 'started')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.instrumentation._push(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instrumentation.record(self.name, time.perf_counter() - self.started)
+        self.instrumentation._pop()
+
+
+class SamplingProfiler:
+    # Samples the Python stack of every other thread at a fixed interval. Samples are keyed by the sampled thread's
+    # innermost stage and its call stack, and can be written in the collapsed format flame graph tools read.
+    # With stages_only, threads outside any stage (idle pool and server threads, mostly) are not sampled
+    def __init__(self, instrumentation, interval=0.005, max_depth=64, stages_only=True):
+        self.instrumentation = instrumentation
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stages_only = stages_only
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        return tuple(reversed(names))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stage = self.instrumentation.active_stage(thread_id)
+                if stage is None:
+                    if self.stages_only:
+                        continue
+                    stage = '-'
+                self.stacks[(stage,) + self._stack(frame)] += 1
+            self.samples += 1
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def top(self, n=20):
+        # Functions by the share of samples in which they were running (the innermost frame)
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack[-1] if len(stack) > 1 else stack[0]] += count
+        total = sum(leaves.values()) or 1
+        return [{'function': name, 'samples': count, 'share': count / total} for name, count in leaves.most_common(n)]
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+
+class Instrumentation:
+    def __init__(self, enabled=False, profile=False, profile_interval=0.005):
+        # Stage timers (count, total and max seconds per name) and counters. Nested stages each keep their own
+        # totals, so a parent's time includes its children's
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.gauges = {}
+        self.active = {}
+        self.profiler = None
+        if enabled and profile:
+            self.start_profiler(profile_interval)
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return _Stage(self, name)
+
+    def _push(self, name):
+        self.active.setdefault(threading.get_ident(), []).append(name)
+
+    def _pop(self):
+        stack = self.active.get(threading.get_ident())
+        if stack:
+            stack.pop()
+
+    def active_stage(self, thread_id):
+        stack = self.active.get(thread_id)
+        return stack[-1] if stack else None
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_counter(self, name, value):
+        if self.enabled:
+            self.counters[name] = value
+
+    def gauge(self, name, read):
+        # A counter read when a snapshot is taken, such as the size of a graph
+        self.gauges[name] = read
+
+    def start_profiler(self, interval=0.005):
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(self, interval)
+        self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+        if self.profiler is not None:
+            self.profiler.stacks = Counter()
+            self.profiler.samples = 0
+
+    def snapshot(self, top=20):
+        with self.lock:
+            timers = {
+                name: {'count': count, 'total_s': total, 'mean_s': total / count, 'max_s': longest}
+                for name, (count, total, longest) in sorted(self.timers.items())
+            }
+            counters = dict(self.counters)
+        if self.enabled:
+            counters.update((name, read()) for name, read in self.gauges.items())
+        stats = {'enabled': self.enabled, 'timers': timers, 'counters': dict(sorted(counters.items()))}
+        if self.profiler is not None:
+            stats['profile'] = {'samples': self.profiler.samples, 'interval_s': self.profiler.interval, 'top': self.profiler.top(top)}
+        return stats
+
+    def to_json(self, top=20):
+        return json.dumps(self.snapshot(top), indent=1)
+
+    def dump(self, path, top=20):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.to_json(top))
+        os.replace(path + '.tmp', path)
+
+    def report(self):
+        stats = self.snapshot()
+        lines = [f"{'stage':<36}{'count':>8}{'total s':>12}{'mean ms':>12}{'max ms':>12}"]
+        for name, timer in stats['timers'].items():
+            lines.append(f"{name:<36}{timer['count']:>8}{timer['total_s']:>12.3f}{timer['mean_s'] * 1000:>12.3f}{timer['max_s'] * 1000:>12.3f}")
+        lines.extend(f"{name:<36}{value:>8}" for name, value in stats['counters'].items())
+        return '\n'.join(lines)
@@ -0,0 +1,298 @@
+import hashlib
+import os
+import pickle
+import networkx as nx
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Elements in one (components, n, n) force matrix; same-sized components are laid out together up to this budget
+BATCH_ELEMENTS = 4 * 1024 * 1024
+
+
+def _rescale(pos):
+    # Centre each component on the origin and fit it into the unit disc, as nx.rescale_layout does
+    pos = pos - pos.mean(axis=1, keepdims=True)
+    extent = np.abs(pos).max(axis=(1, 2), keepdims=True)
+    return pos / np.where(extent > 0, extent, 1.0)
+
+
+def _fruchterman_reingold(adjacency, pos, iterations):
+    # The dense force model of nx.spring_layout, run on a stack of equally sized components at once
+    n = pos.shape[1]
+    k = np.sqrt(1.0 / n)
+    t = max(float(np.ptp(pos, axis=1).max()), 1e-6) * 0.1
+    dt = t / (iterations + 1)
+    for _ in range(iterations):
+        delta = pos[:, :, None, :] - pos[:, None, :, :]
+        distance = np.sqrt((delta ** 2).sum(axis=-1))
+        np.clip(distance, 0.01, None, out=distance)
+        force = k * k / distance ** 2 - adjacency * distance / k
+        displacement = np.einsum('bijk,bij->bik', delta, force)
+        length = np.sqrt((displacement ** 2).sum(axis=-1))
+        np.clip(length, 0.01, None, out=length)
+        pos += displacement * (t / length)[..., None]
+        t -= dt
+    return pos
+
+
+def _layout_batch(task):
+    n, edge_lists, seeds, iterations = task
+    if n == 1:
+        return np.zeros((len(seeds), 1, 2))
+    adjacency = np.zeros((len(seeds), n, n))
+    pos = np.empty((len(seeds), n, 2))
+    for b, (edges, seed) in enumerate(zip(edge_lists, seeds)):
+        if len(edges):
+            adjacency[b, edges[:, 0], edges[:, 1]] = 1.0
+            adjacency[b, edges[:, 1], edges[:, 0]] = 1.0
+        pos[b] = np.random.default_rng(seed).random((n, 2))
+    return _rescale(_fruchterman_reingold(adjacency, pos, iterations))
+
+
+# A node is a hub (a shared reference, say) when its degree is above both of these; large components are split around hubs
+HUB_MIN_DEGREE = 32
+HUB_DEGREE_FACTOR = 4
+# Pieces over part_size nodes are cut into runs of this many nodes, about an island's size; each run costs its size
+# squared per iteration, so per node the cost stays that of laying out an island
+CHUNK_SIZE = 16
+
+
+def _parts(n, edges, part_size):
+    # Splits a large component into parts and groups the parts into clusters. Every hub is a part of its own and
+    # starts a cluster; removing the hubs leaves pieces (islands, mostly), and each piece joins the cluster of the
+    # lowest hub it touches. Pieces over part_size nodes are cut into CHUNK_SIZE runs of breadth-first order, and
+    # pieces that touch no hub make clusters of their own. Returns each node's part, each part's cluster and the hub count
+    degree = np.bincount(edges.ravel(), minlength=n)
+    is_hub = degree > max(HUB_MIN_DEGREE, HUB_DEGREE_FACTOR * degree.mean())
+    hubs = np.flatnonzero(is_hub)
+    H = nx.Graph()
+    H.add_nodes_from(np.flatnonzero(~is_hub).tolist())
+    H.add_edges_from(edges[~is_hub[edges].any(axis=1)].tolist())
+    # Each non-hub node's lowest hub neighbour, n for none
+    anchor = np.full(n, n, dtype=np.int64)
+    spokes = edges[is_hub[edges[:, 0]] != is_hub[edges[:, 1]]]
+    spokes = np.where(is_hub[spokes[:, :1]], spokes[:, ::-1], spokes)
+    np.minimum.at(anchor, spokes[:, 0], spokes[:, 1])
+    hub_rank = np.zeros(n + 1, dtype=np.int64)
+    hub_rank[hubs] = np.arange(len(hubs))
+
+    part_of = np.empty(n, dtype=np.int64)
+    part_of[hubs] = np.arange(len(hubs))
+    cluster = list(range(len(hubs)))
+    for nodes in nx.connected_components(H):
+        piece = np.fromiter(nodes, dtype=np.int64, count=len(nodes))
+        hub = int(anchor[piece].min())
+        step = len(piece)
+        if len(piece) > part_size:
+            source = int(piece.min())
+            piece = np.array([source] + [v for _, v in nx.bfs_edges(H, source)], dtype=np.int64)
+            step = CHUNK_SIZE
+        for start in range(0, len(piece), step):
+            part_of[piece[start:start + step]] = len(cluster)
+            cluster.append(int(hub_rank[hub]) if hub < n else len(hubs) + len(cluster))
+    cluster = np.unique(np.array(cluster, dtype=np.int64), return_inverse=True)[1]
+    return part_of, cluster, len(hubs)
+
+
+def _layout_parts(sizes, part_edges, seeds, iterations):
+    # The stacked force layout for many small graphs of varied sizes, grouped by size within the matrix budget
+    local = [None] * len(sizes)
+    by_size = {}
+    for p, size in enumerate(sizes.tolist()):
+        by_size.setdefault(size, []).append(p)
+    for size, group in by_size.items():
+        per_batch = max(1, BATCH_ELEMENTS // (size * size))
+        for start in range(0, len(group), per_batch):
+            chunk = group[start:start + per_batch]
+            result = _layout_batch((size, [part_edges[p] for p in chunk], [seeds[p] for p in chunk], iterations))
+            for p, part_pos in zip(chunk, result):
+                local[p] = part_pos
+    return local
+
+
+def _spiral_offsets(sizes, cluster, num_hubs):
+    # Radial placement inside each cluster: its hub at the centre, then its parts largest first along a sunflower
+    # spiral, the k-th at a radius that leaves room for the area of the parts before it
+    is_hub = np.arange(len(sizes)) < num_hubs
+    order = np.lexsort((-sizes, ~is_hub, cluster))
+    grouped = cluster[order]
+    first = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+    group_start = np.repeat(first, np.diff(np.r_[first, len(order)]))
+    rank = np.arange(len(order)) - group_start
+    filled = np.cumsum(sizes[order]) - sizes[order]
+    radius = 2 * np.sqrt(filled - filled[group_start])
+    angle = rank * np.pi * (3 - np.sqrt(5))
+    offsets = np.empty((len(sizes), 2))
+    offsets[order] = np.stack([radius * np.cos(angle), radius * np.sin(angle)], axis=1)
+    extent = np.zeros(cluster.max() + 1)
+    np.maximum.at(extent, cluster, np.sqrt((offsets ** 2).sum(axis=1)) + np.sqrt(sizes))
+    return offsets, extent
+
+
+def _layout_large(task):
+    # Components larger than one dense force matrix allows: parts are laid out with the stacked force model and
+    # arranged radially around their hub, and the graph of clusters is laid out the same way (recursively while it
+    # is still large). Work grows with the part sizes, not with the square of the component size
+    n, edges, seed, iterations, part_size = task
+    rng = np.random.default_rng(seed)
+    part_of, cluster, num_hubs = _parts(n, edges, part_size)
+    num_parts = len(cluster)
+    sizes = np.bincount(part_of, minlength=num_parts)
+    order = np.argsort(part_of, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    local_index = np.empty(n, dtype=np.int64)
+    local_index[order] = np.arange(n) - np.repeat(starts, sizes)
+
+    same_part = part_of[edges[:, 0]] == part_of[edges[:, 1]]
+    inner = edges[same_part]
+    inner = inner[np.argsort(part_of[inner[:, 0]], kind='stable')]
+    inner_counts = np.bincount(part_of[inner[:, 0]], minlength=num_parts)
+    part_edges = np.split(local_index[inner], np.cumsum(inner_counts)[:-1])
+    local = _layout_parts(sizes, part_edges, rng.integers(2 ** 32, size=num_parts).tolist(), iterations)
+    offsets, extent = _spiral_offsets(sizes, cluster, num_hubs)
+
+    num_clusters = len(extent)
+    between = np.sort(cluster[part_of[edges]], axis=1)
+    between = np.unique(between[between[:, 0] != between[:, 1]], axis=0)
+    if num_clusters == 1:
+        centres = np.zeros((1, 2))
+    elif num_clusters <= part_size:
+        centres = _layout_batch((num_clusters, [between], [int(rng.integers(2 ** 32))], iterations))[0]
+    else:
+        centres = _layout_large((num_clusters, between, int(rng.integers(2 ** 32)), iterations, part_size))
+    # Cluster centres spread over the unit disc are about 1/sqrt(num_clusters) apart; scaled to the clusters' size
+    centres = centres * 2 * extent.mean() * np.sqrt(num_clusters)
+
+    pos = np.empty((n, 2))
+    members = np.split(order, np.cumsum(sizes)[:-1])
+    for p, nodes in enumerate(members):
+        pos[nodes] = centres[cluster[p]] + offsets[p] + local[p] * np.sqrt(sizes[p])
+    return _rescale(pos[None])[0]
+
+
+class IslandLayoutEngine:
+    def __init__(self, iterations=50, workers=None, max_batched_size=300, padding=0.5, parallel_threshold=20000, cache_path=None):
+        # Components up to max_batched_size nodes use the stacked force layout; larger ones are split into parts of
+        # at most that size, which are laid out the same way and then placed by a layout of the graph of parts
+        self.iterations = iterations
+        self.workers = workers
+        self.max_batched_size = max_batched_size
+        self.padding = padding
+        self.parallel_threshold = parallel_threshold
+        self.cache_path = cache_path
+        # The cache file is read on the first layout() call, so an app served from a snapshot never reads it
+        self.cache = None
+        self.last_stats = {}
+
+    def load_cache(self):
+        self.cache = {}
+        if self.cache_path and os.path.exists(self.cache_path):
+            with open(self.cache_path, 'rb') as f:
+                self.cache = pickle.load(f)
+
+    def save_cache(self, path=None):
+        path = path or self.cache_path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self.cache, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def components(self, G):
+        # Weakly connected components (an island plus anything anomalies linked to it), each with its node list
+        # in sorted order and its undirected edges as local index pairs
+        connected = nx.weakly_connected_components(G) if G.is_directed() else nx.connected_components(G)
+        components = [sorted(nodes, key=str) for nodes in connected]
+        local = {}
+        component_of = {}
+        for c, nodes in enumerate(components):
+            for i, node in enumerate(nodes):
+                local[node] = i
+                component_of[node] = c
+        edge_lists = [[] for _ in components]
+        for u, v in G.edges():
+            if u != v:
+                a, b = local[u], local[v]
+                edge_lists[component_of[u]].append((a, b) if a < b else (b, a))
+        edge_arrays = [np.array(sorted(set(edges)), dtype=np.int64).reshape(-1, 2) for edges in edge_lists]
+        return components, edge_arrays
+
+    @staticmethod
+    def signature(nodes, edges):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update('\x1f'.join(map(str, nodes)).encode('utf-8'))
+        digest.update(edges.tobytes())
+        return digest.hexdigest()
+
+    def _tasks(self, pending):
+        batches = {}
+        large = []
+        for signature, n, edges in pending:
+            seed = int(signature[:8], 16)
+            if n > self.max_batched_size:
+                large.append(((n, edges, seed, self.iterations, self.max_batched_size), [signature]))
+            else:
+                batches.setdefault(n, []).append((signature, edges, seed))
+        tasks = []
+        for n, members in batches.items():
+            per_batch = max(1, BATCH_ELEMENTS // (n * n))
+            for start in range(0, len(members), per_batch):
+                chunk = members[start:start + per_batch]
+                tasks.append((_layout_batch, (n, [edges for _, edges, _ in chunk], [seed for _, _, seed in chunk], self.iterations),
+                              [signature for signature, _, _ in chunk]))
+        tasks.extend((_layout_large, task, signatures) for task, signatures in large)
+        return tasks
+
+    def _run(self, tasks, parallel):
+        if not parallel:
+            return [func(task) for func, task, _ in tasks]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(func, task) for func, task, _ in tasks]
+            return [future.result() for future in futures]
+
+    def _pack(self, sizes):
+        # Shelf packing on a grid: components are placed largest first, each in a square cell whose side grows
+        # with the square root of its node count, and rows wrap at roughly the square root of the total area
+        order = np.argsort(-sizes, kind='stable')
+        cells = 2 * np.sqrt(sizes) * (1 + self.padding)
+        row_width = max(np.sqrt((cells ** 2).sum()), cells.max())
+        centres = np.empty((len(sizes), 2))
+        x = y = row_height = 0.0
+        for c in order:
+            if x > 0 and x + cells[c] > row_width:
+                x, y = 0.0, y - row_height
+                row_height = 0.0
+            centres[c] = (x + cells[c] / 2, y - cells[c] / 2)
+            x += cells[c]
+            row_height = max(row_height, cells[c])
+        return centres, np.sqrt(sizes)
+
+    def layout(self, G):
+        if self.cache is None:
+            self.load_cache()
+        components, edge_arrays = self.components(G)
+        signatures = [self.signature(nodes, edges) for nodes, edges in zip(components, edge_arrays)]
+
+        pending = {}
+        for nodes, edges, signature in zip(components, edge_arrays, signatures):
+            if signature not in self.cache and signature not in pending:
+                pending[signature] = (signature, len(nodes), edges)
+        tasks = self._tasks(pending.values())
+        parallel = self.workers != 1 and len(tasks) > 1 and sum(n for _, n, _ in pending.values()) >= self.parallel_threshold
+        for (_, _, task_signatures), result in zip(tasks, self._run(tasks, parallel)):
+            for signature, local_pos in zip(task_signatures, result if result.ndim == 3 else [result]):
+                self.cache[signature] = local_pos.astype(np.float32)
+
+        # Only components still present are kept, so the cache follows the graph
+        self.cache = {signature: self.cache[signature] for signature in signatures}
+        if self.cache_path and pending:
+            self.save_cache()
+        self.last_stats = {'components': len(components), 'laid_out': len(pending), 'cached': len(set(signatures)) - len(pending)}
+
+        if not components:
+            return {}
+        centres, scales = self._pack(np.array([len(nodes) for nodes in components], dtype=np.float64))
+        pos = {}
+        for c, (nodes, signature) in enumerate(zip(components, signatures)):
+            placed = self.cache[signature] * scales[c] + centres[c]
+            pos.update(zip(nodes, placed.astype(np.float64)))
+        return pos
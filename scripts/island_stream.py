@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+from nquads import BASE_URI, node_to_nquads, edge_to_nquad
+from topology import STREAM_VERSION
+
+FORMATS = {'ndjson': '.ndjson', 'nquads': '.nq'}
+
+
+class IslandStreamWriter:
+    def __init__(self, output_dir, fmt='ndjson', compress=False, islands_per_chunk=100000, base_uri=BASE_URI):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported stream format: {fmt}")
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compress = compress
+        self.islands_per_chunk = islands_per_chunk
+        self.base_uri = base_uri
+        self.progress_path = os.path.join(output_dir, 'progress.json')
+
+    def _open(self, path):
+        if self.compress:
+            return gzip.open(path, 'wt', encoding='utf-8')
+        return open(path, 'w', encoding='utf-8')
+
+    def _chunk_path(self, prefix, chunk_index, extension):
+        suffix = extension + ('.gz' if self.compress else '')
+        return os.path.join(self.output_dir, f'{prefix}-{chunk_index:05d}{suffix}')
+
+    def _load_progress(self, run):
+        if not os.path.exists(self.progress_path):
+            return set()
+        with open(self.progress_path, 'r') as f:
+            progress = json.load(f)
+        if progress['run'] != run:
+            raise ValueError(f"{self.output_dir} holds a run with different parameters: {progress['run']}")
+        return set(progress['completed'])
+
+    def _save_progress(self, run, completed):
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'run': run, 'completed': sorted(completed)}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def _write_batch(self, data_file, islands_file, nodes, edges, islands, first_island):
+        if self.fmt == 'ndjson':
+            for node_id, attrs in nodes:
+                data_file.write(json.dumps({'kind': 'node', **attrs}) + '\n')
+            for source, target, edge_type in edges:
+                data_file.write(json.dumps({'kind': 'edge', 'source': source, 'target': target, 'type': edge_type}) + '\n')
+        else:
+            for node_id, attrs in nodes:
+                data_file.writelines(node_to_nquads(node_id, attrs, self.base_uri))
+            data_file.writelines(edge_to_nquad(source, target, edge_type, self.base_uri) for source, target, edge_type in edges)
+
+        out = data_file if islands_file is None else islands_file
+        for offset, members in enumerate(islands):
+            out.write(json.dumps({'kind': 'island', 'index': first_island + offset, 'members': members}) + '\n')
+
+    def _write_chunk(self, generator, shard, chunk_index):
+        data_path = self._chunk_path('part', chunk_index, FORMATS[self.fmt])
+        islands_path = self._chunk_path('islands', chunk_index, '.ndjson') if self.fmt == 'nquads' else None
+
+        # Write to temporary names and rename once the chunk is complete, so a crash never leaves a partial chunk behind
+        data_file = self._open(data_path + '.tmp')
+        islands_file = self._open(islands_path + '.tmp') if islands_path else None
+        try:
+            first_island = chunk_index * self.islands_per_chunk
+            for nodes, edges, islands in generator.iter_shard_batches(*shard):
+                self._write_batch(data_file, islands_file, nodes, edges, islands, first_island)
+                first_island += len(islands)
+        finally:
+            data_file.close()
+            if islands_file is not None:
+                islands_file.close()
+
+        os.replace(data_path + '.tmp', data_path)
+        if islands_path:
+            os.replace(islands_path + '.tmp', islands_path)
+
+    def write(self, generator, num_islands, seed=0, batch_size=10000, resume=True):
+        os.makedirs(self.output_dir, exist_ok=True)
+        run = {
+            'num_islands': num_islands, 'seed': seed, 'batch_size': batch_size,
+            'islands_per_chunk': self.islands_per_chunk, 'format': self.fmt, 'compress': self.compress,
+            'topology': generator.topology.to_dict(), 'streams': STREAM_VERSION,
+            'reference_date': str(generator.reference_date),
+        }
+        completed = self._load_progress(run) if resume else set()
+
+        shards = generator._plan_shards(num_islands, self.islands_per_chunk, batch_size, seed)
+        for chunk_index, shard in enumerate(shards):
+            if chunk_index in completed:
+                continue
+            self._write_chunk(generator, shard, chunk_index)
+            completed.add(chunk_index)
+            self._save_progress(run, completed)
+        return len(shards)
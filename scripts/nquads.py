@@ -0,0 +1,23 @@
+BASE_URI = "http://syntetic_identity_island.org/"
+XSD_INTEGER = "http://www.w3.org/2001/XMLSchema#integer"
+
+
+def escape_literal(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def node_to_nquads(node_id, attrs, base_uri=BASE_URI):
+    subject = f'<{base_uri}{node_id}>'
+    lines = []
+    for key, value in attrs.items():
+        # Multi-valued attributes become one quad per value, which the loader gathers back into a list
+        for item in value if isinstance(value, list) else (value,):
+            if isinstance(item, int) and not isinstance(item, bool):
+                lines.append(f'{subject} <{base_uri}{key}> "{item}"^^<{XSD_INTEGER}> .\n')
+            else:
+                lines.append(f'{subject} <{base_uri}{key}> "{escape_literal(item)}" .\n')
+    return lines
+
+
+def edge_to_nquad(source, target, edge_type, base_uri=BASE_URI):
+    return f'<{base_uri}{source}> <{base_uri}{edge_type}> <{base_uri}{target}> .\n'
@@ -0,0 +1,315 @@
+import gzip
+import mmap
+import os
+import re
+import networkx as nx
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from graph_store import CompactGraphBuilder
+from nquads import BASE_URI
+
+# The patterns IdentityIslandsApp has always used; the tokenizer below hands any line it cannot settle to them
+PATTERN_LITERAL = re.compile(r'<(.*?)>\s+<(.*?)>\s+"(.*?)"\s*(?:\^\^<.*?>)?\s*\.\s*')
+PATTERN_URI = re.compile(r'<(.*?)>\s+<(.*?)>\s+<(.*?)>\s*\.\s*')
+
+LITERAL = 0
+URI = 1
+
+
+def _skip_space(line, i):
+    n = len(line)
+    while i < n and line[i].isspace():
+        i += 1
+    return i
+
+
+def _ends_statement(line, i):
+    i = _skip_space(line, i)
+    return i < len(line) and line[i] == '.'
+
+
+def _literal_tail(line, i):
+    # \s*(?:\^\^<.*?>)?\s*\.
+    i = _skip_space(line, i)
+    if line.startswith('^^<', i):
+        j = line.find('>', i + 3)
+        while j >= 0:
+            if _ends_statement(line, j + 1):
+                return True
+            j = line.find('>', j + 1)
+        return False
+    return i < len(line) and line[i] == '.'
+
+
+def _tokenize(line):
+    # Single pass over the common '<s> <p> "o" .' / '<s> <p> <o> .' shapes. Each term takes the shortest match,
+    # which is what the lazy regex groups settle on first; None means "ask the regexes"
+    if not line.startswith('<'):
+        return False
+    s_end = line.find('>')
+    if s_end < 0:
+        return False
+    p_start = _skip_space(line, s_end + 1)
+    if p_start == s_end + 1 or not line.startswith('<', p_start):
+        return None
+    p_end = line.find('>', p_start)
+    if p_end < 0:
+        return None
+    o_start = _skip_space(line, p_end + 1)
+    if o_start == p_end + 1 or o_start >= len(line):
+        return None
+    subject, predicate = line[1:s_end], line[p_start + 1:p_end]
+
+    if line[o_start] == '"':
+        q = line.find('"', o_start + 1)
+        while q >= 0:
+            if _literal_tail(line, q + 1):
+                return (LITERAL, subject, predicate, line[o_start + 1:q])
+            q = line.find('"', q + 1)
+        return None
+
+    # A quote anywhere could let the literal pattern match with a longer predicate, so leave those lines to the regexes
+    if line[o_start] == '<' and '"' not in line:
+        o_end = line.find('>', o_start)
+        while o_end >= 0:
+            if _ends_statement(line, o_end + 1):
+                return (URI, subject, predicate, line[o_start + 1:o_end])
+            o_end = line.find('>', o_end + 1)
+        return False
+    return None
+
+
+def parse_line(line):
+    token = _tokenize(line)
+    if token is None:
+        match = PATTERN_LITERAL.match(line)
+        if match:
+            return (LITERAL,) + match.groups()
+        match = PATTERN_URI.match(line)
+        if match:
+            return (URI,) + match.groups()
+        return False
+    return token
+
+
+def parse_lines(lines, base_uri):
+    records = []
+    errors = 0
+    prefix_length = len(base_uri)
+    for line in lines:
+        token = parse_line(line)
+        if not token:
+            if line.strip():
+                errors += 1
+            continue
+        kind, subject, predicate, obj = token
+        if predicate.startswith(base_uri):
+            records.append((kind, subject, predicate[prefix_length:], obj))
+    return records, errors
+
+
+def _split_lines(data):
+    # Same line endings as iterating over a text-mode file
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def _joined(strings):
+    # Parsed terms never contain a newline, so a chunk's strings cross the process boundary as one string
+    return '\n'.join(strings), len(strings)
+
+
+def _unjoined(joined):
+    text, count = joined
+    return text.split('\n') if count else []
+
+
+def parse_columns(lines, base_uri):
+    # The chunk's triples as columns: node ids in first-appearance order, literal (node, key, value) and edge
+    # (source, target, type) rows as int32 indexes into the chunk's node and key lists, and the literal values.
+    # These pickle as a few strings and arrays rather than a tuple per triple
+    node_index, literal_key_index, edge_key_index = {}, {}, {}
+    literal_nodes, literal_keys, values = [], [], []
+    sources, targets, edge_keys = [], [], []
+    errors = 0
+    prefix_length = len(base_uri)
+    for line in lines:
+        token = parse_line(line)
+        if not token:
+            if line.strip():
+                errors += 1
+            continue
+        kind, subject, predicate, obj = token
+        if not predicate.startswith(base_uri):
+            continue
+        key = predicate[prefix_length:]
+        source = node_index.setdefault(subject, len(node_index))
+        if kind == LITERAL:
+            literal_nodes.append(source)
+            literal_keys.append(literal_key_index.setdefault(key, len(literal_key_index)))
+            values.append(obj)
+        else:
+            sources.append(source)
+            targets.append(node_index.setdefault(obj, len(node_index)))
+            edge_keys.append(edge_key_index.setdefault(key, len(edge_key_index)))
+    return {
+        'nodes': _joined(list(node_index)), 'literal_keys': list(literal_key_index), 'edge_keys': list(edge_key_index),
+        'literals': (np.array(literal_nodes, dtype=np.int32), np.array(literal_keys, dtype=np.int32)),
+        'values': _joined(values),
+        'edges': (np.array(sources, dtype=np.int32), np.array(targets, dtype=np.int32), np.array(edge_keys, dtype=np.int32)),
+        'errors': errors,
+    }
+
+
+def _parse_range(task):
+    path, start, end, base_uri = task
+    if path.endswith('.gz'):
+        # Compressed parts cannot be split, so each is one task
+        with gzip.open(path, 'rb') as f:
+            return parse_columns(_split_lines(f.read()), base_uri)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return parse_columns(_split_lines(mm[start:end]), base_uri)
+
+
+def _append_value(attrs, key, value):
+    # A repeated predicate turns the attribute into a list, in file order
+    if key not in attrs:
+        attrs[key] = value
+    elif isinstance(attrs[key], list):
+        attrs[key].append(value)
+    else:
+        attrs[key] = [attrs[key], value]
+
+
+def _grouped_values(positions, values):
+    # Values ordered by node, then file order; a node with several values for the key gets them as one list
+    order = np.argsort(positions, kind='stable')
+    positions, values = positions[order], values[order]
+    starts = np.flatnonzero(np.concatenate(([True], positions[1:] != positions[:-1])))
+    if len(starts) == len(positions):
+        return positions, values.tolist()
+    ends = np.append(starts[1:], len(positions))
+    grouped = values[starts].tolist()
+    for i in np.flatnonzero(ends - starts > 1).tolist():
+        grouped[i] = values[starts[i]:ends[i]].tolist()
+    return positions[starts], grouped
+
+
+class NQuadsLoader:
+    def __init__(self, base_uri=BASE_URI, workers=None, chunk_size=64 * 1024 * 1024):
+        self.base_uri = base_uri
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.parse_errors = 0
+
+    def _chunk_ranges(self, path):
+        # Byte ranges of roughly chunk_size, each extended to the end of its last line
+        size = os.path.getsize(path)
+        if size == 0:
+            return []
+        ranges = []
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < size:
+                end = min(start + self.chunk_size, size)
+                if end < size:
+                    newline = mm.find(b'\n', end)
+                    end = size if newline < 0 else newline + 1
+                ranges.append((start, end))
+                start = end
+        return ranges
+
+    def _tasks(self, path):
+        # A directory is read as the part files of a bulk export, in name order
+        if os.path.isdir(path):
+            paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(('.nq', '.nq.gz'))]
+        else:
+            paths = [path]
+        tasks = []
+        for part_path in paths:
+            if part_path.endswith('.gz'):
+                tasks.append((part_path, None, None, self.base_uri))
+            else:
+                tasks.extend((part_path, start, end, self.base_uri) for start, end in self._chunk_ranges(part_path))
+        return tasks
+
+    def iter_chunks(self, path):
+        # Column dicts from parse_columns(), one per chunk and in file order
+        tasks = self._tasks(path)
+        self.parse_errors = 0
+        if self.workers == 1 or len(tasks) <= 1:
+            results = map(_parse_range, tasks)
+            for chunk in results:
+                self.parse_errors += chunk['errors']
+                yield chunk
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for chunk in executor.map(_parse_range, tasks):
+                self.parse_errors += chunk['errors']
+                yield chunk
+
+    def iter_records(self, path):
+        # (kind, subject, key, object) per triple, in file order within each kind of a chunk
+        for chunk in self.iter_chunks(path):
+            nodes, values = _unjoined(chunk['nodes']), _unjoined(chunk['values'])
+            literal_keys, edge_keys = chunk['literal_keys'], chunk['edge_keys']
+            for node, key, value in zip(*(column.tolist() for column in chunk['literals']), values):
+                yield LITERAL, nodes[node], literal_keys[key], value
+            for source, target, key in zip(*(column.tolist() for column in chunk['edges'])):
+                yield URI, nodes[source], edge_keys[key], nodes[target]
+
+    def load(self, path):
+        # Chunk columns go straight into the DiGraph's dicts: nodes in first-appearance order, repeated literals as
+        # lists, and a repeated edge keeping its place and its last type, as add_node()/add_edge() would leave them
+        G = nx.DiGraph()
+        node, succ, pred = G._node, G._succ, G._pred
+        for chunk in self.iter_chunks(path):
+            nodes = _unjoined(chunk['nodes'])
+            for node_id in nodes:
+                if node_id not in node:
+                    node[node_id] = {}
+                    succ[node_id] = {}
+                    pred[node_id] = {}
+            attrs = [node[node_id] for node_id in nodes]
+            literal_keys, edge_keys = chunk['literal_keys'], chunk['edge_keys']
+            for i, key, value in zip(*(column.tolist() for column in chunk['literals']), _unjoined(chunk['values'])):
+                _append_value(attrs[i], literal_keys[key], value)
+            for source, target, key in zip(*(column.tolist() for column in chunk['edges'])):
+                u, v = nodes[source], nodes[target]
+                data = succ[u].get(v)
+                if data is None:
+                    data = succ[u][v] = pred[v][u] = {}
+                data['type'] = edge_keys[key]
+        return G
+
+    def load_store(self, path):
+        # Same graph as load(), appended to the compact store builder a chunk at a time: chunk-local node indexes
+        # are mapped to store positions, and each attribute is gathered as positions and values until build time
+        builder = CompactGraphBuilder()
+        position = {}
+        attr_positions, attr_values = {}, {}
+        for chunk in self.iter_chunks(path):
+            nodes = _unjoined(chunk['nodes'])
+            known = len(position)
+            positions = np.fromiter((position.setdefault(node_id, len(position)) for node_id in nodes), dtype=np.int64, count=len(nodes))
+            builder.add_nodes([nodes[i] for i in np.flatnonzero(positions >= known).tolist()])
+
+            literal_nodes, literal_keys = chunk['literals']
+            values = np.empty(len(literal_nodes), dtype=object)
+            values[:] = _unjoined(chunk['values'])
+            for code, key in enumerate(chunk['literal_keys']):
+                of_key = literal_keys == code
+                attr_positions.setdefault(key, []).append(positions[literal_nodes[of_key]])
+                attr_values.setdefault(key, []).append(values[of_key])
+
+            sources, targets, edge_keys = chunk['edges']
+            builder.add_edges(positions[sources], positions[targets], edge_keys, chunk['edge_keys'])
+
+        for key in attr_positions:
+            builder.add_column(key, *_grouped_values(np.concatenate(attr_positions[key]), np.concatenate(attr_values[key])))
+        return builder.build()
@@ -0,0 +1,173 @@
+import os
+import pickle
+from array import array
+import numpy as np
+from similarity_index import normalise_name
+
+# Indexed fields per node type; 'name' is indexed by normalised token, the others by exact value
+SEARCH_FIELDS = {
+    'Identity': ('name', 'date_of_birth', 'nationality'),
+    'Reference': ('doc_number', 'doc_type'),
+    'Event': ('event_date',),
+}
+FIELDS = ('name', 'date_of_birth', 'nationality', 'doc_number', 'doc_type', 'event_date')
+# Node types add_islands() attaches to the island of the identity that links to them
+LINKED_TYPES = ('Reference', 'Event')
+
+
+def name_tokens(name):
+    return normalise_name(name).split()
+
+
+class IdentitySearchIndex:
+    def __init__(self):
+        # Nodes are numbered in the order they are added, so every posting list is already sorted
+        self.ids = []
+        self.position = {}
+        self.island_of = array('q')
+        self.postings = {field: {} for field in FIELDS}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _post(self, field, value, position):
+        postings = self.postings[field].get(value)
+        if postings is None:
+            postings = self.postings[field][value] = array('q')
+        if not postings or postings[-1] != position:
+            postings.append(position)
+
+    def add(self, node_id, attrs, island=None):
+        if node_id in self.position:
+            return False
+        fields = SEARCH_FIELDS.get(attrs.get('type'))
+        if fields is None:
+            return False
+        position = self.position[node_id] = len(self.ids)
+        self.ids.append(node_id)
+        self.island_of.append(-1 if island is None else island)
+        for field in fields:
+            values = attrs.get(field)
+            if values is None:
+                continue
+            for value in values if isinstance(values, list) else [values]:
+                if field == 'name':
+                    for token in name_tokens(value):
+                        self._post(field, token, position)
+                else:
+                    self._post(field, str(value).strip(), position)
+        return True
+
+    def add_islands(self, G, islands, first_island=0):
+        # Identities in each island, plus the references and events they link to. Every member is indexed before
+        # any successor, and only Reference and Event successors are attached, so an identity reached through a
+        # mislink (or a later island's identity) keeps its own island
+        for island_index, island in enumerate(islands, start=first_island):
+            for identity_id in island:
+                self.add(identity_id, G.nodes[identity_id], island_index)
+        for island_index, island in enumerate(islands, start=first_island):
+            for identity_id in island:
+                for neighbour in G.successors(identity_id):
+                    attrs = G.nodes[neighbour]
+                    if attrs.get('type') in LINKED_TYPES:
+                        self.add(neighbour, attrs, island_index)
+
+    def add_graph(self, G):
+        for node_id, attrs in G.nodes(data=True):
+            self.add(node_id, attrs)
+
+    def add_store(self, store):
+        # add_graph() for a CompactGraphStore, read column by column, so no networkx graph is built
+        if 'type' not in store.columns:
+            return
+        types = store.column('type')
+        columns = {}
+        for field in FIELDS:
+            if field in store.columns:
+                values = store.column(field)
+                if values.dtype != object:
+                    # Integer columns mark absent values with the dtype minimum
+                    present = values != np.iinfo(values.dtype).min
+                    values, raw = np.full(len(values), None, dtype=object), values
+                    values[present] = raw[present].tolist()
+                columns[field] = values
+        ids = store.node_id_list()
+        for i, node_type in enumerate(types.tolist()):
+            fields = SEARCH_FIELDS.get(node_type) if isinstance(node_type, str) else None
+            if fields is None:
+                continue
+            attrs = {'type': node_type}
+            for field in fields:
+                value = columns[field][i] if field in columns else None
+                if value is not None:
+                    attrs[field] = list(value) if isinstance(value, tuple) else value
+            self.add(ids[i], attrs)
+
+    def _postings(self, field, value):
+        if field == 'name':
+            tokens = name_tokens(value)
+            if not tokens:
+                return []
+            return [self.postings['name'].get(token, array('q')) for token in tokens]
+        if field not in self.postings:
+            raise ValueError(f"Unsupported search field: {field}")
+        return [self.postings[field].get(str(value).strip(), array('q'))]
+
+    def positions(self, **criteria):
+        # AND of all criteria: the shortest posting list is probed against the others with binary search
+        lists = [np.frombuffer(postings, dtype=np.int64) if len(postings) else np.array([], dtype=np.int64)
+                 for field, value in criteria.items() if value is not None
+                 for postings in self._postings(field, value)]
+        if not lists:
+            return np.array([], dtype=np.int64)
+        lists.sort(key=len)
+        result = lists[0]
+        for other in lists[1:]:
+            if not len(result):
+                break
+            found = np.searchsorted(other, result)
+            result = result[(found < len(other)) & (other[np.minimum(found, len(other) - 1)] == result)]
+        # A copy, so no view keeps the posting buffers exported (an exported array('q') cannot grow)
+        return result.copy()
+
+    def search(self, limit=100, **criteria):
+        return [self.ids[position] for position in self.positions(**criteria)[:limit].tolist()]
+
+    def search_islands(self, **criteria):
+        positions = self.positions(**criteria)
+        islands = np.array([self.island_of[position] for position in positions.tolist()], dtype=np.int64)
+        return sorted(set(islands[islands >= 0].tolist()))
+
+    @staticmethod
+    def parse_query(query):
+        # 'field:value' terms select a field; any other words are name tokens
+        criteria = {}
+        words = []
+        for term in query.split():
+            field, separator, value = term.partition(':')
+            if separator and field in FIELDS and value:
+                if field == 'name':
+                    words.append(value)
+                else:
+                    criteria[field] = value
+            else:
+                words.append(term)
+        if words:
+            criteria['name'] = ' '.join(words)
+        return criteria
+
+    def search_text(self, query, limit=100):
+        return self.search(limit=limit, **self.parse_query(query))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self.__dict__, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            index.__dict__.update(pickle.load(f))
+        return index
@@ -0,0 +1,129 @@
+import json
+import os
+import pickle
+import threading
+import networkx as nx
+
+MANIFEST = 'manifest.json'
+
+
+def empty_segment():
+    # nodes: [(id, attrs)]; edges: [(source, target, type)]; islands: new islands in order;
+    # members: [(island index, node id)] appended to earlier islands; labels: anomaly labels
+    return {'nodes': [], 'edges': [], 'islands': [], 'members': [], 'labels': []}
+
+
+class SegmentStore:
+    def __init__(self, path):
+        # A dataset directory of immutable pickle segments; manifest.json lists the live ones in replay order.
+        # One process writes at a time; within it, appends and compaction are serialised by a lock
+        self.path = path
+        self.manifest_path = os.path.join(path, MANIFEST)
+        self.lock = threading.Lock()
+        self.compaction = None
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self):
+        if not self.exists():
+            return {'segments': [], 'next_segment': 0, 'num_islands': 0}
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _write_segment(self, name, segment):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(segment, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def read_segment(self, name):
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _entry(name, kind, first_island, segment):
+        return {
+            'name': name, 'kind': kind, 'first_island': first_island, 'islands': len(segment['islands']),
+            'nodes': len(segment['nodes']), 'edges': len(segment['edges']), 'labels': len(segment['labels']),
+        }
+
+    def append(self, segment, kind='append'):
+        # The segment file is complete before the manifest names it, so readers never see a partial segment
+        with self.lock:
+            manifest = self.read_manifest()
+            name = f"segment-{manifest['next_segment']:06d}.pkl"
+            self._write_segment(name, segment)
+            manifest['segments'].append(self._entry(name, kind, manifest['num_islands'], segment))
+            manifest['next_segment'] += 1
+            manifest['num_islands'] += len(segment['islands'])
+            self._write_manifest(manifest)
+        return name
+
+    def iter_segments(self):
+        for entry in self.read_manifest()['segments']:
+            yield entry, self.read_segment(entry['name'])
+
+    def load(self):
+        # The merged view: every live segment replayed in manifest order
+        G = nx.DiGraph()
+        islands = []
+        labels = []
+        for _, segment in self.iter_segments():
+            G.add_nodes_from(segment['nodes'])
+            G.add_edges_from((u, v, {'type': edge_type}) for u, v, edge_type in segment['edges'])
+            islands.extend(segment['islands'])
+            for island_index, member in segment['members']:
+                islands[island_index].append(member)
+            labels.extend(segment['labels'])
+        return G, islands, labels
+
+    def compact(self):
+        # Merges the segments live when compaction starts into one; segments appended meanwhile are kept after it
+        entries = self.read_manifest()['segments']
+        if len(entries) < 2:
+            return None
+        # Repeated nodes and edges collapse the way replaying them into a DiGraph would
+        nodes = {}
+        edges = {}
+        merged = empty_segment()
+        for entry in entries:
+            segment = self.read_segment(entry['name'])
+            for node_id, attrs in segment['nodes']:
+                nodes.setdefault(node_id, {}).update(attrs)
+            for u, v, edge_type in segment['edges']:
+                edges[(u, v)] = edge_type
+            merged['islands'].extend(segment['islands'])
+            for island_index, member in segment['members']:
+                merged['islands'][island_index].append(member)
+            merged['labels'].extend(segment['labels'])
+        merged['nodes'] = list(nodes.items())
+        merged['edges'] = [(u, v, edge_type) for (u, v), edge_type in edges.items()]
+
+        with self.lock:
+            manifest = self.read_manifest()
+            name = f"segment-{manifest['next_segment']:06d}.pkl"
+            self._write_segment(name, merged)
+            compacted = {entry['name'] for entry in entries}
+            manifest['segments'] = [self._entry(name, 'compacted', 0, merged)] + \
+                [entry for entry in manifest['segments'] if entry['name'] not in compacted]
+            manifest['next_segment'] += 1
+            self._write_manifest(manifest)
+        for entry in entries:
+            os.remove(os.path.join(self.path, entry['name']))
+        return name
+
+    def compact_in_background(self):
+        if self.compaction is not None and self.compaction.is_alive():
+            return self.compaction
+        self.compaction = threading.Thread(target=self.compact, daemon=True)
+        self.compaction.start()
+        return self.compaction
@@ -0,0 +1,105 @@
+import heapq
+import unicodedata
+from difflib import SequenceMatcher
+
+SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(['aeiouyhw', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r']) for c in letters}
+
+
+def normalise_name(name):
+    if name.isascii():
+        return name.lower()
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def soundex(token):
+    letters = [c for c in token if c.isalpha()]
+    if not letters:
+        return token[:4]
+    if letters[0] not in SOUNDEX_CODES:
+        # Non-Latin scripts have no Soundex mapping; their first characters make the bucket
+        return ''.join(letters[:3])
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES[letters[0]]
+    for c in letters[1:]:
+        digit = SOUNDEX_CODES.get(c, '')
+        if digit and digit != '0' and digit != previous:
+            code += digit
+        if c not in 'hw':
+            previous = digit
+        if len(code) == 4:
+            break
+    return code.ljust(4, '0')
+
+
+def name_ngrams(name, n=3):
+    padded = f' {normalise_name(name)} '
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class IdentitySimilarityIndex:
+    def __init__(self, max_bucket=5000):
+        # Blocking buckets larger than max_bucket (very common names or dates) are not scanned
+        self.max_bucket = max_bucket
+        self.names = {}
+        self.island_of = {}
+        self.buckets = {}
+
+    def _blocking_keys(self, identity):
+        # Candidates must share the date of birth or the nationality (as in find_similar_identity),
+        # plus a phonetic code of the first or last name token
+        tokens = normalise_name(identity['name']).split()
+        phonetic = {soundex(tokens[0]), soundex(tokens[-1])} if tokens else set()
+        keys = set()
+        for code in phonetic:
+            keys.add(('dob', identity['date_of_birth'], code))
+            keys.add(('nationality', identity['nationality'], code))
+        return keys
+
+    def add(self, identity_id, identity, island=None):
+        self.names[identity_id] = identity['name']
+        self.island_of[identity_id] = island
+        for key in self._blocking_keys(identity):
+            self.buckets.setdefault(key, []).append(identity_id)
+
+    def add_islands(self, G, islands, first_island=0):
+        for island_index, island in enumerate(islands, start=first_island):
+            for identity_id in island:
+                self.add(identity_id, G.nodes[identity_id], island_index)
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, identity, exclude_island=None):
+        seen = set()
+        for key in self._blocking_keys(identity):
+            bucket = self.buckets.get(key, ())
+            if len(bucket) > self.max_bucket:
+                continue
+            for identity_id in bucket:
+                if identity_id not in seen and (exclude_island is None or self.island_of[identity_id] != exclude_island):
+                    seen.add(identity_id)
+        return seen
+
+    def query(self, identity, k=5, threshold=0.6, exclude_island=None, exclude_ids=()):
+        # Rank blocked candidates by trigram overlap, then confirm the best with SequenceMatcher
+        target_ngrams = name_ngrams(identity['name'])
+        scored = []
+        for identity_id in self.candidates(identity, exclude_island):
+            if identity_id in exclude_ids:
+                continue
+            ngrams = name_ngrams(self.names[identity_id])
+            overlap = len(target_ngrams & ngrams) / len(target_ngrams | ngrams)
+            scored.append((overlap, identity_id))
+
+        matches = []
+        for _, identity_id in heapq.nlargest(4 * k, scored):
+            ratio = SequenceMatcher(None, identity['name'], self.names[identity_id]).ratio()
+            if ratio >= threshold:
+                matches.append((ratio, identity_id))
+        matches.sort(key=lambda match: -match[0])
+        return matches[:k]
+
+    def most_similar(self, identity, threshold=0.6, exclude_island=None, exclude_ids=()):
+        matches = self.query(identity, k=1, threshold=threshold, exclude_island=exclude_island, exclude_ids=exclude_ids)
+        return matches[0][1] if matches else None
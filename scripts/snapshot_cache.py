@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from graph_store import CompactGraphStore
+
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+# Snapshots written by an older format lack arrays the app now reads, and are rebuilt on the next load
+SNAPSHOT_VERSION = 2
+
+
+class GraphSnapshotCache:
+    def __init__(self, cache_dir='./data/cache'):
+        self.cache_dir = cache_dir
+        self.hash_index_path = os.path.join(cache_dir, 'hash_index.json')
+
+    def _file_hash(self, path, stat):
+        # Content hashes are remembered per (path, size, mtime), so an unchanged file is never re-read
+        stat_key = f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'
+        index = {}
+        if os.path.exists(self.hash_index_path):
+            with open(self.hash_index_path, 'r') as f:
+                index = json.load(f)
+        if stat_key in index:
+            return index[stat_key]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        index[stat_key] = digest.hexdigest()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.hash_index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.hash_index_path)
+        return index[stat_key]
+
+    def key(self, source_path, base_uri):
+        # A directory of bulk-export parts is keyed by every part file in it
+        if os.path.isdir(source_path):
+            paths = [os.path.join(source_path, name) for name in sorted(os.listdir(source_path)) if name.endswith(('.nq', '.nq.gz'))]
+        else:
+            paths = [source_path]
+        parts = []
+        for path in paths:
+            stat = os.stat(path)
+            parts.extend([os.path.abspath(path), str(stat.st_size), str(stat.st_mtime_ns), self._file_hash(path, stat)])
+        parts.append(base_uri)
+        return hashlib.blake2b('|'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+    def _snapshot_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def artifact_path(self, source_path, base_uri, name):
+        # Extra files derived from a snapshot (such as search indexes) live in its directory and share its key
+        return os.path.join(self._snapshot_dir(self.key(source_path, base_uri)), name)
+
+    def load(self, source_path, base_uri, mmap=True):
+        # Returns (store, positions, arrays), with arrays the named per-node arrays passed to save()
+        snapshot_dir = self._snapshot_dir(self.key(source_path, base_uri))
+        meta_path = os.path.join(snapshot_dir, 'snapshot.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != SNAPSHOT_VERSION:
+            return None
+        mmap_mode = 'r' if mmap else None
+        store = CompactGraphStore.load(os.path.join(snapshot_dir, 'graph'), mmap=mmap)
+        positions = np.load(os.path.join(snapshot_dir, 'positions.npy'), mmap_mode=mmap_mode)
+        arrays = {name: np.load(os.path.join(snapshot_dir, f'{name}.npy'), mmap_mode=mmap_mode) for name in meta['arrays']}
+        return store, positions, arrays
+
+    def save(self, source_path, base_uri, store, positions, arrays=None):
+        key = self.key(source_path, base_uri)
+        snapshot_dir = self._snapshot_dir(key)
+        tmp_dir = snapshot_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        store.save(os.path.join(tmp_dir, 'graph'))
+        np.save(os.path.join(tmp_dir, 'positions.npy'), np.asarray(positions, dtype=np.float32))
+        arrays = arrays or {}
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.asarray(values))
+        # snapshot.json is written last; a directory without it is an incomplete snapshot
+        with open(os.path.join(tmp_dir, 'snapshot.json'), 'w') as f:
+            json.dump({'version': SNAPSHOT_VERSION, 'source': os.path.abspath(source_path), 'base_uri': base_uri,
+                       'nodes': store.num_nodes, 'edges': store.num_edges, 'arrays': sorted(arrays)}, f)
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        os.replace(tmp_dir, snapshot_dir)
+        return snapshot_dir
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class GridSpatialIndex:
+    def __init__(self, centres, radii, items_per_cell=16):
+        # Items are bucketed by the grid cell of their centre; queries widen the viewport by the largest radius,
+        # so an item whose disc reaches into the viewport from a neighbouring cell is still found
+        self.centres = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.max_radius = float(self.radii.max(initial=0.0))
+        count = len(self.centres)
+        if count == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0
+            self.shape = (1, 1)
+        else:
+            self.origin = self.centres.min(axis=0)
+            extent = np.maximum(self.centres.max(axis=0) - self.origin, 1e-9)
+            cells = max(1, count // items_per_cell)
+            self.cell_size = float(max(np.sqrt(extent[0] * extent[1] / cells), extent.max() / cells, 1e-9))
+            self.shape = tuple((np.floor(extent / self.cell_size).astype(np.int64) + 1).tolist())
+        cell = self._cell(self.centres)
+        keys = cell[:, 1] * self.shape[0] + cell[:, 0]
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def _cell(self, points):
+        cell = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cell, 0, np.array(self.shape) - 1)
+
+    def query(self, x0, x1, y0, y1):
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        lo = self._cell(np.array([[x0 - self.max_radius, y0 - self.max_radius]]))[0]
+        hi = self._cell(np.array([[x1 + self.max_radius, y1 + self.max_radius]]))[0]
+        ranges = []
+        for row in range(lo[1], hi[1] + 1):
+            start = np.searchsorted(self.sorted_keys, row * self.shape[0] + lo[0], side='left')
+            end = np.searchsorted(self.sorted_keys, row * self.shape[0] + hi[0], side='right')
+            ranges.append(self.order[start:end])
+        candidates = np.concatenate(ranges) if ranges else np.array([], dtype=np.int64)
+
+        centres, radii = self.centres[candidates], self.radii[candidates]
+        overlaps = (
+            (centres[:, 0] + radii >= x0) & (centres[:, 0] - radii <= x1)
+            & (centres[:, 1] + radii >= y0) & (centres[:, 1] - radii <= y1)
+        )
+        return np.sort(candidates[overlaps])
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+# Counts the statements in a request body the way the real endpoints would apply them
+SPARQL_STATEMENT = re.compile(r'\.\s*$', re.MULTILINE)
+GREMLIN_STEP = re.compile(r'\.add[VE]\(')
+GREMLIN_VERTEX_ID = re.compile(r"\.property\(id,'((?:[^'\\]|\\.)*)'\)")
+GREMLIN_VERTEX_REF = re.compile(r"\bV\('((?:[^'\\]|\\.)*)'\)")
+
+
+class StandInEndpoint:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, latency_per_statement=0.0, failure_rate=0.0,
+                 max_statements=None, keep_statements=False, check_vertices=False, seed=0):
+        # A local HTTP stand-in for a SPARQL update or Gremlin endpoint: accepts POSTed batches over keep-alive
+        # connections, with optional simulated latency, transient 503 failures and a 413 batch size limit.
+        # check_vertices tracks Gremlin vertex IDs and fails a traversal that looks up one never added, as fail() would
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_per_statement = latency_per_statement
+        self.failure_rate = failure_rate
+        self.max_statements = max_statements
+        self.keep_statements = keep_statements
+        self.check_vertices = check_vertices
+        self.vertices = set()
+        self.random = random.Random(seed)
+        self.statements = 0
+        self.requests = 0
+        self.failures = 0
+        self.connections = 0
+        self.received = []
+        self.writers = set()
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/'
+
+    def _apply(self, content_type, body):
+        # Returns (status, error payload, statement count, items to keep, vertex IDs added)
+        text = body.decode('utf-8')
+        if content_type.startswith('application/sparql-update'):
+            if not text.lstrip().startswith('INSERT DATA'):
+                return 400, {'error': 'Only INSERT DATA updates are supported'}, 0, [], []
+            inner = text[text.index('{') + 1:text.rindex('}')]
+            statements = [line for line in inner.splitlines() if SPARQL_STATEMENT.search(line)]
+            return 200, None, len(statements), statements, []
+        script = json.loads(text).get('gremlin', '')
+        if not script.startswith('g'):
+            return 400, {'error': 'Expected a traversal starting with g'}, 0, [], []
+        added = GREMLIN_VERTEX_ID.findall(script) if self.check_vertices else []
+        if self.check_vertices:
+            known = self.vertices.union(added)
+            missing = next((vertex for vertex in GREMLIN_VERTEX_REF.findall(script) if vertex not in known), None)
+            if missing is not None:
+                return 500, {'error': f'FailStep: missing vertex {missing}'}, 0, [], []
+        return 200, None, len(GREMLIN_STEP.findall(script)), [script], added
+
+    async def _respond(self, writer, status, payload):
+        reason = {200: 'OK', 400: 'Bad Request', 413: 'Payload Too Large', 500: 'Internal Server Error',
+                  503: 'Service Unavailable'}[status]
+        body = json.dumps(payload).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                     f'Connection: keep-alive\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+
+                status, payload, count, kept, added = self._apply(headers.get('content-type', ''), body)
+                if status == 200:
+                    if self.max_statements is not None and count > self.max_statements:
+                        status, payload = 413, {'error': f'More than {self.max_statements} statements in one request'}
+                    elif self.random.random() < self.failure_rate:
+                        status, payload = 503, {'error': 'Simulated overload'}
+                await asyncio.sleep(self.latency + self.latency_per_statement * count)
+                if status == 200:
+                    self.statements += count
+                    self.vertices.update(added)
+                    if self.keep_statements:
+                        self.received.extend(kept)
+                    payload = {'status': 'ok', 'statements': count}
+                else:
+                    self.failures += 1
+                await self._respond(writer, status, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def start_async(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.url
+
+    def start(self):
+        # Serves from a background thread with its own event loop; returns the endpoint URL
+        ready = threading.Event()
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start_async())
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=serve, daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.url
+
+    def stop(self):
+        if self.loop is None:
+            return
+
+        async def shutdown():
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    endpoint = StandInEndpoint(port=8182, latency=0.005)
+    print(f"Stand-in endpoint listening on {endpoint.start()}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{endpoint.requests} requests, {endpoint.statements} statements, {endpoint.failures} failures")
+    except KeyboardInterrupt:
+        endpoint.stop()
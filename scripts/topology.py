@@ -0,0 +1,88 @@
+import numpy as np
+
+SIZE_DISTRIBUTIONS = ('uniform', 'zipf', 'lognormal')
+# Spawn keys under SeedSequence(seed): island shard i draws from (SHARD_STREAM, i) and the shared reference pool
+# from (SHARED_POOL_STREAM,). Keys of different lengths never assemble the same entropy, whatever the shard count
+SHARD_STREAM = 0
+SHARED_POOL_STREAM = 1
+# Changes whenever the seed-to-stream mapping does, so resumed runs never mix chunks drawn both ways
+STREAM_VERSION = 2
+
+
+def seeded_rng(seed, *stream):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=stream))
+
+
+class IslandTopology:
+    def __init__(self, size_distribution='uniform', min_identities=2, max_identities=5, size_exponent=2.0,
+                 size_sigma=1.0, references_per_island=5, events_per_island=2, edge_probabilities=None,
+                 mean_out_degree=None, hub_bias=0.0, shared_references=0, shared_reference_probability=0.0,
+                 shared_reference_exponent=1.0):
+        # Shape of generated islands for the batched and parallel generators. The defaults reproduce the original
+        # shape exactly (2-5 identities, 5 references, 2 events, every edge type with probability 0.5):
+        # - size_distribution: 'uniform' (the original rule), 'zipf' (P(k) ~ k^-size_exponent) or 'lognormal' (size_sigma), clipped to
+        #   [min_identities, max_identities]
+        # - edge_probabilities: per edge type chance of an edge from each identity; mean_out_degree rescales them to
+        #   that expected out-degree and draws Poisson edge counts, so degrees above one edge per type are possible
+        # - hub_bias: share of identity-to-identity edges pointing at the island's base identity
+        # - shared_references: size of a pool of Reference nodes cited across islands; each reference edge picks
+        #   one with shared_reference_probability, by Zipf popularity, which makes hubs and large components
+        if size_distribution not in SIZE_DISTRIBUTIONS:
+            raise ValueError(f"Unsupported island size distribution: {size_distribution}")
+        if min_identities < 1 or max_identities < min_identities:
+            raise ValueError("Island sizes need 1 <= min_identities <= max_identities")
+        if references_per_island < 1 or events_per_island < 1:
+            raise ValueError("Every island needs at least one reference and one event")
+        if size_distribution == 'zipf' and size_exponent <= 1:
+            raise ValueError("A Zipf size distribution needs size_exponent > 1")
+        if shared_reference_probability > 0 and shared_references == 0:
+            raise ValueError("shared_reference_probability needs a shared_references pool")
+        self.size_distribution = size_distribution
+        self.min_identities = min_identities
+        self.max_identities = max_identities
+        self.size_exponent = size_exponent
+        self.size_sigma = size_sigma
+        self.references_per_island = references_per_island
+        self.events_per_island = events_per_island
+        self.edge_probabilities = dict(edge_probabilities or {})
+        self.mean_out_degree = mean_out_degree
+        self.hub_bias = hub_bias
+        self.shared_references = shared_references
+        self.shared_reference_probability = shared_reference_probability
+        self.shared_reference_exponent = shared_reference_exponent
+        self._popularity = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_popularity'] = None
+        return state
+
+    def to_dict(self):
+        return {name: value for name, value in self.__dict__.items() if not name.startswith('_')}
+
+    def sample_sizes(self, rng, n):
+        # Identities per island, base identity included
+        if self.size_distribution == 'zipf':
+            sizes = self.min_identities - 1 + rng.zipf(self.size_exponent, size=n)
+        elif self.size_distribution == 'lognormal':
+            sizes = self.min_identities + np.floor(rng.lognormal(0.0, self.size_sigma, size=n) - 1).astype(np.int64)
+        else:
+            # The original rule: one more variant count than fits is drawn and clipped, so the largest size is twice as likely
+            return np.minimum(rng.integers(self.min_identities - 1, self.max_identities + 1, size=n), self.max_identities - 1) + 1
+        return np.clip(sizes, self.min_identities, self.max_identities).astype(np.int64)
+
+    def edge_rates(self, edge_types):
+        rates = np.array([self.edge_probabilities.get(edge_type, 0.5) for edge_type in edge_types], dtype=np.float64)
+        if self.mean_out_degree is not None and rates.sum() > 0:
+            rates *= self.mean_out_degree / rates.sum()
+        return rates
+
+    def sample_shared(self, rng, n):
+        # Indices into the shared reference pool, rank r drawn with weight r^-shared_reference_exponent
+        if self._popularity is None:
+            weights = np.arange(1, self.shared_references + 1, dtype=np.float64) ** -self.shared_reference_exponent
+            self._popularity = np.cumsum(weights) / weights.sum()
+        return np.minimum(np.searchsorted(self._popularity, rng.random(n), side='right'), self.shared_references - 1)
+
+    def shared_rng(self, seed):
+        return seeded_rng(seed, SHARED_POOL_STREAM)
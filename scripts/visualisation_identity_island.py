@@ -1,71 +1,475 @@
+import os
+import threading
 import networkx as nx
-import re
+import numpy as np
 import dash
+import flask
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
 from IPython.display import IFrame
+from nquads_loader import NQuadsLoader
+from graph_store import CompactGraphStore
+from snapshot_cache import GraphSnapshotCache
+from island_layout import IslandLayoutEngine
+from spatial_index import GridSpatialIndex
+from search_index import IdentitySearchIndex
+from instrumentation import Instrumentation, timed
+
+# customdata kinds, and the trace order of the webgl figure
+NODE = 0
+EDGE = 1
+ISLAND = 2
+BASE_TRACES = (0, 1, 2)
+OVERLAY_EDGE_TRACE = 3
+OVERLAY_NODE_TRACE = 4
+
 
 class IdentityIslandsApp:
-    def __init__(self, nquads_file, base_uri="http://syntetic_identity_island.org/"):
-        self.G = self.load_nquads_to_graph(nquads_file, base_uri)
-        self.pos = nx.spring_layout(self.G)
-        nx.set_node_attributes(self.G, self.pos, 'pos')
+    def __init__(self, nquads_file, base_uri="http://syntetic_identity_island.org/", loader_workers=None,
+                 layout_workers=None, cache_dir='./data/cache', background=True, render_mode='webgl',
+                 lod=True, max_points=20000, max_search_results=50, instrumentation=None, stats_endpoint=False):
+        if render_mode not in ('webgl', 'svg'):
+            raise ValueError(f"Unsupported render mode: {render_mode}")
+        self.render_mode = render_mode
+        # Above max_points nodes (webgl mode only) the app starts from an island overview and draws full detail
+        # only for the islands in the current viewport
+        self.lod = lod and render_mode == 'webgl'
+        self.max_points = max_points
+        self.max_search_results = max_search_results
+        self.search_index = None
+        self.nquads_file = nquads_file
+        self.base_uri = base_uri
+        self.loader_workers = loader_workers
+        self.snapshot_cache = GraphSnapshotCache(cache_dir) if cache_dir else None
+        self.layout_engine = IslandLayoutEngine(
+            workers=layout_workers, cache_path=os.path.join(cache_dir, 'component_layouts.pkl') if cache_dir else None
+        )
+        # The app renders from the store's arrays; networkx (self.G) and the position dict (self.pos) are built on
+        # first use, which only the svg figure and a missing search index artifact need
+        self._G = None
+        self._pos = None
+        self.lazy_lock = threading.RLock()
+        self.store = None
+        self.num_nodes = 0
+        self.base_figure = None
+        self.load_error = None
+        self.loaded = threading.Event()
+        self.parse_errors = 0
+        # Load stage and callback timers; stats_endpoint serves them as JSON at /stats
+        self.instrumentation = instrumentation or Instrumentation()
+        self.instrumentation.gauge('app.nodes', lambda: self.store.num_nodes if self.store is not None else 0)
+        self.instrumentation.gauge('app.edges', lambda: self.store.num_edges if self.store is not None else 0)
+        self.instrumentation.gauge('app.parse_errors', lambda: self.parse_errors)
         self.app = dash.Dash(__name__)
         self.setup_layout()
         self.setup_callbacks()
+        if stats_endpoint:
+            self.setup_stats_endpoint()
+        # The server can bind its port straight away; the figure is swapped in once loading finishes
+        if background:
+            threading.Thread(target=self.load_data, daemon=True).start()
+        else:
+            self.load_data()
+
+    @timed('load')
+    def load_data(self):
+        stage = self.instrumentation.stage
+        try:
+            with stage('load.snapshot'):
+                snapshot = self.snapshot_cache.load(self.nquads_file, self.base_uri) if self.snapshot_cache else None
+            self.instrumentation.count('load.snapshot_hits' if snapshot is not None else 'load.snapshot_misses')
+            if snapshot is not None:
+                # Everything below reads the memory-mapped arrays directly
+                self.store, positions, arrays = snapshot
+                island_of = arrays['island_of']
+            else:
+                G = self.load_nquads_to_graph(self.nquads_file, self.base_uri)
+                with stage('load.layout'):
+                    pos = self.layout_engine.layout(G)
+                with stage('load.store'):
+                    self.store = CompactGraphStore.from_networkx(G)
+                    positions = np.array([pos[node] for node in G]).reshape(-1, 2)
+                    island_of = self.component_labels(G)
+                nx.set_node_attributes(G, pos, 'pos')
+                self._G, self._pos = G, pos
+                if self.snapshot_cache:
+                    with stage('load.snapshot_save'):
+                        self.snapshot_cache.save(self.nquads_file, self.base_uri, self.store, positions, {'island_of': island_of})
+            self.prepare_render_data(positions)
+            self.prepare_islands(island_of)
+            self.base_figure = self.overview_figure() if self.lod_active else self.create_figure()
+            # The figure is usable from here; search waits for its index in ensure_search_index()
+            self.loaded.set()
+            self.ensure_search_index()
+        except Exception as e:
+            self.load_error = e
+            raise
+        finally:
+            self.loaded.set()
+
+    @property
+    def G(self):
+        if self._G is None and self.store is not None:
+            with self.lazy_lock:
+                if self._G is None:
+                    G = self.store.to_networkx()
+                    nx.set_node_attributes(G, self.pos, 'pos')
+                    self._G = G
+        return self._G
 
+    @property
+    def pos(self):
+        if self._pos is None and self.store is not None:
+            self._pos = dict(zip(self.store.node_id_list(), self.node_xy.tolist()))
+        return self._pos
+
+    def component_labels(self, G):
+        # Island label per node, in graph (and store) order: the weakly connected components
+        index = {node: i for i, node in enumerate(G)}
+        labels = np.zeros(len(index), dtype=np.int64)
+        for island, members in enumerate(nx.weakly_connected_components(G)):
+            labels[[index[node] for node in members]] = island
+        return labels
+
+    @timed('load.parse')
     def load_nquads_to_graph(self, nquads_file, base_uri):
-        G = nx.DiGraph()
-        pattern_literal = re.compile(r'<(.*?)>\s+<(.*?)>\s+"(.*?)"\s*(?:\^\^<.*?>)?\s*\.\s*')
-        pattern_uri = re.compile(r'<(.*?)>\s+<(.*?)>\s+<(.*?)>\s*\.\s*')
-        
-        with open(nquads_file, 'r') as f:
-            for line in f:
-                match_literal = pattern_literal.match(line)
-                match_uri = pattern_uri.match(line)
-                if match_literal:
-                    subject = match_literal.group(1)
-                    predicate = match_literal.group(2)
-                    obj = match_literal.group(3)
-                    
-                    if predicate.startswith(base_uri):
-                        pred_key = predicate[len(base_uri):]
-
-                        # Ensure the subject node exists
-                        if subject not in G:
-                            G.add_node(subject)
-                        
-                        # Add attributes to the node
-                        if pred_key not in G.nodes[subject]:
-                            G.nodes[subject][pred_key] = obj
-                        else:
-                            if isinstance(G.nodes[subject][pred_key], list):
-                                G.nodes[subject][pred_key].append(obj)
-                            else:
-                                G.nodes[subject][pred_key] = [G.nodes[subject][pred_key], obj]
-                
-                elif match_uri:
-                    subject = match_uri.group(1)
-                    predicate = match_uri.group(2)
-                    obj = match_uri.group(3)
-                    
-                    if predicate.startswith(base_uri):
-                        pred_key = predicate[len(base_uri):]
-
-                        # Ensure the subject node exists
-                        if subject not in G:
-                            G.add_node(subject)
-                        # Ensure the object node exists if it's also a subject
-                        if obj not in G:
-                            G.add_node(obj)
-                        
-                        # Add an edge
-                        G.add_edge(subject, obj, type=pred_key)
-        
+        loader = NQuadsLoader(base_uri, workers=self.loader_workers)
+        G = loader.load(nquads_file)
+        self.parse_errors = loader.parse_errors
         return G
 
+    @timed('load.render_data')
+    def prepare_render_data(self, positions):
+        # Everything the figure needs as arrays over the store's node and edge order: node and edge positions,
+        # degrees and edge hover text. The CSR adjacency is already grouped by source, so it is the out-edge index
+        store = self.store
+        self.num_nodes = store.num_nodes
+        self.node_xy = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+
+        self.edge_src = store.edge_sources()
+        self.edge_dst = np.asarray(store.indices, dtype=np.int64)
+        type_codes = np.asarray(store.edge_type_codes, dtype=np.int64)
+        type_names = np.empty(len(store.edge_types), dtype=object)
+        type_names[:] = ['N/A' if edge_type is None else edge_type for edge_type in store.edge_types]
+        self.edge_type = type_names[type_codes]
+        self.edge_text = np.array([f"Type: {edge_type}" for edge_type in type_names] or [''], dtype=object)[type_codes]
+
+        self.out_degree = np.diff(store.indptr)
+        self.degree = store.degrees()
+        self.out_edge_order = np.arange(store.num_edges)
+        self.out_offsets = np.asarray(store.indptr)
+
+    def node_hover_text(self, nodes):
+        # Formatted only for the nodes a figure draws, from whole columns of the store: no per-node attribute dicts,
+        # and categorical values are formatted once per category
+        store = self.store
+        nodes = np.asarray(nodes, dtype=np.int64)
+        columns = [store.column_text(name, nodes, f'<br>{name}: ') for name in store.columns]
+        xy = self.node_xy[nodes]
+        rows = zip(store.node_id_list(nodes), self.degree[nodes].tolist(), self.out_degree[nodes].tolist(),
+                   xy[:, 0].tolist(), xy[:, 1].tolist(), *columns)
+        text = np.empty(len(nodes), dtype=object)
+        text[:] = [f"ID: {node_id}<br>degree: {degree}<br>neighbors: {out_degree}{''.join(attrs)}<br>pos: [{x:.8g} {y:.8g}]"
+                   for node_id, degree, out_degree, x, y, *attrs in rows]
+        return text
+
+    def node_name(self, index):
+        return self.store.node_id(int(index))
+
+    def node_indices(self, node_ids):
+        return self.store.index_of(node_ids)
+
+    @property
+    def lod_active(self):
+        return self.lod and self.num_nodes > self.max_points
+
+    def node_attribute(self, key):
+        if key not in self.store.columns:
+            return np.full(self.num_nodes, None, dtype=object)
+        return self.store.column(key)
+
+    @timed('load.islands')
+    def prepare_islands(self, island_of):
+        # Islands are the weakly connected components, labelled per node when the graph was parsed: membership
+        # (CSR over node indices), centre, radius, and a spatial index over the centres for viewport queries
+        self.island_of = np.asarray(island_of, dtype=np.int64)
+        num_islands = int(self.island_of.max(initial=-1)) + 1
+        self.island_size = np.bincount(self.island_of, minlength=num_islands)
+        self.island_node_order = np.argsort(self.island_of, kind='stable')
+        self.island_offsets = np.concatenate([[0], np.cumsum(self.island_size)])
+        self.island_xy = np.column_stack([
+            np.bincount(self.island_of, weights=self.node_xy[:, axis], minlength=num_islands) for axis in (0, 1)
+        ]) / np.maximum(self.island_size, 1)[:, None]
+        self.island_radius = np.zeros(num_islands)
+        np.maximum.at(self.island_radius, self.island_of, np.linalg.norm(self.node_xy - self.island_xy[self.island_of], axis=1))
+        self.island_index = GridSpatialIndex(self.island_xy, self.island_radius)
+
+        # Anomaly indicator: IDENTITY_EQUIVALENCE links between identities whose date of birth or nationality disagree
+        date_of_birth = self.node_attribute('date_of_birth')
+        nationality = self.node_attribute('nationality')
+        suspicious = (self.edge_type == 'IDENTITY_EQUIVALENCE') & (
+            (date_of_birth[self.edge_src] != date_of_birth[self.edge_dst])
+            | (nationality[self.edge_src] != nationality[self.edge_dst])
+        )
+        self.island_anomalies = np.bincount(self.island_of[self.edge_src[suspicious]], minlength=num_islands)
+
+    def island_nodes(self, islands):
+        ranges = [self.island_node_order[self.island_offsets[i]:self.island_offsets[i + 1]] for i in islands]
+        return np.concatenate(ranges) if ranges else np.array([], dtype=np.int64)
+
+    @timed('figure.overview')
+    def overview_figure(self, islands=None, viewport=None):
+        # One glyph per island, sized by node count and coloured by suspicious equivalence links
+        if islands is None:
+            islands = np.arange(len(self.island_size))
+        if len(islands) > self.max_points:
+            # Keep the islands with the most suspicious links, then the largest
+            rank = np.lexsort((-self.island_size[islands], -self.island_anomalies[islands]))
+            islands = np.sort(islands[rank[:self.max_points]])
+        size = self.island_size[islands]
+        anomalies = self.island_anomalies[islands]
+        island_trace = go.Scattergl(
+            x=self.island_xy[islands, 0],
+            y=self.island_xy[islands, 1],
+            text=[f"Island {i}<br>nodes: {n}<br>suspicious equivalence links: {a}" for i, n, a in zip(islands.tolist(), size.tolist(), anomalies.tolist())],
+            customdata=np.column_stack([np.full(len(islands), ISLAND), islands]),
+            mode='markers',
+            hoverinfo='text',
+            marker=dict(
+                showscale=True,
+                colorscale='Reds',
+                color=anomalies,
+                cmin=0,
+                cmax=max(int(self.island_anomalies.max(initial=0)), 1),
+                size=np.clip(4 + 2 * np.sqrt(size), 4, 40),
+                line=dict(width=0.5, color='#888'),
+                colorbar=dict(
+                    thickness=15,
+                    title=dict(text='Suspicious Links', side='right'),
+                    xanchor='left'
+                )
+            )
+        )
+        fig = go.Figure(data=[island_trace], layout=self.figure_layout())
+        fig.update_layout(width=1800, height=1000)
+        return self.set_viewport(fig, viewport)
+
+    def set_viewport(self, fig, viewport):
+        if viewport is not None:
+            fig.update_xaxes(range=list(viewport[:2]))
+            fig.update_yaxes(range=list(viewport[2:]))
+        return fig
+
+    @timed('figure.viewport')
+    def viewport_figure(self, viewport):
+        # Full detail for the islands overlapping the viewport while that stays within max_points nodes,
+        # otherwise the overview restricted to the viewport
+        islands = self.island_index.query(*viewport)
+        if self.island_size[islands].sum() > self.max_points:
+            return self.overview_figure(islands, viewport)
+        nodes = self.island_nodes(islands)
+        return self.set_viewport(self.detail_figure(nodes, self.out_edges(nodes)), viewport)
+
+    def relayout_figure(self, relayoutData):
+        if not self.lod_active or not relayoutData:
+            return dash.no_update
+        if relayoutData.get('xaxis.autorange') or relayoutData.get('autosize'):
+            return self.base_figure
+        keys = ('xaxis.range[0]', 'xaxis.range[1]', 'yaxis.range[0]', 'yaxis.range[1]')
+        if not all(key in relayoutData for key in keys):
+            return dash.no_update
+        return self.viewport_figure([float(relayoutData[key]) for key in keys])
+
+    def island_viewport(self, island):
+        margin = max(self.island_radius[island] * 1.2, 1.0)
+        x, y = self.island_xy[island]
+        return [x - margin, x + margin, y - margin, y + margin]
+
+    def island_figure(self, island):
+        return self.viewport_figure(self.island_viewport(island))
+
+    def ensure_search_index(self):
+        with self.lazy_lock:
+            if self.search_index is None:
+                self.prepare_search_index()
+        return self.search_index
+
+    @timed('load.search_index')
+    def prepare_search_index(self):
+        # The index is kept next to the graph snapshot, so it is only built once per dataset
+        path = self.snapshot_cache.artifact_path(self.nquads_file, self.base_uri, 'search_index.pkl') if self.snapshot_cache else None
+        if path and os.path.exists(path):
+            self.search_index = IdentitySearchIndex.load(path)
+            return
+        # Built from the store's columns, so a snapshot hit still never builds self.G
+        self.search_index = IdentitySearchIndex()
+        self.search_index.add_store(self.store)
+        if path:
+            self.search_index.save(path)
+
+    @timed('figure.search')
+    def search_figure(self, query, last_clicked_node):
+        # Jumps to the island of the first match and highlights up to max_search_results matches
+        if not self.loaded.is_set() or self.base_figure is None:
+            return dash.no_update, last_clicked_node, 'Still loading...'
+        if not query or not query.strip():
+            return dash.no_update, last_clicked_node, ''
+        matches = self.ensure_search_index().search_text(query, limit=self.max_search_results)
+        if not matches:
+            return dash.no_update, last_clicked_node, f'No matches for "{query}"'
+        nodes = self.node_indices(matches)
+        island = int(self.island_of[nodes[0]])
+        status = f'{len(matches)} match(es), showing island {island}'
+
+        if self.render_mode == 'svg':
+            return self.create_figure(highlight_nodes=matches), matches[0], status
+        viewport = self.island_viewport(island)
+        if not self.lod_active:
+            return self.highlight_patch(nodes, viewport), matches[0], status
+        fig = self.viewport_figure(viewport)
+        if len(fig.data) > OVERLAY_NODE_TRACE:
+            for trace, updates in self.highlight_updates(nodes).items():
+                fig.data[trace].update(updates)
+        return fig, matches[0], status
+
+    def figure_layout(self):
+        return go.Layout(
+            title=dict(text='Identity Islands', font=dict(size=16)),
+            showlegend=False,
+            hovermode='closest',
+            margin=dict(b=20, l=5, r=5, t=40),
+            xaxis=dict(showgrid=False, zeroline=False),
+            yaxis=dict(showgrid=False, zeroline=False)
+        )
+
+    @timed('figure.build')
     def create_figure(self, highlight_nodes=None):
+        if self.render_mode == 'webgl':
+            return self.create_figure_webgl(highlight_nodes)
+        return self.create_figure_svg(highlight_nodes)
+
+    def neighbourhood(self, node_indices):
+        # Selected nodes, their successors, and the edges among them, found through the out-edge index in O(degree)
+        selected = np.unique(np.asarray(node_indices, dtype=np.int64))
+        nodes = np.unique(np.concatenate([selected, self.edge_dst[self.out_edges(selected)]]))
+        candidates = self.out_edges(nodes)
+        edges = candidates[np.isin(self.edge_dst[candidates], nodes)]
+        return nodes, edges
+
+    def out_edges(self, node_indices):
+        ranges = [self.out_edge_order[self.out_offsets[i]:self.out_offsets[i + 1]] for i in node_indices]
+        return np.concatenate(ranges) if ranges else np.array([], dtype=np.int64)
+
+    def webgl_traces(self, nodes, edges, highlight=False):
+        # Edge lines, edge hover points and nodes as three Scattergl traces; every point carries (kind, index)
+        # as customdata so clicks resolve directly to a node or edge
+        src_xy = self.node_xy[self.edge_src[edges]]
+        dst_xy = self.node_xy[self.edge_dst[edges]]
+        segments = np.full((len(edges), 3, 2), np.nan)
+        segments[:, 0] = src_xy
+        segments[:, 1] = dst_xy
+
+        edge_trace = go.Scattergl(
+            x=segments[:, :, 0].ravel(),
+            y=segments[:, :, 1].ravel(),
+            line=dict(width=2, color='#d62728') if highlight else dict(width=1, color='#888'),
+            mode='lines',
+            hoverinfo='none'
+        )
+
+        midpoints = (src_xy + dst_xy) / 2
+        hover_edge_trace = go.Scattergl(
+            x=midpoints[:, 0],
+            y=midpoints[:, 1],
+            mode='markers',
+            marker=dict(size=0.5, color='#888'),
+            hoverinfo='text',
+            text=self.edge_text[edges],
+            customdata=np.column_stack([np.full(len(edges), EDGE), edges]),
+            hovertemplate='%{text}<extra></extra>'
+        )
+
+        degree = self.degree[nodes]
+        marker = dict(
+            colorscale='Viridis_r',
+            color=degree,
+            cmin=self.degree.min(initial=0),
+            cmax=self.degree.max(initial=0),
+            size=10 + 2 * degree
+        )
+        if highlight:
+            marker['line'] = dict(width=2, color='#d62728')
+        else:
+            marker['showscale'] = True
+            marker['colorbar'] = dict(
+                thickness=15,
+                title=dict(text='Node Connections', side='right'),
+                xanchor='left'
+            )
+        node_trace = go.Scattergl(
+            x=self.node_xy[nodes, 0],
+            y=self.node_xy[nodes, 1],
+            text=self.node_hover_text(nodes),
+            customdata=np.column_stack([np.full(len(nodes), NODE), nodes]),
+            mode='markers',
+            hoverinfo='text',
+            marker=marker
+        )
+        return edge_trace, hover_edge_trace, node_trace
+
+    def create_figure_webgl(self, highlight_nodes=None):
+        if highlight_nodes is None:
+            nodes = np.arange(self.num_nodes)
+            edges = np.arange(len(self.edge_src))
+        else:
+            nodes, edges = self.neighbourhood(self.node_indices(highlight_nodes))
+        return self.detail_figure(nodes, edges)
+
+    def detail_figure(self, nodes, edges):
+        edge_trace, hover_edge_trace, node_trace = self.webgl_traces(nodes, edges)
+        # Overlay traces stay empty here; highlight_patch() fills them in on clicks
+        overlay_edge_trace, _, overlay_node_trace = self.webgl_traces(nodes[:0], edges[:0], highlight=True)
+        fig = go.Figure(data=[edge_trace, hover_edge_trace, node_trace, overlay_edge_trace, overlay_node_trace],
+                        layout=self.figure_layout())
+        fig.update_layout(width=1800, height=1000)
+        return fig
+
+    def highlight_updates(self, node_indices=None):
+        # Trace property updates that dim the full traces and draw the neighbourhood in the overlay traces
+        if node_indices is None:
+            nodes = np.array([], dtype=np.int64)
+            edges = np.array([], dtype=np.int64)
+        else:
+            nodes, edges = self.neighbourhood(node_indices)
+        updates = {trace: {'opacity': 1.0 if node_indices is None else 0.15} for trace in BASE_TRACES}
+        edge_trace, _, node_trace = self.webgl_traces(nodes, edges, highlight=True)
+        for trace, overlay in ((OVERLAY_EDGE_TRACE, edge_trace), (OVERLAY_NODE_TRACE, node_trace)):
+            updates[trace] = {key: [] if overlay[key] is None else np.asarray(overlay[key]).tolist() for key in ('x', 'y', 'text', 'customdata')}
+            if overlay.marker.color is not None:
+                updates[trace]['marker'] = {
+                    'color': np.asarray(overlay.marker.color).tolist(),
+                    'size': np.asarray(overlay.marker.size).tolist(),
+                }
+        return updates
+
+    @timed('figure.highlight_patch')
+    def highlight_patch(self, node_indices=None, viewport=None):
+        # A delta against the figure in the browser, so the payload depends on the neighbourhood size only
+        patch = dash.Patch()
+        for trace, updates in self.highlight_updates(node_indices).items():
+            for key, value in updates.items():
+                if isinstance(value, dict):
+                    for subkey, subvalue in value.items():
+                        patch['data'][trace][key][subkey] = subvalue
+                else:
+                    patch['data'][trace][key] = value
+        if viewport is not None:
+            patch['layout']['xaxis']['range'] = list(viewport[:2])
+            patch['layout']['yaxis']['range'] = list(viewport[2:])
+        return patch
+
+    def create_figure_svg(self, highlight_nodes=None):
         edge_trace = []
         hover_edge_trace = []
 
@@ -76,7 +480,7 @@ class IdentityIslandsApp:
             for node in highlight_nodes:
                 nodes_to_highlight.update(set(self.G.neighbors(node)))
 
-        for edge in self.G.edges(data=True):
+        for edge_index, edge in enumerate(self.G.edges(data=True)):
             if highlight_nodes is None or (edge[0] in nodes_to_highlight and edge[1] in nodes_to_highlight):
                 x0, y0 = self.pos[edge[0]]
                 x1, y1 = self.pos[edge[1]]
@@ -101,6 +505,7 @@ class IdentityIslandsApp:
                         marker=dict(size=0.5, color='#888'),
                         hoverinfo='text',
                         text=[f"Type: {edge[2].get('type', 'N/A')}"],
+                        customdata=[[EDGE, edge_index]],
                         hovertemplate='%{text}<extra></extra>',
                         visible=True
                     )
@@ -111,10 +516,12 @@ class IdentityIslandsApp:
         node_color = []
         node_size = []
         node_text = []
+        node_customdata = []
 
-        for node in self.G.nodes(data=True):
+        for node_index, node in enumerate(self.G.nodes(data=True)):
             if highlight_nodes is None or node[0] in nodes_to_highlight:
                 x, y = self.pos[node[0]]
+                node_customdata.append([NODE, node_index])
                 node_x.append(x)
                 node_y.append(y)
                 degree = nx.degree(self.G, node[0])
@@ -131,6 +538,7 @@ class IdentityIslandsApp:
             x=node_x,
             y=node_y,
             text=node_text,
+            customdata=node_customdata,
             mode='markers',
             hoverinfo='text',
             marker=dict(
@@ -140,70 +548,114 @@ class IdentityIslandsApp:
                 size=node_size,
                 colorbar=dict(
                     thickness=15,
-                    title='Node Connections',
-                    xanchor='left',
-                    titleside='right'
+                    title=dict(text='Node Connections', side='right'),
+                    xanchor='left'
                 )
             )
         )
 
-        fig = go.Figure(data=edge_trace + hover_edge_trace + [node_trace],
-                        layout=go.Layout(
-                            title='Identity Islands',
-                            titlefont_size=16,
-                            showlegend=False,
-                            hovermode='closest',
-                            margin=dict(b=20, l=5, r=5, t=40),
-                            xaxis=dict(showgrid=False, zeroline=False),
-                            yaxis=dict(showgrid=False, zeroline=False)
-                        ))
+        fig = go.Figure(data=edge_trace + hover_edge_trace + [node_trace], layout=self.figure_layout())
 
         fig.update_layout(width=1800, height=1000)
         return fig
 
-    def setup_layout(self):
-        self.app.layout = html.Div([
-            dcc.Graph(id='network-graph', figure=self.create_figure(), style={'width': '100%', 'height': '90vh'}),
+    def loading_figure(self):
+        message = f"Failed to load {self.nquads_file}: {self.load_error}" if self.load_error else f"Loading {self.nquads_file}..."
+        fig = go.Figure(layout=go.Layout(
+            title='Identity Islands',
+            annotations=[dict(text=message, showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)],
+            xaxis=dict(visible=False),
+            yaxis=dict(visible=False)
+        ))
+        fig.update_layout(width=1800, height=1000)
+        return fig
+
+    def current_figure(self):
+        return self.base_figure if self.base_figure is not None else self.loading_figure()
+
+    def serve_layout(self):
+        # Evaluated per page load, so a browser opened after loading finishes gets the graph directly
+        return html.Div([
+            dcc.Graph(id='network-graph', figure=self.current_figure(), style={'width': '100%', 'height': '90vh'}),
             html.Button('Reset', id='reset-button', n_clicks=0, style={'position': 'absolute', 'top': '10px', 'right': '240px'}),
-            dcc.Store(id='last-clicked-node', data=None)
+            dcc.Input(id='search-box', type='text', debounce=True, placeholder='Search: name, date_of_birth:..., doc_number:...',
+                      style={'position': 'absolute', 'top': '10px', 'right': '320px', 'width': '360px'}),
+            html.Div(id='search-status', style={'position': 'absolute', 'top': '40px', 'right': '320px'}),
+            dcc.Store(id='last-clicked-node', data=None),
+            dcc.Interval(id='load-poll', interval=1000, disabled=self.loaded.is_set())
         ])
 
+    def setup_layout(self):
+        self.app.layout = self.serve_layout
+
     def setup_callbacks(self):
         @self.app.callback(
             [Output('network-graph', 'figure'),
-             Output('last-clicked-node', 'data')],
+             Output('last-clicked-node', 'data'),
+             Output('load-poll', 'disabled'),
+             Output('search-status', 'children')],
             [Input('network-graph', 'clickData'),
-             Input('reset-button', 'n_clicks')],
+             Input('reset-button', 'n_clicks'),
+             Input('load-poll', 'n_intervals'),
+             Input('network-graph', 'relayoutData'),
+             Input('search-box', 'value')],
             [State('last-clicked-node', 'data')]
         )
-        def update_figure(clickData, resetClicks, last_clicked_node):
+        def update_figure(clickData, resetClicks, n_intervals, relayoutData, search, last_clicked_node):
             ctx = dash.callback_context
+            # Server-side callback latency, per triggering input (e.g. callback.network-graph.clickData)
+            trigger = ctx.triggered[0]['prop_id'] if ctx.triggered else 'initial'
+            with self.instrumentation.stage(f'callback.{trigger}'):
+                if 'search-box' in trigger:
+                    figure, node, status = self.search_figure(search, last_clicked_node)
+                else:
+                    figure, node = self.handle_interaction(ctx, clickData, last_clicked_node, relayoutData)
+                    status = dash.no_update
+            return figure, node, self.loaded.is_set(), status
 
-            if not ctx.triggered:
-                return self.create_figure(), None
+    def setup_stats_endpoint(self):
+        def stats():
+            return flask.Response(self.instrumentation.to_json(), mimetype='application/json')
+        self.app.server.add_url_rule('/stats', 'stats', stats)
 
-            trigger = ctx.triggered[0]['prop_id']
+    def handle_interaction(self, ctx, clickData, last_clicked_node, relayoutData=None):
+        if not self.loaded.is_set() or self.base_figure is None:
+            return self.loading_figure(), None
 
-            if 'reset-button' in trigger:
-                return self.create_figure(), None
+        if not ctx.triggered:
+            return self.base_figure, None
 
-            if clickData is not None:
-                text = clickData['points'][0]['text']
-                if 'Type:' in text:
-                    edge_info = text.split('<br>')[0].split(': ')[1]
-                    for edge in self.G.edges(data=True):
-                        edge_type = f"Type: {edge[2].get('type', 'N/A')}"
-                        if edge_type == text:
-                            edge = (edge[0], edge[1])
-                            return self.create_figure(highlight_nodes=[edge[0], edge[1]]), last_clicked_node
-                else:
-                    node_id = text.split('<br>')[0].split(': ')[1]
-                    return self.create_figure(highlight_nodes=[node_id]), node_id
+        trigger = ctx.triggered[0]['prop_id']
+
+        if 'load-poll' in trigger:
+            return self.base_figure, None
+
+        if 'reset-button' in trigger:
+            if self.render_mode == 'webgl' and not self.lod_active:
+                return self.highlight_patch(), None
+            return self.base_figure, None
+
+        if 'relayoutData' in trigger:
+            return self.relayout_figure(relayoutData), last_clicked_node
+
+        if clickData is not None and clickData['points'][0].get('customdata') is not None:
+            kind, index = (int(value) for value in clickData['points'][0]['customdata'])
+            if kind == ISLAND:
+                return self.island_figure(index), last_clicked_node
+            if kind == EDGE:
+                node_indices = [self.edge_src[index], self.edge_dst[index]]
+                node_id = last_clicked_node
+            else:
+                node_indices = [index]
+                node_id = self.node_name(index)
+            if self.render_mode == 'webgl':
+                return self.highlight_patch(node_indices), node_id
+            return self.create_figure(highlight_nodes=[self.node_name(i) for i in node_indices]), node_id
 
-            return self.create_figure(), None
+        return self.base_figure, None
 
     def run(self):
-        self.app.run_server(debug=True)
+        self.app.run(debug=True)
 
     def display(self):
         return IFrame(src="http://127.0.0.1:8050", width='100%', height='1000px')
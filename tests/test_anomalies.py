@@ -0,0 +1,44 @@
+from generate_data import IdentityIslandGenerator
+
+
+def _mislinks(labels):
+    return [label for label in labels if label['anomaly_type'] == 'mislinked_identity']
+
+
+def test_single_island_gets_no_self_mislink():
+    generator = IdentityIslandGenerator()
+    generator.generate_identity_islands_batched(1, seed=3)
+    labels = generator.add_anomalies_batched(4000, seed=3)
+    assert len(labels) < 40 and not _mislinks(labels)
+    assert [label['anomaly_id'] for label in labels] == list(range(len(labels)))
+
+
+def test_mislinks_cross_islands():
+    generator = IdentityIslandGenerator()
+    generator.generate_identity_islands_batched(200, seed=4)
+    labels = _mislinks(generator.add_anomalies_batched(100, seed=4))
+    assert labels and all(label['related_island'] != label['island'] for label in labels)
+
+
+def test_unrelated_identity_is_in_another_island():
+    generator = IdentityIslandGenerator()
+    generator.generate_identity_islands_batched(5, seed=6)
+    for island_index in range(5):
+        for offset in range(1, 5):
+            other_index, identity_id = generator._unrelated_identity(island_index, offset, 0.99)
+            assert other_index != island_index and identity_id in generator.identity_islands[other_index]
+
+
+def test_legacy_mislinks_cross_islands(monkeypatch):
+    generator = IdentityIslandGenerator()
+    generator.generate_identity_islands_batched(50, seed=7)
+    index = generator.build_similarity_index()
+    # No similar identity anywhere, so every mislink takes the fallback
+    monkeypatch.setattr(index, 'most_similar', lambda *args, **kwargs: None)
+    edges, nodes = set(generator.G.edges), set(generator.G.nodes)
+    generator.add_anomalies(100)
+    island_of = {identity_id: i for i, island in enumerate(generator.identity_islands) for identity_id in island}
+    # New equivalence edges to existing identities are the mislinks; duplicates point at new nodes
+    mislinks = [(u, v) for u, v in set(generator.G.edges) - edges
+                if v in nodes and generator.G.edges[u, v]['type'] == 'IDENTITY_EQUIVALENCE']
+    assert mislinks and all(island_of[u] != island_of[v] for u, v in mislinks)
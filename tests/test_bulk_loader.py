@@ -0,0 +1,36 @@
+import networkx as nx
+import pytest
+from bulk_loader import BulkLoader
+from standin_endpoint import StandInEndpoint
+
+
+def _graph(name):
+    G = nx.DiGraph()
+    G.add_node('a', type='Identity', name=name)
+    G.add_node('b', type='Reference', doc_type='PASSPORT')
+    G.add_edge('a', 'b', type='CITED_BY')
+    return G
+
+
+def test_same_sized_graphs_do_not_share_a_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    with StandInEndpoint() as endpoint:
+        BulkLoader(endpoint.url, checkpoint_path=checkpoint).load(_graph('Maria Garcia'))
+        with pytest.raises(ValueError):
+            BulkLoader(endpoint.url, checkpoint_path=checkpoint).load(_graph('Mario Garcia'))
+        # The same graph resumes and skips everything already accepted
+        report = BulkLoader(endpoint.url, checkpoint_path=checkpoint).load(_graph('Maria Garcia'))
+    assert report['statements'] == 0 and report['skipped'] > 0
+
+
+def test_gremlin_edge_to_missing_vertex_fails(tmp_path):
+    export_dir = tmp_path / 'export'
+    export_dir.mkdir()
+    (export_dir / 'vertices-00000.csv').write_text('~id,~label,name\na,Identity,Maria Garcia\n')
+    (export_dir / 'edges-00000.csv').write_text('~id,~from,~to,~label\ne0,a,a,SELF\ne1,ghost,a,IDENTITY_EQUIVALENCE\ne2,a,a,LATER\n')
+    with StandInEndpoint(check_vertices=True) as endpoint:
+        loader = BulkLoader(endpoint.url, protocol='gremlin', concurrency=1, batch_size=10)
+        with pytest.raises(RuntimeError, match='missing vertex ghost'):
+            loader.load(str(export_dir))
+        # Rejected at once, not retried as a transient error
+        assert endpoint.failures == 1
@@ -0,0 +1,40 @@
+import networkx as nx
+from bulk_export import vertex_columns
+from nquads import BASE_URI, node_to_nquads
+from nquads_loader import NQuadsLoader
+
+
+def test_list_attribute_round_trips(tmp_path):
+    # The loader keeps literals as strings, so the list comes back element for element
+    attrs = {'type': 'Identity', 'aliases': ['Maria Garcia', 'Mia Garcia'], 'scores': [3, 7]}
+    path = tmp_path / 'node.nq'
+    path.write_text(''.join(node_to_nquads('a1', attrs)))
+    G = NQuadsLoader(workers=1).load(str(path))
+    assert G.nodes[f'{BASE_URI}a1'] == {'type': 'Identity', 'aliases': ['Maria Garcia', 'Mia Garcia'], 'scores': ['3', '7']}
+
+
+def test_column_widens_past_first_values():
+    G = nx.DiGraph()
+    for i in range(2000):
+        G.add_node(f'n{i}', type='Identity', age=i, tags=[i])
+    G.add_node('late', type='Identity', age='unknown', tags=[1, 'x'])
+    assert vertex_columns(G) == [('age', 'String'), ('tags', 'String')]
+    G.remove_node('late')
+    assert vertex_columns(G) == [('age', 'Int'), ('tags', 'Int')]
+
+
+def test_store_matches_graph_across_chunks(tmp_path):
+    # Small chunks split one node's triples and a repeated edge across workers' results
+    lines = [f'<{BASE_URI}a> <{BASE_URI}name> "Ana" .', f'<{BASE_URI}a> <{BASE_URI}CITED_BY> <{BASE_URI}r> .', 'not a triple']
+    lines += [f'<{BASE_URI}r> <{BASE_URI}doc_number> "D{i}" .' for i in range(40)]
+    lines += [f'<{BASE_URI}a> <{BASE_URI}name> "Anna" .', f'<{BASE_URI}a> <{BASE_URI}SAME_APPLICATION> <{BASE_URI}r> .']
+    path = tmp_path / 'chunks.nq'
+    path.write_text('\n'.join(lines) + '\n')
+    loader = NQuadsLoader(workers=1, chunk_size=256)
+    G, store = loader.load(str(path)), loader.load_store(str(path))
+    assert loader.parse_errors == 1
+    assert G.nodes[f'{BASE_URI}a'] == {'name': ['Ana', 'Anna']}
+    assert G.edges[f'{BASE_URI}a', f'{BASE_URI}r'] == {'type': 'SAME_APPLICATION'}
+    H = store.to_networkx()
+    assert list(H.nodes) == list(G.nodes) and list(H.edges(data=True)) == list(G.edges(data=True))
+    assert [H.nodes[node]['doc_number'] for node in H if node.endswith('r')] == [[f'D{i}' for i in range(40)]]
@@ -0,0 +1,20 @@
+import networkx as nx
+from generate_data import IdentityIslandGenerator
+from topology import IslandTopology
+
+
+def test_parallel_merge_matches_networkx_inserts():
+    topology = IslandTopology(mean_out_degree=6, shared_references=40, shared_reference_probability=0.3)
+    generator = IdentityIslandGenerator(topology=topology)
+    generator.generate_identity_islands_parallel(600, seed=5, workers=2, shard_size=200, batch_size=64)
+
+    expected, islands = nx.DiGraph(), []
+    for nodes, edges, batch_islands in IdentityIslandGenerator(topology=topology).iter_identity_islands(600, seed=5, shard_size=200, batch_size=64):
+        expected.add_nodes_from(nodes)
+        expected.add_edges_from((u, v, {'type': edge_type}) for u, v, edge_type in edges)
+        islands.extend(batch_islands)
+
+    assert list(generator.G.nodes(data=True)) == list(expected.nodes(data=True))
+    assert list(generator.G.edges(data=True)) == list(expected.edges(data=True))
+    assert list(generator.G.pred.items()) == list(expected.pred.items())
+    assert generator.identity_islands == islands
@@ -0,0 +1,29 @@
+from generate_data import IdentityIslandGenerator
+from graph_store import CompactGraphStore
+
+
+def test_graph_store_leaves_generator_state_alone():
+    generator = IdentityIslandGenerator()
+    store, islands = generator.generate_graph_store(30, seed=8)
+    assert len(islands) == 30 and store.num_nodes > 0
+    assert generator.identity_islands == [] and generator.G.number_of_nodes() == 0
+    # The generator's own graph still works end to end
+    generator.generate_identity_islands_batched(30, seed=8)
+    generator.add_anomalies_batched(20, seed=8)
+    assert len(generator.score_islands()) == 30
+
+
+def test_column_text_matches_node_attrs():
+    nodes = [
+        ('a', {'type': 'Identity', 'name': 'Zoë Ærø', 'age': 30, 'aliases': ['x', 'y']}),
+        ('b', {'type': 'Reference', 'doc_number': '123-45-6789'}),
+        ('c', {'type': 'Identity', 'name': '', 'age': 41}),
+    ]
+    store = CompactGraphStore.from_records(nodes, [('a', 'b', 'CITED_BY')])
+    rows = [2, 0, 1]
+    for name in store.columns:
+        text = store.column_text(name, rows, f'{name}=')
+        for k, row in enumerate(rows):
+            attrs = store.node_attrs(row)
+            assert text[k] == (f'{name}={attrs[name]}' if name in attrs else '')
+    assert list(store.column('name', rows)) == ['', 'Zoë Ærø', None]
@@ -0,0 +1,20 @@
+from generate_data import IdentityIslandGenerator
+from identity_pools import REFERENCE_DATE
+
+
+def _graph(reference_date=REFERENCE_DATE):
+    generator = IdentityIslandGenerator(reference_date=reference_date)
+    generator.generate_identity_islands_batched(50, seed=5)
+    return generator
+
+
+def test_seeded_graph_does_not_depend_on_today():
+    first, second = _graph(), _graph()
+    assert dict(first.G.nodes(data=True)) == dict(second.G.nodes(data=True))
+    assert str(first.pools.today.date()) == REFERENCE_DATE
+
+
+def test_reference_date_moves_ages():
+    generator = _graph('2034-01-01')
+    ages = [attrs['age'] for _, attrs in generator.G.nodes(data=True) if attrs.get('type') == 'Identity']
+    assert generator.pools.today.year == 2034 and min(ages) >= 1
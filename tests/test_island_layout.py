@@ -0,0 +1,31 @@
+import networkx as nx
+import numpy as np
+from generate_data import IdentityIslandGenerator
+from island_layout import IslandLayoutEngine
+from topology import IslandTopology
+
+
+def _no_spring_layout(*args, **kwargs):
+    raise AssertionError('large components must not fall back to the dense nx.spring_layout')
+
+
+def test_shared_reference_component_over_500_nodes(monkeypatch):
+    monkeypatch.setattr(nx, 'spring_layout', _no_spring_layout)
+    generator = IdentityIslandGenerator(topology=IslandTopology(shared_references=20, shared_reference_probability=0.1))
+    generator.generate_identity_islands_parallel(500, seed=0, workers=1)
+    largest = max(nx.weakly_connected_components(generator.G), key=len)
+    assert len(largest) > 500
+    pos = IslandLayoutEngine(workers=1).layout(generator.G)
+    assert set(pos) == set(generator.G)
+    placed = np.array([pos[node] for node in largest])
+    assert np.isfinite(placed).all()
+    assert len(np.unique(placed.round(6), axis=0)) == len(largest)
+
+
+def test_hubless_chain_is_split_into_runs():
+    G = nx.path_graph(2000)
+    pos = IslandLayoutEngine(workers=1).layout(G)
+    placed = np.array([pos[node] for node in G])
+    # Neighbours along the chain stay much closer than the component is wide
+    steps = np.sqrt((np.diff(placed, axis=0) ** 2).sum(axis=1))
+    assert np.median(steps) < 0.1 * np.ptp(placed, axis=0).max()
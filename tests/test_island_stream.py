@@ -0,0 +1,12 @@
+import pytest
+from generate_data import IdentityIslandGenerator
+
+
+def test_resume_refuses_another_reference_date(tmp_path):
+    output_dir = str(tmp_path / 'stream')
+    IdentityIslandGenerator().stream_identity_islands(output_dir, num_islands=20, seed=1, islands_per_chunk=10)
+    # The same call resumes cleanly; a different anchor date would append chunks drawn from other date tables
+    IdentityIslandGenerator().stream_identity_islands(output_dir, num_islands=20, seed=1, islands_per_chunk=10)
+    with pytest.raises(ValueError):
+        IdentityIslandGenerator(reference_date='2030-06-01').stream_identity_islands(
+            output_dir, num_islands=20, seed=1, islands_per_chunk=10)
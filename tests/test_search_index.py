@@ -0,0 +1,54 @@
+import networkx as nx
+from graph_store import CompactGraphStore
+from search_index import IdentitySearchIndex
+
+
+def _islands_with_mislink():
+    # Island 0: a1, a2 and a reference; island 1: b1 and an event. a2 is mislinked to b1 and cites b1's event
+    G = nx.DiGraph()
+    G.add_node('a1', type='Identity', name='Maria Garcia', date_of_birth='01/02/1980', nationality='ESP')
+    G.add_node('a2', type='Identity', name='Maria Garcia Lopez', date_of_birth='01/02/1980', nationality='ESP')
+    G.add_node('b1', type='Identity', name='Mario Garcia', date_of_birth='03/04/1975', nationality='ITA')
+    G.add_node('ref_a', type='Reference', doc_type='PASSPORT', doc_number='111-22-3333')
+    G.add_node('event_b', type='Event', event_type='BIOMETRIC_VERIFICATION', event_date='2020-01-01')
+    G.add_edge('a1', 'a2', type='IDENTITY_EQUIVALENCE')
+    G.add_edge('a1', 'ref_a', type='CITED_BY')
+    G.add_edge('a2', 'b1', type='IDENTITY_EQUIVALENCE')
+    G.add_edge('b1', 'event_b', type='IMMIGRATION_STATUS_LINKED')
+    return G, [['a1', 'a2'], ['b1']]
+
+
+def _island_of(index, node_id):
+    return index.island_of[index.position[node_id]]
+
+
+def test_mislinked_identity_keeps_its_island():
+    G, islands = _islands_with_mislink()
+    index = IdentitySearchIndex()
+    index.add_islands(G, islands)
+    assert _island_of(index, 'a2') == 0
+    assert _island_of(index, 'b1') == 1
+    assert _island_of(index, 'ref_a') == 0
+    assert _island_of(index, 'event_b') == 1
+    assert index.search_islands(nationality='ITA') == [1]
+
+
+def test_mislink_into_a_later_batch():
+    G, islands = _islands_with_mislink()
+    index = IdentitySearchIndex()
+    index.add_islands(G, islands[:1])
+    index.add_islands(G, islands[1:], first_island=1)
+    assert _island_of(index, 'a2') == 0
+    assert _island_of(index, 'b1') == 1
+
+
+def test_index_from_store_matches_graph():
+    G, _ = _islands_with_mislink()
+    G.add_node('untyped', name='Nobody')
+    from_graph = IdentitySearchIndex()
+    from_graph.add_graph(G)
+    from_store = IdentitySearchIndex()
+    from_store.add_store(CompactGraphStore.from_networkx(G))
+    assert from_store.ids == from_graph.ids
+    assert from_store.postings == from_graph.postings
+    assert from_store.search_text('garcia nationality:ESP') == ['a1', 'a2']
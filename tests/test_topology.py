@@ -0,0 +1,22 @@
+import numpy as np
+from topology import SHARD_STREAM, SHARED_POOL_STREAM, IslandTopology, seeded_rng
+
+
+def _state(rng):
+    return rng.bit_generator.state['state']['state']
+
+
+def test_shared_pool_stream_is_disjoint_from_shards():
+    # 24301 == 0x5EED, the shard that once shared the pool's entropy
+    for seed in (0, 1, 42, 2 ** 40):
+        shared = _state(IslandTopology().shared_rng(seed))
+        shards = {_state(seeded_rng(seed, SHARD_STREAM, shard_index)) for shard_index in range(25000)}
+        assert shared not in shards
+        assert len(shards) == 25000
+
+
+def test_streams_are_reproducible():
+    first = seeded_rng(7, SHARED_POOL_STREAM).random(4)
+    second = IslandTopology().shared_rng(7).random(4)
+    np.testing.assert_array_equal(first, second)
+    assert not np.array_equal(seeded_rng(7, SHARD_STREAM, 0).random(4), first)